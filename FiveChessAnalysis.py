@@ -0,0 +1,153 @@
+import os
+import sys
+import json
+import time
+import argparse
+import collections
+import multiprocessing
+from FiveChessArena import create_engine, parse_config
+from FiveChessRecords import iter_games, RECORD_FORMATS, BOARD_LINE_NUMS
+
+# ====批量分析配置==== #
+ANALYSIS_TIME_BUDGET = 0.5 # 默认每个局面的思考时间(秒)
+ANALYSIS_WINDOW_PER_WORKER = 4 # 每个进程最多排几个局面，结果按顺序写出，内存只和进程数有关，和对局数无关
+ANALYSIS_REPORT_INTERVAL = 200 # 每写出多少个局面报告一次进度
+ANALYSIS_TAIL_BLOCK = 4096 # 续跑时从输出文件末尾往前一次读多少字节找最后一行
+
+def iter_positions(games, resume_after=None):
+    """
+    逐局逐步生成待分析的局面：(对局编号, 步数, 线数, 之前的着法, 实战着法)，对局编号是对局在输入里的顺序\n
+    resume_after: (对局编号, 步数)，只生成它之后的局面
+    """
+    for game_id, (board_size, moves, _) in enumerate(games):
+        if resume_after is not None and game_id < resume_after[0]:
+            continue
+        for ply, move in enumerate(moves):
+            if resume_after is not None and (game_id, ply) <= resume_after:
+                continue
+            yield game_id, ply, board_size, moves[:ply], move
+
+def read_resume_point(output_file):
+    """
+    输出文件里最后一条完整记录的(对局编号, 步数)，没有时返回None\n
+    只从文件末尾往前读；被中断时写了一半的最后一行直接截掉
+    """
+    if not os.path.exists(output_file):
+        return None
+    with open(output_file, 'rb+') as f:
+        f.seek(0, os.SEEK_END)
+        size = pos = f.tell()
+        tail = b''
+        while pos > 0 and tail.count(b'\n') < 2:
+            step = min(ANALYSIS_TAIL_BLOCK, pos)
+            pos -= step
+            f.seek(pos)
+            tail = f.read(step) + tail
+        end = tail.rfind(b'\n')
+        if pos + end + 1 < size:
+            f.truncate(pos + end + 1)
+        if end < 0:
+            return None
+        last = json.loads(tail[tail.rfind(b'\n', 0, end) + 1:end])
+        return last['game'], last['ply']
+
+_analysis_config = None
+_analysis_engines = {} # 分析进程里每种线数一个引擎，进程存活期间复用，置换表保持热的
+
+def _init_analysis_worker(config):
+    global _analysis_config
+    _analysis_config = config
+
+def sync_engine(engine, moves):
+    """
+    把引擎摆成按moves走出的局面：只悔掉和moves不同的那部分着法再补走，相邻的任务多是同一局的下一步，差一两手
+    """
+    history = engine.move_history
+    common = 0
+    while common < min(len(history), len(moves)) and history[common][0] == moves[common]:
+        common += 1
+    while len(history) > common:
+        engine.unmake()
+    for move in moves[common:]:
+        engine.make(move)
+
+def analyze_position(task):
+    """
+    分析进程执行的任务：摆好局面(sync_engine)，搜索轮到的一方的最佳着法\n
+    返回一条注释：{'game', 'ply', 'move': 实战着法, 'best', 'match', 'score', 'depth', 'nodes', 'time'}
+    """
+    game_id, ply, board_size, moves, played = task
+    engine = _analysis_engines.get(board_size)
+    if engine is None:
+        engine = _analysis_engines[board_size] = create_engine(dict(_analysis_config, board_size=board_size))
+    sync_engine(engine, moves)
+    # 空棋盘直接下天元，不会搜索
+    engine.nodes, engine.search_depth_reached, engine.search_score = 0, -1, None
+    start_time = time.perf_counter()
+    best = engine.best_move()
+    return {
+        'game': game_id,
+        'ply': ply,
+        'move': list(played),
+        'best': list(best) if best is not None else None,
+        'match': best == played,
+        'score': engine.search_score,
+        'depth': engine.search_depth_reached,
+        'nodes': engine.nodes,
+        'time': round(time.perf_counter() - start_time, 4),
+    }
+
+def run_analysis(games, output_file, config, workers, report=sys.stderr):
+    """
+    流式分析：games惰性读入，局面分给进程池，最多同时排workers * ANALYSIS_WINDOW_PER_WORKER个，
+    注释按输入顺序逐行追加到output_file(JSONL)并立即flush\n
+    输出文件已有记录时从最后一条之后续跑；返回本次写出的局面数
+    """
+    resume_after = read_resume_point(output_file)
+    if resume_after is not None:
+        report.write('resuming after game {} ply {}\n'.format(*resume_after))
+    window = workers * ANALYSIS_WINDOW_PER_WORKER
+    pending = collections.deque()
+    written = 0
+    start_time = time.perf_counter()
+    with open(output_file, 'a') as output, multiprocessing.Pool(workers, initializer=_init_analysis_worker, initargs=(config,)) as pool:
+
+        def write_next():
+            nonlocal written
+            annotation = pending.popleft().get()
+            output.write(json.dumps(annotation) + '\n')
+            output.flush()
+            written += 1
+            if written % ANALYSIS_REPORT_INTERVAL == 0:
+                elapsed_time = time.perf_counter() - start_time
+                report.write('{} positions, game {}, {:.1f} positions/s\n'.format(written, annotation['game'], written / elapsed_time))
+
+        for task in iter_positions(games, resume_after):
+            pending.append(pool.apply_async(analyze_position, (task,)))
+            if len(pending) >= window:
+                write_next()
+        while pending:
+            write_next()
+    elapsed_time = time.perf_counter() - start_time
+    report.write('{} positions written in {:.1f}s\n'.format(written, elapsed_time))
+    return written
+
+# 程序入口
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量分析对局记录：逐局逐步搜索最佳着法，注释逐行写成JSONL，中断后重跑同样的命令即可续跑')
+    parser.add_argument('inputs', nargs='+', help='对局记录文件，psq格式可以给目录')
+    parser.add_argument('--format', choices=RECORD_FORMATS, default='fcr', help='对局记录格式')
+    parser.add_argument('--board-size', type=int, default=BOARD_LINE_NUMS, help='renlib格式的棋盘线数')
+    parser.add_argument('--output', required=True, help='注释JSONL文件，已存在时续跑')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='进程数')
+    parser.add_argument('--time-budget', type=float, default=ANALYSIS_TIME_BUDGET, help='每个局面的思考时间(秒)')
+    parser.add_argument('--depth', type=int, help='每个局面的最大搜索深度')
+    parser.add_argument('--config', type=parse_config, default={}, help='引擎配置，格式同FiveChessArena的--config-a')
+    args = parser.parse_args()
+
+    config = dict(args.config)
+    config.setdefault('time_budget', args.time_budget)
+    if args.depth is not None:
+        config['depth'] = args.depth
+    games = iter_games(args.inputs, args.format, args.board_size, lambda error: sys.stderr.write('skipped: {}\n'.format(error)))
+    run_analysis(games, args.output, config, args.workers)
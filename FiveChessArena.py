@@ -0,0 +1,195 @@
+import sys
+import json
+import math
+import time
+import random
+import argparse
+import multiprocessing
+from FiveChessEngine import (create_chess_engine, NEIGHBOR_RADIUS, QUIESCENCE_MAX_DEPTH, SEARCH_ALPHABETA, MCTS_POLICY_PUCT, EVALUATOR_PATTERNS, BOARD_LINE_NUMS,
+                             BOARD_MAP_WHITE_CHESS, BOARD_MAP_BLACK_CHESS, BOARD_MAP_NONE)
+
+# ====对战配置==== #
+ARENA_TIME_BUDGET = 0.1 # 默认每步思考时间(秒)
+ARENA_TT_SIZE_MB = 8 # 每个引擎的置换表大小，进程里同时有两个引擎
+OPENING_MOVES = 4 # 随机开局的步数
+OPENING_RADIUS = 3 # 随机开局落子离天元的最大距离
+ENGINE_OPTIONS = ('depth', 'time_budget', 'tt_size_mb', 'neighbor_radius', 'max_width', 'chess_scores', 'book_file', 'cache_file', 'threat_search', 'quiescence_depth',
+                  'pvs', 'aspiration_window', 'lmr', 'board_size', 'search', 'mcts_policy', 'mcts_playouts', 'evaluator')
+
+def create_engine(config):
+    """
+    根据配置创建引擎\n
+    config: {'depth', 'time_budget', 'tt_size_mb', 'neighbor_radius', 'max_width', 'chess_scores', 'book_file', 'cache_file', 'threat_search', 'quiescence_depth', 'pvs', 'aspiration_window', 'lmr', 'board_size',
+             'search', 'mcts_policy', 'mcts_playouts', 'evaluator'}，都可以省略\n
+    board_size: 棋盘线数，null表示不限大小的棋盘\n
+    search: "alphabeta"或"mcts"，mcts_policy: "puct"或"uct"，evaluator: "patterns"或"runs"
+    """
+    unknown = set(config) - set(ENGINE_OPTIONS)
+    if unknown:
+        raise ValueError("unknown engine options: {}".format(sorted(unknown)))
+    engine = create_chess_engine(config.get('board_size', BOARD_LINE_NUMS),
+                                 tt_size_mb=config.get('tt_size_mb', ARENA_TT_SIZE_MB),
+                                 neighbor_radius=config.get('neighbor_radius', NEIGHBOR_RADIUS),
+                                 max_width=config.get('max_width'),
+                                 chess_scores=config.get('chess_scores'),
+                                 book_file=config.get('book_file'),
+                                 cache_file=config.get('cache_file'),
+                                 threat_search=config.get('threat_search', True),
+                                 quiescence_depth=config.get('quiescence_depth', QUIESCENCE_MAX_DEPTH),
+                                 pvs=config.get('pvs', False),
+                                 aspiration_window=config.get('aspiration_window'),
+                                 lmr=config.get('lmr', False),
+                                 search=config.get('search', SEARCH_ALPHABETA),
+                                 mcts_policy=config.get('mcts_policy', MCTS_POLICY_PUCT),
+                                 mcts_playouts=config.get('mcts_playouts'),
+                                 evaluator=config.get('evaluator', EVALUATOR_PATTERNS))
+    if 'depth' in config:
+        engine.depth = config['depth']
+    engine.time_budget = config.get('time_budget', ARENA_TIME_BUDGET)
+    return engine
+
+def random_opening(rnd, opening_moves, board_size=BOARD_LINE_NUMS):
+    """
+    在天元附近随机摆opening_moves步，白棋先行，保证摆完没有连五
+    """
+    engine = create_chess_engine(board_size)
+    center_i, center_j = engine.center
+    moves = []
+    while len(moves) < opening_moves:
+        move = (center_i + rnd.randint(-OPENING_RADIUS, OPENING_RADIUS), center_j + rnd.randint(-OPENING_RADIUS, OPENING_RADIUS))
+        if engine.stone_at(move) != BOARD_MAP_NONE:
+            continue
+        engine.make(move)
+        if engine.winner is not None:
+            engine.unmake()
+            continue
+        moves.append(move)
+    return moves
+
+def play_game(task):
+    """
+    下一局，返回对局记录\n
+    task: (对局编号, 开局着法, A执白还是执黑, A的配置, B的配置)
+    """
+    game_id, opening, a_plays_white, config_a, config_b = task
+    engines = {'A': create_engine(config_a), 'B': create_engine(config_b)}
+    white_player, black_player = ('A', 'B') if a_plays_white else ('B', 'A')
+    for move in opening:
+        for engine in engines.values():
+            engine.make(move)
+    reference = engines['A']
+    moves, move_times, move_nodes = [], [], []
+    while not reference.is_terminal():
+        player = white_player if reference.turn == BOARD_MAP_WHITE_CHESS else black_player
+        engine = engines[player]
+        start_time = time.perf_counter()
+        move = engine.best_move()
+        move_times.append(round(time.perf_counter() - start_time, 4))
+        move_nodes.append(engine.nodes)
+        moves.append(list(move))
+        for engine in engines.values():
+            engine.make(move)
+    if reference.winner == BOARD_MAP_WHITE_CHESS:
+        result = white_player
+    elif reference.winner == BOARD_MAP_BLACK_CHESS:
+        result = black_player
+    else:
+        result = 'draw'
+    return {
+        'game': game_id,
+        'board_size': config_a.get('board_size', BOARD_LINE_NUMS),
+        'white': white_player,
+        'black': black_player,
+        'opening': [list(move) for move in opening],
+        'moves': moves,
+        'result': result,
+        'move_times': move_times,
+        'move_nodes': move_nodes,
+    }
+
+def elo_with_confidence(wins, draws, losses, z=1.96):
+    """
+    由A的胜/和/负估算A相对B的Elo差以及置信区间，返回(elo, low, high)
+    """
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0, -math.inf, math.inf
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = z * math.sqrt(variance / games)
+
+    def to_elo(p):
+        if p <= 0:
+            return -math.inf
+        if p >= 1:
+            return math.inf
+        return -400 * math.log10(1 / p - 1)
+    return to_elo(score), to_elo(score - margin), to_elo(score + margin)
+
+def generate_tasks(games, opening_moves, seed, config_a, config_b):
+    """
+    每个随机开局下两局，A先后执白执黑，抵消开局本身的优劣；两个配置的棋盘大小必须相同
+    """
+    board_size = config_a.get('board_size', BOARD_LINE_NUMS)
+    if config_b.get('board_size', BOARD_LINE_NUMS) != board_size:
+        raise ValueError("both engine configs must use the same board_size")
+    rnd = random.Random(seed)
+    opening = None
+    for game_id in range(games):
+        if game_id % 2 == 0:
+            opening = random_opening(rnd, opening_moves, board_size)
+        yield game_id, opening, game_id % 2 == 0, config_a, config_b
+
+def run_arena(games, config_a, config_b, workers, opening_moves=OPENING_MOVES, seed=0, output=None, report=sys.stderr):
+    """
+    用进程池并行下games局，每下完一局就把记录写成一行JSON，并输出当前的胜率和Elo\n
+    返回(wins, draws, losses)，都是A的视角
+    """
+    wins = draws = losses = 0
+    start_time = time.perf_counter()
+    tasks = generate_tasks(games, opening_moves, seed, config_a, config_b)
+    with multiprocessing.Pool(workers) as pool:
+        for record in pool.imap_unordered(play_game, tasks):
+            if record['result'] == 'A':
+                wins += 1
+            elif record['result'] == 'B':
+                losses += 1
+            else:
+                draws += 1
+            if output is not None:
+                output.write(json.dumps(record) + '\n')
+                output.flush()
+            finished = wins + draws + losses
+            elo, low, high = elo_with_confidence(wins, draws, losses)
+            elapsed_time = time.perf_counter() - start_time
+            report.write('[{}/{}] A +{} ={} -{}  score {:.3f}  elo {:+.1f} [{:+.1f}, {:+.1f}]  {:.0f} games/h\n'.format(
+                finished, games, wins, draws, losses, (wins + 0.5 * draws) / finished, elo, low, high, finished * 3600 / elapsed_time))
+    return wins, draws, losses
+
+def parse_config(text):
+    """
+    引擎配置：JSON字符串，或者@开头的JSON文件路径
+    """
+    if text.startswith('@'):
+        with open(text[1:]) as f:
+            return json.load(f)
+    return json.loads(text)
+
+# 程序入口
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='两个引擎配置之间的自对弈，结果逐局输出为JSONL')
+    parser.add_argument('--games', type=int, default=100, help='对局数')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='进程数')
+    parser.add_argument('--config-a', type=parse_config, default={}, help='引擎A的配置，JSON或@文件路径，如 {"time_budget": 0.1, "chess_scores": {"live_three": 1000}}')
+    parser.add_argument('--config-b', type=parse_config, default={}, help='引擎B的配置，格式同--config-a')
+    parser.add_argument('--opening-moves', type=int, default=OPENING_MOVES, help='随机开局步数')
+    parser.add_argument('--seed', type=int, default=0, help='随机开局的种子')
+    parser.add_argument('--output', default='-', help='对局记录JSONL文件，-表示标准输出')
+    args = parser.parse_args()
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'a')
+    try:
+        run_arena(args.games, args.config_a, args.config_b, args.workers, args.opening_moves, args.seed, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
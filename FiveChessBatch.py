@@ -0,0 +1,212 @@
+import sys
+import time
+import argparse
+import numpy as np
+from FiveChessEngine import (ChessEngine, LINE_CELLS, SUCCEED_CHESS_NUMS, BOARD_LINE_NUMS, EVALUATOR_PATTERNS, EVALUATOR_RUNS,
+                             BOARD_MAP_WHITE_CHESS, BOARD_MAP_BLACK_CHESS, BOARD_MAP_NONE, pattern_line_score)
+
+# ====批量评估配置==== #
+BATCH_CHUNK_SIZE = 128 # 每次向量化处理的棋盘数，中间数组留在缓存里
+# 每个位置编成2位：空位0，白棋1，墙2，黑棋3，正好是BOARD_MAP_* & 3
+BATCH_CELL_BITS = 2
+BATCH_WALL = 2 # 线外的位置：既不是空位也不是任何一方的棋子，对连续棋子算作阻拦
+BATCH_WINDOW_CELLS = 8 # 每次查表的窗口：覆盖起点k、k + 1两个位置的连续棋子需要的k - 1..k + 6
+BATCH_LINE_WIDTH = 1 + BOARD_LINE_NUMS + BATCH_WINDOW_CELLS - 2 # 展开后每条线的宽度：左边1格墙 + 线 + 右边墙
+_BATCH_CELL_STONES = {BOARD_MAP_BLACK_CHESS & 3: True, BOARD_MAP_WHITE_CHESS & 3: False} # 编码 -> 是否为黑棋
+
+def _build_line_indexes():
+    """
+    把所有长度不小于5的线展开成(BATCH_LINE_WIDTH, 线数)的下标表，下标指向拉平后末尾补了一格墙的棋盘\n
+    线数放在最后一维，按线求和时是连续内存；返回(下标表, 每条线的长度)，长度小于5的线在ChessEngine里不计分，这里直接去掉
+    """
+    wall = BOARD_LINE_NUMS * BOARD_LINE_NUMS
+    indexes, lengths = [], []
+    for direction in range(4):
+        for cells in LINE_CELLS[direction]:
+            if len(cells) < SUCCEED_CHESS_NUMS:
+                continue
+            row = [wall] * BATCH_LINE_WIDTH
+            for pos, (i, j) in enumerate(cells):
+                row[1 + pos] = i * BOARD_LINE_NUMS + j
+            indexes.append(row)
+            lengths.append(len(cells))
+    return np.array(indexes, dtype=np.intp).T.copy(), np.array(lengths, dtype=np.int64)
+
+BATCH_LINE_INDEXES, BATCH_LINE_LENGTHS = _build_line_indexes()
+BATCH_LINE_FULL_MASKS = (1 << BATCH_LINE_LENGTHS) - 1 # 每条线所有位置的位掩码
+BATCH_CELL_WEIGHTS = (1 << np.arange(BOARD_LINE_NUMS, dtype=np.int64))[:, None] # 线上第pos个位置 -> 位掩码里的1 << pos
+
+BATCH_BIT_POSITIONS = np.zeros(1 << BOARD_LINE_NUMS, dtype=np.int64) # 1 << pos -> pos
+BATCH_BIT_POSITIONS[1 << np.arange(BOARD_LINE_NUMS)] = np.arange(BOARD_LINE_NUMS)
+
+def board_array(board_map):
+    """
+    把board_map转成(15, 15)的int8数组，取值同BOARD_MAP_*
+    """
+    return np.array(board_map, dtype=np.int8)
+
+class BatchEvaluator():
+    """
+    向量化的批量局面评估，结果和同一组权重、同一种评估的ChessEngine增量维护的score完全一致\n
+    evaluator=EVALUATOR_PATTERNS(默认，和搜索用的评估相同)：按颜色把每条线在对方棋子处切成段，
+    段的分数只取决于段长和段内己方棋子，用引擎的棋型分数表(pattern_score_table.bin)预先算好每种段的分数，每个段起点查一次表\n
+    evaluator=EVALUATOR_RUNS：以连续同色棋子的起点计分，分数只取决于起点左边一格到右边5格这7个位置(连续数5以上按5，两端是否为空位)，
+    预先按7格编码算好checkup_score，相邻两个起点合成8格一次查表\n
+    斜线的分数都按线长等比缩减，和calculate_line_score相同
+    """
+    def __init__(self, chess_scores=None, chunk_size=BATCH_CHUNK_SIZE, evaluator=EVALUATOR_PATTERNS):
+        if evaluator not in (EVALUATOR_PATTERNS, EVALUATOR_RUNS):
+            raise ValueError("unknown evaluator: {}".format(evaluator))
+        # 用同一组权重、同一种评估的引擎建表，保证和搜索用的分数一致
+        engine = ChessEngine(tt_size_mb=1, chess_scores=chess_scores, threat_search=False, evaluator=evaluator)
+        self.chess_scores = chess_scores
+        self.evaluator = evaluator
+        self.chunk_size = chunk_size
+        if evaluator == EVALUATOR_PATTERNS:
+            self.segment_scores = self.build_segment_scores(engine)
+        else:
+            self.score_table = self.build_run_score_table(engine)
+
+    @staticmethod
+    def build_segment_scores(engine):
+        """
+        下标1 << 段长 | 段内己方棋子掩码，值为黑棋时这一段的分数；不到5格的段不计分\n
+        一段的分数就是线长为段长、没有对方棋子时pattern_line_score的分数
+        """
+        segment_scores = np.zeros(1 << (BOARD_LINE_NUMS + 1), dtype=np.int64)
+        for length in range(SUCCEED_CHESS_NUMS, BOARD_LINE_NUMS + 1):
+            for mask in range(1, 1 << length):
+                segment_scores[1 << length | mask] = pattern_line_score(engine.pattern_score_table, engine.checkup_score, mask, 0, length)
+        return segment_scores
+
+    @staticmethod
+    def build_run_score_table(engine):
+        """
+        下标为8格的编码，值为起点在第1、2格的两串连续棋子的分数之和
+        """
+        window = SUCCEED_CHESS_NUMS + 2
+        start_scores = np.zeros(1 << (BATCH_CELL_BITS * window), dtype=np.int32)
+        for code in range(len(start_scores)):
+            cells = [(code >> (BATCH_CELL_BITS * t)) & 3 for t in range(window)] # cells[0]是起点左边一格，cells[1]是起点
+            if cells[1] not in _BATCH_CELL_STONES or cells[0] == cells[1]:
+                continue
+            nums = 1
+            while nums < SUCCEED_CHESS_NUMS and cells[1 + nums] == cells[1]:
+                nums += 1
+            block_chess_nums = (cells[0] != BOARD_MAP_NONE) + (nums < SUCCEED_CHESS_NUMS and cells[1 + nums] != BOARD_MAP_NONE)
+            start_scores[code] = engine.checkup_score(_BATCH_CELL_STONES[cells[1]], nums, block_chess_nums)
+        codes = np.arange(1 << (BATCH_CELL_BITS * BATCH_WINDOW_CELLS))
+        return start_scores[codes & (len(start_scores) - 1)] + start_scores[codes >> BATCH_CELL_BITS]
+
+    def evaluate(self, boards):
+        """
+        boards: (N, 15, 15)的int8数组，取值同BOARD_MAP_*\n
+        返回(N,)的int64数组，黑棋为正
+        """
+        boards = np.asarray(boards, dtype=np.int8).reshape(-1, BOARD_LINE_NUMS * BOARD_LINE_NUMS)
+        scores = np.empty(len(boards), dtype=np.int64)
+        padded = np.full((min(self.chunk_size, len(boards)), BOARD_LINE_NUMS * BOARD_LINE_NUMS + 1), BATCH_WALL, dtype=np.uint16)
+        for start in range(0, len(boards), self.chunk_size):
+            chunk = boards[start:start + self.chunk_size]
+            np.bitwise_and(chunk, 3, out=padded[:len(chunk), :-1], casting='unsafe')
+            lines = padded[:len(chunk)][:, BATCH_LINE_INDEXES]
+            scores[start:start + len(chunk)] = self.evaluate_lines(lines) if self.evaluator == EVALUATOR_RUNS else self.evaluate_pattern_lines(lines)
+        return scores
+
+    def evaluate_pattern_lines(self, lines):
+        """
+        lines: (N, BATCH_LINE_WIDTH, 线数)的uint16编码线，返回每个棋盘的总分\n
+        先把每条线换成黑棋、白棋的位掩码，再分别算双方的段分数
+        """
+        cells = lines[:, 1:1 + BOARD_LINE_NUMS]
+        black = ((cells == BOARD_MAP_BLACK_CHESS & 3) * BATCH_CELL_WEIGHTS).sum(axis=1)
+        white = ((cells == BOARD_MAP_WHITE_CHESS & 3) * BATCH_CELL_WEIGHTS).sum(axis=1)
+        line_scores = self.side_scores(black, white) - self.side_scores(white, black)
+        # 斜线按线长等比缩减，每条线单独向下取整
+        line_scores *= BATCH_LINE_LENGTHS
+        line_scores //= BOARD_LINE_NUMS
+        return line_scores.sum(axis=-1)
+
+    def side_scores(self, x, y):
+        """
+        x, y: (N, 线数)的己方、对方棋子位掩码，返回己方每条线的段分数之和(按黑棋计，为正)\n
+        每轮所有线同时取出最低的一个段起点(不是对方棋子，左边是对方棋子或者线的一端)，段移到最低位后查表，
+        轮数是一条线上最多的段数\n
+        free加上起点位时从起点开始的一串1进位清零，free & ~(free + 起点位)就是这一段
+        """
+        free = BATCH_LINE_FULL_MASKS & ~y
+        segment_starts = free & ~(free << 1)
+        scores = np.zeros(x.shape, dtype=np.int64)
+        while True:
+            start_bits = segment_starts & -segment_starts
+            if not start_bits.any():
+                return scores
+            segment_starts ^= start_bits
+            segment = free & ~(free + start_bits)
+            pos = BATCH_BIT_POSITIONS[start_bits]
+            # 没有段的线start_bits为0，下标是1 << 0 | 0，分数为0
+            scores += self.segment_scores[((segment >> pos) + 1) | ((x & segment) >> pos)]
+
+    def evaluate_lines(self, lines):
+        """
+        evaluator=EVALUATOR_RUNS时：lines同evaluate_pattern_lines，返回每个棋盘的总分\n
+        逐级拼出从偶数位置开始的2格、4格、8格编码，每条线查(BATCH_LINE_WIDTH - 6) / 2次表
+        """
+        pairs = lines[:, 0::2] | (lines[:, 1::2] << BATCH_CELL_BITS)
+        quads = pairs[:, :-1] | (pairs[:, 1:] << (2 * BATCH_CELL_BITS))
+        windows = quads[:, :-2] | (quads[:, 2:] << (4 * BATCH_CELL_BITS))
+        line_scores = np.take(self.score_table, windows).sum(axis=1, dtype=np.int64)
+        # 斜线按线长等比缩减，每条线单独向下取整
+        line_scores *= BATCH_LINE_LENGTHS
+        line_scores //= BOARD_LINE_NUMS
+        return line_scores.sum(axis=-1)
+
+def random_boards(rnd, count, max_stones=BOARD_LINE_NUMS * BOARD_LINE_NUMS // 2):
+    """
+    随机棋盘：每个棋盘的棋子数在[0, max_stones]之间均匀选取，黑白各半，不保证是合法对局
+    """
+    boards = np.zeros((count, BOARD_LINE_NUMS * BOARD_LINE_NUMS), dtype=np.int8)
+    stones = rnd.integers(0, max_stones + 1, size=count)
+    order = rnd.random((count, BOARD_LINE_NUMS * BOARD_LINE_NUMS)).argsort(axis=1)
+    ranks = order.argsort(axis=1)
+    boards[ranks < stones[:, None]] = BOARD_MAP_BLACK_CHESS
+    boards[ranks < stones[:, None] // 2] = BOARD_MAP_WHITE_CHESS
+    return boards.reshape(count, BOARD_LINE_NUMS, BOARD_LINE_NUMS)
+
+def check_against_engine(evaluator, boards):
+    """
+    逐个棋盘和ChessEngine增量维护的score比较，返回不一致的棋盘下标列表\n
+    对照的引擎用批量评估的权重和评估方式，默认的BatchEvaluator()对照的就是默认的ChessEngine()
+    """
+    engine = ChessEngine(tt_size_mb=1, chess_scores=evaluator.chess_scores, evaluator=evaluator.evaluator)
+    batch_scores = evaluator.evaluate(boards)
+    mismatches = []
+    for index, board in enumerate(boards):
+        engine.load_position([((i, j), int(board[i, j])) for i, j in zip(*np.nonzero(board))])
+        if engine.get_current_score() != batch_scores[index]:
+            mismatches.append(index)
+    return mismatches
+
+# 程序入口
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='批量局面评估：和引擎的增量分数逐个核对，并测吞吐量')
+    parser.add_argument('--check', type=int, default=2000, help='随机生成多少个棋盘和ChessEngine的分数逐个核对，0表示不核对')
+    parser.add_argument('--bench', type=int, default=100000, help='测吞吐量用的棋盘数，0表示不测')
+    parser.add_argument('--seed', type=int, default=0, help='随机棋盘的种子')
+    parser.add_argument('--evaluator', choices=(EVALUATOR_PATTERNS, EVALUATOR_RUNS), default=EVALUATOR_PATTERNS, help='局面评估，默认和搜索用的相同')
+    args = parser.parse_args()
+
+    rnd = np.random.default_rng(args.seed)
+    evaluator = BatchEvaluator(evaluator=args.evaluator)
+    if args.check:
+        boards = random_boards(rnd, args.check)
+        mismatches = check_against_engine(evaluator, boards)
+        sys.stderr.write('{} boards checked, {} mismatches\n'.format(len(boards), len(mismatches)))
+        if mismatches:
+            sys.exit(1)
+    if args.bench:
+        boards = random_boards(rnd, args.bench)
+        start_time = time.perf_counter()
+        evaluator.evaluate(boards)
+        elapsed_time = time.perf_counter() - start_time
+        sys.stderr.write('{} boards in {:.3f}s, {:.0f} boards/s\n'.format(len(boards), elapsed_time, len(boards) / elapsed_time))
@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import math
+import time
+import platform
+import argparse
+import tracemalloc
+from FiveChessEngine import create_chess_engine, ASPIRATION_WINDOW, BOARD_MAP_WHITE_CHESS, BOARD_MAP_BLACK_CHESS
+
+# ====基准配置==== #
+BENCHMARK_BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json') # 默认的基准结果文件
+BENCHMARK_THRESHOLD = 0.25 # 耗时比基准慢超过该比例时判为退化
+BENCHMARK_REPEAT = 3 # 每项重复次数，取最快的一次，减少机器抖动的影响
+BENCHMARK_TT_SIZE_MB = 32
+BENCHMARK_MCTS_TARGET = 1000 # MCTS测试项每秒至少要模拟几次，达不到时和退化一样返回非0
+
+# 固定局面：[((i, j), chess)]，白棋先行，白棋子数多于黑棋时轮到黑棋
+BENCHMARK_POSITIONS = {
+    # 开局：天元附近两三手
+    'opening': [((7, 7), BOARD_MAP_WHITE_CHESS), ((7, 8), BOARD_MAP_BLACK_CHESS), ((8, 8), BOARD_MAP_WHITE_CHESS)],
+    # 中盘：双方各有几个子纠缠
+    'middlegame': [((7, 7), BOARD_MAP_WHITE_CHESS), ((7, 8), BOARD_MAP_BLACK_CHESS), ((8, 8), BOARD_MAP_WHITE_CHESS), ((6, 6), BOARD_MAP_BLACK_CHESS),
+                   ((8, 7), BOARD_MAP_WHITE_CHESS), ((9, 7), BOARD_MAP_BLACK_CHESS), ((8, 6), BOARD_MAP_WHITE_CHESS), ((8, 9), BOARD_MAP_BLACK_CHESS),
+                   ((6, 8), BOARD_MAP_WHITE_CHESS), ((8, 5), BOARD_MAP_BLACK_CHESS), ((9, 8), BOARD_MAP_WHITE_CHESS)],
+    # 战术：白棋有活三，黑棋必须挡，同时黑棋自己也有冲四的机会
+    'tactical': [((7, 7), BOARD_MAP_WHITE_CHESS), ((6, 6), BOARD_MAP_BLACK_CHESS), ((7, 8), BOARD_MAP_WHITE_CHESS), ((6, 7), BOARD_MAP_BLACK_CHESS),
+                 ((7, 9), BOARD_MAP_WHITE_CHESS), ((6, 8), BOARD_MAP_BLACK_CHESS), ((5, 5), BOARD_MAP_WHITE_CHESS)],
+}
+
+# 测试项：(名称, 局面, 搜索方式, 参数, 引擎选项)
+# get_best_move_depth: 不限时搜满depth层，另外记录搜到每一层所用的时间
+# get_best_move_time: 限时搜索，看给定时间内能搜到多深
+# minimax: 直接在当前局面上调用一次固定深度的minimax
+# mcts_playouts: search='mcts'的引擎固定模拟param次，节点数就是模拟次数，nps即每秒模拟次数
+# threat_solver: 只跑get_best_move搜索前的威胁空间搜索(双方的必胜、化解着法)，不限时，节点数是威胁搜索的节点数，param不用
+# 带引擎选项的测试项和同一局面、同一搜索方式、同一参数的无选项测试项比较节点数
+# board_size: 同一局面摆在19路棋盘、不限大小的棋盘(None)上，和15路比较每个节点的代价
+# evaluator: 只数连续棋子的评估，和默认的带空位棋型评估比较节点数和每个节点的代价
+# tactical局面上威胁搜索直接找到必胜，get_best_move不会进入迭代加深，所以这一项关掉威胁搜索；威胁搜索在middlegame局面上单独计时(白棋有必胜，要找黑棋的化解着法)
+BENCHMARK_CASES = [
+    ('opening/depth4', 'opening', 'get_best_move_depth', 4, {}),
+    ('middlegame/depth4', 'middlegame', 'get_best_move_depth', 4, {}),
+    ('tactical/depth4', 'tactical', 'get_best_move_depth', 4, {'threat_search': False}),
+    ('middlegame/threats', 'middlegame', 'threat_solver', None, {}),
+    ('middlegame/time1.0', 'middlegame', 'get_best_move_time', 1.0, {}),
+    ('middlegame/minimax4', 'middlegame', 'minimax', 4, {}),
+    ('tactical/minimax4', 'tactical', 'minimax', 4, {}),
+    ('opening/depth5', 'opening', 'get_best_move_depth', 5, {}),
+    ('opening/depth5/pvs', 'opening', 'get_best_move_depth', 5, {'pvs': True}),
+    ('opening/depth5/aspiration', 'opening', 'get_best_move_depth', 5, {'aspiration_window': ASPIRATION_WINDOW}),
+    ('opening/depth5/lmr', 'opening', 'get_best_move_depth', 5, {'lmr': True}),
+    ('opening/depth5/all', 'opening', 'get_best_move_depth', 5, {'pvs': True, 'aspiration_window': ASPIRATION_WINDOW, 'lmr': True}),
+    ('middlegame/depth5', 'middlegame', 'get_best_move_depth', 5, {}),
+    ('middlegame/depth5/pvs', 'middlegame', 'get_best_move_depth', 5, {'pvs': True}),
+    ('middlegame/depth5/aspiration', 'middlegame', 'get_best_move_depth', 5, {'aspiration_window': ASPIRATION_WINDOW}),
+    ('middlegame/depth5/lmr', 'middlegame', 'get_best_move_depth', 5, {'lmr': True}),
+    ('middlegame/depth5/all', 'middlegame', 'get_best_move_depth', 5, {'pvs': True, 'aspiration_window': ASPIRATION_WINDOW, 'lmr': True}),
+    ('middlegame/depth4/board19', 'middlegame', 'get_best_move_depth', 4, {'board_size': 19}),
+    ('middlegame/depth4/sparse', 'middlegame', 'get_best_move_depth', 4, {'board_size': None}),
+    ('middlegame/depth4/runs', 'middlegame', 'get_best_move_depth', 4, {'evaluator': 'runs'}),
+    ('middlegame/minimax4/runs', 'middlegame', 'minimax', 4, {'evaluator': 'runs'}),
+    ('opening/mcts1000', 'opening', 'mcts_playouts', 1000, {'search': 'mcts'}),
+    ('middlegame/mcts1000', 'middlegame', 'mcts_playouts', 1000, {'search': 'mcts'}),
+    ('middlegame/mcts1000/uct', 'middlegame', 'mcts_playouts', 1000, {'search': 'mcts', 'mcts_policy': 'uct'}),
+]
+
+def create_position(name, tt_size_mb=BENCHMARK_TT_SIZE_MB, options=None):
+    """
+    新建引擎并摆好局面，每项测试都用新引擎，置换表和排序表都是空的，结果可以复现\n
+    options: 传给create_chess_engine的其他参数
+    """
+    stones = BENCHMARK_POSITIONS[name]
+    engine = create_chess_engine(tt_size_mb=tt_size_mb, **(options or {}))
+    for index, chess in stones:
+        engine.turn = chess
+        engine.make(index)
+    return engine
+
+def run_search(engine, method, param):
+    """
+    跑一次搜索，返回选出的着法，minimax返回None
+    """
+    chess = engine.turn
+    if method == 'get_best_move_depth':
+        return engine.get_best_move(None, param, chess)
+    if method == 'get_best_move_time':
+        return engine.get_best_move(param, engine.depth, chess)
+    if method == 'minimax':
+        engine.nodes = 0
+        engine.transposition_table.new_search()
+        engine.new_search_ordering()
+        last_move = engine.move_history[-1][0]
+        engine.minimax(param, -math.inf, math.inf, chess == BOARD_MAP_BLACK_CHESS, last_move)
+        return None
+    if method == 'threat_solver':
+        solver = engine.threat_solver
+        solver.deadline = None
+        move = solver.find_win(chess)
+        if move is None and solver.find_win(-chess) is not None:
+            defenses = solver.find_defenses(chess)
+            move = defenses[0] if defenses else None
+        engine.nodes = solver.total_nodes
+        return move
+    if method == 'mcts_playouts':
+        engine.mcts_playouts = param
+        return engine.get_best_move(None, None, chess)
+    raise ValueError("unknown benchmark method: {}".format(method))
+
+def run_case(case, repeat=BENCHMARK_REPEAT, tt_size_mb=BENCHMARK_TT_SIZE_MB, with_stats=False):
+    """
+    跑一项测试，返回结果字典：耗时取repeat次里最快的一次，内存峰值单独用tracemalloc再跑一次\n
+    计时前先不计时地跑一次：棋型表、线分数缓存、线威胁缓存这些进程级的缓存只在第一次跑时是冷的，
+    先跑一次后每项都在热缓存上计时，结果不取决于哪一项先跑(--filter只跑一项时也一样)\n
+    with_stats: 再打开搜索统计跑一次，结果放在'stats'里，统计本身有开销，不影响计时
+    """
+    name, position, method, param, options = case
+    run_search(create_position(position, tt_size_mb, options), method, param)
+    best_time = None
+    for _ in range(repeat):
+        engine = create_position(position, tt_size_mb, options)
+        start_time = time.perf_counter()
+        move = run_search(engine, method, param)
+        elapsed_time = time.perf_counter() - start_time
+        if best_time is None or elapsed_time < best_time:
+            best_time = elapsed_time
+        nodes = engine.nodes
+        depth_reached = engine.search_depth_reached if method != 'minimax' else param
+        score = engine.search_score if method != 'minimax' else None
+    # 每层完成时间：迭代加深中途不返回，对每个深度单独从空置换表开始计时
+    time_to_depth = None
+    if method == 'get_best_move_depth':
+        time_to_depth = {}
+        for depth in range(param + 1):
+            engine = create_position(position, tt_size_mb, options)
+            start_time = time.perf_counter()
+            engine.get_best_move(None, depth, engine.turn)
+            time_to_depth[str(depth)] = round(time.perf_counter() - start_time, 4)
+    # tracemalloc会让代码慢好几倍，不和计时放在一起；置换表在第一次存储时分配，计入峰值
+    engine = create_position(position, tt_size_mb, options)
+    tracemalloc.start()
+    run_search(engine, method, param)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = None
+    if with_stats:
+        engine = create_position(position, tt_size_mb, options)
+        engine.enable_stats()
+        run_search(engine, method, param)
+        stats = engine.search_stats.to_dict()
+    return {
+        'name': name,
+        'position': position,
+        'method': method,
+        'param': param,
+        'options': options,
+        'time': round(best_time, 4),
+        'nodes': nodes,
+        'nps': round(nodes / best_time) if best_time > 0 else 0,
+        'depth_reached': depth_reached,
+        'score': score,
+        'time_to_depth': time_to_depth,
+        'move': list(move) if move is not None else None,
+        'peak_memory_kb': round(peak_memory / 1024),
+        'stats': stats,
+    }
+
+def run_benchmark(cases=BENCHMARK_CASES, repeat=BENCHMARK_REPEAT, tt_size_mb=BENCHMARK_TT_SIZE_MB, with_stats=False, report=sys.stderr):
+    """
+    跑所有测试项，返回可以直接写成JSON的结果
+    """
+    results = []
+    for case in cases:
+        result = run_case(case, repeat, tt_size_mb, with_stats)
+        results.append(result)
+        report.write('{:<30} {:>8.3f}s {:>9} nodes {:>8} nps  depth {:>2}  move {}  peak {} KB\n'.format(
+            result['name'], result['time'], result['nodes'], result['nps'], result['depth_reached'], result['move'], result['peak_memory_kb']))
+        if result['stats'] is not None:
+            stats = result['stats']
+            report.write('{:<30} cutoff {:.1%} first-move {:.1%}  bf {} ebf {}  tt hit {:.1%}  movegen {}s score {}s win {}s\n'.format(
+                '', stats['cutoff_rate'], stats['first_move_cutoff_ratio'], stats['branching_factor'], stats['effective_branching_factor'],
+                stats['tt_hit_rate'], stats['time_move_generation'], stats['time_update_score'], stats['time_check_win']))
+    report_option_savings(results, report)
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'repeat': repeat,
+        'results': results,
+    }
+
+def report_option_savings(results, report=sys.stderr):
+    """
+    带引擎选项的测试项和对应的无选项测试项比较节点数和耗时，如PVS、渴望窗口、LMR各自省下多少节点
+    """
+    references = {(result['position'], result['method'], result['param']): result for result in results if not result['options']}
+    for result in results:
+        reference = references.get((result['position'], result['method'], result['param']))
+        if not result['options'] or reference is None or reference['nodes'] == 0 or reference['time'] == 0:
+            continue
+        report.write('{:<30} nodes x{:.2f} time x{:.2f} vs {}  move {} score {} -> move {} score {}\n'.format(
+            result['name'], result['nodes'] / reference['nodes'], result['time'] / reference['time'], reference['name'],
+            reference['move'], reference['score'], result['move'], result['score']))
+
+def check_mcts_target(current, target=BENCHMARK_MCTS_TARGET, report=sys.stderr):
+    """
+    MCTS测试项的每秒模拟次数和目标比较，返回没达到目标的测试项名称列表
+    """
+    missed = []
+    for result in current['results']:
+        if result['method'] != 'mcts_playouts':
+            continue
+        status = 'ok' if result['nps'] >= target else 'BELOW'
+        if status != 'ok':
+            missed.append(result['name'])
+        report.write('{:<30} {:>6} playouts/s  target {}  {}\n'.format(result['name'], result['nps'], target, status))
+    return missed
+
+def compare_with_baseline(current, baseline, threshold=BENCHMARK_THRESHOLD, report=sys.stderr):
+    """
+    和基准结果比较，返回退化的测试项名称列表\n
+    固定深度的测试看耗时，限时测试看每秒节点数；节点数或着法变化只提示不算失败，搜索改动本来就可能改变它们
+    """
+    baseline_results = {result['name']: result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        base = baseline_results.get(result['name'])
+        if base is None:
+            report.write('{:<30} no baseline\n'.format(result['name']))
+            continue
+        if result['method'] == 'get_best_move_time':
+            ratio = base['nps'] / result['nps'] if result['nps'] > 0 else math.inf
+        else:
+            ratio = result['time'] / base['time'] if base['time'] > 0 else 1.0
+        status = 'SLOWER' if ratio > 1 + threshold else 'ok'
+        if status != 'ok':
+            regressions.append(result['name'])
+        notes = []
+        if result['nodes'] != base['nodes'] and result['method'] != 'get_best_move_time':
+            notes.append('nodes {} -> {}'.format(base['nodes'], result['nodes']))
+        if result['move'] != base['move'] and result['method'] != 'get_best_move_time':
+            notes.append('move {} -> {}'.format(base['move'], result['move']))
+        report.write('{:<30} x{:.2f} {:<6} {}\n'.format(result['name'], ratio, status, ', '.join(notes)))
+    return regressions
+
+def save_baseline(current, baseline_file):
+    """
+    把本次结果写进基准文件：已有基准时只替换本次跑过的测试项(按名称)，其余测试项保留原来的基准，
+    --filter只跑了几项时不会丢掉别的基准；测试项按BENCHMARK_CASES的顺序排，不在其中的旧测试项放在最后
+    """
+    try:
+        with open(baseline_file) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        baseline = {'results': []}
+    results = {result['name']: result for result in baseline['results']}
+    results.update((result['name'], result) for result in current['results'])
+    order = {case[0]: rank for rank, case in enumerate(BENCHMARK_CASES)}
+    merged = dict(current, results=sorted(results.values(), key=lambda result: order.get(result['name'], len(order))))
+    with open(baseline_file, 'w') as f:
+        json.dump(merged, f, indent=2)
+
+# 程序入口
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='固定局面的搜索基准测试，和基准结果比较，退化超过阈值时返回非0')
+    parser.add_argument('--baseline', default=BENCHMARK_BASELINE_FILE, help='基准结果JSON文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写成新的基准')
+    parser.add_argument('--output', help='本次结果写入的JSON文件')
+    parser.add_argument('--threshold', type=float, default=BENCHMARK_THRESHOLD, help='允许的变慢比例，如0.25表示慢25%%以内不算退化')
+    parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT, help='每项重复次数，取最快的一次')
+    parser.add_argument('--stats', action='store_true', help='额外打开搜索统计跑一次，输出截断率、分支因子、各部分耗时等')
+    parser.add_argument('--filter', default='', help='只跑名称包含该字符串的测试项')
+    parser.add_argument('--mcts-target', type=int, default=BENCHMARK_MCTS_TARGET, help='MCTS测试项每秒至少模拟几次')
+    args = parser.parse_args()
+
+    cases = [case for case in BENCHMARK_CASES if args.filter in case[0]]
+    current = run_benchmark(cases, args.repeat, with_stats=args.stats)
+    missed = check_mcts_target(current, args.mcts_target)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+    if args.save_baseline:
+        save_baseline(current, args.baseline)
+        sys.exit(0)
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    except FileNotFoundError:
+        # 基准文件名写错时不能当作通过
+        sys.stderr.write('no baseline file {}, run with --save-baseline first\n'.format(args.baseline))
+        sys.exit(1)
+    regressions = compare_with_baseline(current, baseline, args.threshold)
+    if regressions:
+        sys.stderr.write('{} case(s) slower than baseline by more than {:.0%}: {}\n'.format(len(regressions), args.threshold, ', '.join(regressions)))
+        sys.exit(1)
+    if missed:
+        sys.stderr.write('{} MCTS case(s) below {} playouts/s: {}\n'.format(len(missed), args.mcts_target, ', '.join(missed)))
+        sys.exit(1)
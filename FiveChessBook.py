@@ -0,0 +1,150 @@
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from FiveChessEngine import (ChessEngine, BitBoard, OpeningBook, canonical_position, write_opening_book, OPENING_BOOK_FILE,
+                             SYMMETRY_INDEXES, BOARD_LINE_NUMS, BOARD_MAP_WHITE_CHESS, BOARD_MAP_BLACK_CHESS)
+
+# ====建库配置==== #
+BOOK_MAX_STONES = 6 # 收录的局面最多有几个子
+BOOK_MIN_GAMES = 2 # 从对局记录建库时，着法至少出现几局才收录
+BOOK_SEARCH_DEPTH = 6 # 搜索建库时每个局面的搜索深度
+BOOK_BRANCH = 2 # 搜索建库时除了最佳着法，每个局面再展开几个排序靠前的着法
+BOOK_TT_SIZE_MB = 8
+
+def position_bitboard(stones):
+    bitboard = BitBoard()
+    for index, stone in stones:
+        bitboard.place(index, 0 if stone == BOARD_MAP_BLACK_CHESS else 1)
+    return bitboard
+
+def position_key(stones, chess, max_stones=BOARD_LINE_NUMS * BOARD_LINE_NUMS):
+    """
+    stones局面下轮到chess时的标准key和对称变换，超过max_stones个子时返回None
+    """
+    return canonical_position(position_bitboard(stones), chess, max_stones)
+
+def canonical_move_code(move, symmetry):
+    i, j = SYMMETRY_INDEXES[symmetry][move[0]][move[1]]
+    return i * BOARD_LINE_NUMS + j
+
+def read_game_records(record_file):
+    """
+    读FiveChessArena输出的JSONL对局记录，逐局返回(着法列表, 胜方颜色)，和棋的胜方为None\n
+    开局库只有15路的，其他大小棋盘的对局跳过
+    """
+    with open(record_file) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record.get('board_size', BOARD_LINE_NUMS) != BOARD_LINE_NUMS:
+                continue
+            moves = [tuple(move) for move in record['opening'] + record['moves']]
+            if record['result'] == record['white']:
+                winner = BOARD_MAP_WHITE_CHESS
+            elif record['result'] == record['black']:
+                winner = BOARD_MAP_BLACK_CHESS
+            else:
+                winner = None
+            yield moves, winner
+
+def build_from_records(record_files, max_stones=BOOK_MAX_STONES, min_games=BOOK_MIN_GAMES):
+    """
+    从对局记录建库：每个局面取得分率最高的着法(胜1分、和0.5分)，得分率相同时取下得多的\n
+    返回{key: (move_code, 对局数)}
+    """
+    # move_stats[key][move_code] = [对局数, 得分]
+    move_stats = {}
+    for record_file in record_files:
+        for moves, winner in read_game_records(record_file):
+            stones = []
+            chess = BOARD_MAP_WHITE_CHESS
+            for move in moves:
+                position = position_key(stones, chess, max_stones)
+                if position is None:
+                    break
+                key, symmetry = position
+                stats = move_stats.setdefault(key, {}).setdefault(canonical_move_code(move, symmetry), [0, 0.0])
+                stats[0] += 1
+                stats[1] += 1.0 if winner == chess else 0.5 if winner is None else 0.0
+                stones.append((move, chess))
+                chess = -chess
+    entries = {}
+    for key, moves in move_stats.items():
+        candidates = [(score / games, games, move_code) for move_code, (games, score) in moves.items() if games >= min_games]
+        if candidates:
+            _, games, move_code = max(candidates)
+            entries[key] = (move_code, games)
+    return entries
+
+def search_book_position(task):
+    """
+    建库进程执行的任务：搜索stones局面下chess一方的最佳着法\n
+    返回(stones, chess, 最佳着法, 排序靠前的其他着法)
+    """
+    stones, chess, depth, branch = task
+    engine = ChessEngine(tt_size_mb=BOOK_TT_SIZE_MB)
+    engine.load_position(stones)
+    engine.turn = chess
+    best_move = engine.get_best_move(None, depth, chess)
+    alternatives = [move for move in engine.order_moves(engine.get_available_moves(), chess, depth + 1, 0, None) if move != best_move]
+    return stones, chess, best_move, alternatives[:branch]
+
+def build_from_search(depth=BOOK_SEARCH_DEPTH, max_stones=BOOK_MAX_STONES, branch=BOOK_BRANCH, workers=1, report=sys.stderr):
+    """
+    从天元开局按层展开搜索建库：每个局面收录深度depth的最佳着法，并展开最佳着法和branch个备选着法\n
+    同一层里对称的局面只搜索一次，返回{key: (move_code, 搜索深度)}
+    """
+    center = BOARD_LINE_NUMS // 2
+    frontier = [[((center, center), BOARD_MAP_WHITE_CHESS)]]
+    chess = BOARD_MAP_BLACK_CHESS
+    entries = {}
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(workers) as pool:
+        while frontier and len(frontier[0]) <= max_stones:
+            tasks = [(stones, chess, depth, branch) for stones in frontier]
+            next_frontier = {}
+            for stones, _, best_move, alternatives in pool.imap_unordered(search_book_position, tasks):
+                if best_move is None:
+                    continue
+                key, symmetry = position_key(stones, chess)
+                entries[key] = (canonical_move_code(best_move, symmetry), depth)
+                for move in [best_move] + alternatives:
+                    child = stones + [(move, chess)]
+                    bitboard = position_bitboard(child)
+                    if bitboard.check_win(move, 0 if chess == BOARD_MAP_BLACK_CHESS else 1):
+                        continue # 已经分出胜负，不用再展开
+                    child_key, _ = canonical_position(bitboard, -chess)
+                    next_frontier.setdefault(child_key, child)
+            report.write('{} stones: {} positions searched, {} entries, {:.1f}s\n'.format(
+                len(frontier[0]), len(frontier), len(entries), time.perf_counter() - start_time))
+            frontier = list(next_frontier.values())
+            chess = -chess
+    return entries
+
+# 程序入口
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='建开局库：从对局记录统计，或者从天元开局展开深度搜索')
+    subparsers = parser.add_subparsers(dest='source', required=True)
+    records_parser = subparsers.add_parser('records', help='从FiveChessArena输出的JSONL对局记录建库')
+    records_parser.add_argument('record_files', nargs='+', help='对局记录文件')
+    records_parser.add_argument('--min-games', type=int, default=BOOK_MIN_GAMES, help='着法至少出现几局才收录')
+    search_parser = subparsers.add_parser('search', help='从天元开局展开深度搜索建库')
+    search_parser.add_argument('--depth', type=int, default=BOOK_SEARCH_DEPTH, help='每个局面的搜索深度')
+    search_parser.add_argument('--branch', type=int, default=BOOK_BRANCH, help='每个局面除最佳着法外再展开几个着法')
+    search_parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='进程数')
+    for subparser in (records_parser, search_parser):
+        subparser.add_argument('--max-stones', type=int, default=BOOK_MAX_STONES, help='收录的局面最多有几个子')
+        subparser.add_argument('--output', default=OPENING_BOOK_FILE, help='开局库文件')
+    args = parser.parse_args()
+
+    if args.source == 'records':
+        entries = build_from_records(args.record_files, args.max_stones, args.min_games)
+    else:
+        entries = build_from_search(args.depth, args.max_stones, args.branch, args.workers)
+    write_opening_book(entries, args.max_stones, args.output)
+    book = OpeningBook(args.output)
+    sys.stderr.write('{} entries written to {}\n'.format(book.count, args.output))
+    book.close()
@@ -0,0 +1,3236 @@
+import math
+import time
+import os
+import sys
+import argparse
+import random
+import queue
+import mmap
+import struct
+import sqlite3
+import hashlib
+import multiprocessing
+from array import array
+
+# ====棋盘配置参数==== #
+BOARD_LINE_NUMS = 15 # 棋盘的线条数，棋盘是正方形
+# 白棋：1，黑棋：-1，空白处0
+BOARD_MAP_WHITE_CHESS = 1
+BOARD_MAP_BLACK_CHESS = -1
+BOARD_MAP_NONE = 0
+# 5子获胜
+SUCCEED_CHESS_NUMS = 5
+
+# ====棋型分数==== #
+# checkup_score使用的权重，ChessEngine(chess_scores=...)可以单独覆盖其中几项，用于调参
+CHESS_SCORES = {
+    'five': 10000, # 5子 或以上
+    'live_four': 4000, # 活4
+    'rush_four': 2000, # 单4
+    'live_three': 800, # 活3
+    'sleep_three': 200, # 单3
+    'live_two': 80, # 活2
+    'sleep_two': 8, # 单2
+    'live_one': 8, # 活1
+    'sleep_one': 2, # 单1
+}
+# 局面评估：EVALUATOR_PATTERNS按带空位的棋型计分(X_XX、XX_XX也算三、四)，EVALUATOR_RUNS只数连续的同色棋子，FiveChessBatch两种都支持
+EVALUATOR_PATTERNS = 'patterns'
+EVALUATOR_RUNS = 'runs'
+
+# ====搜索配置参数==== #
+TT_SIZE_MB = 32 # 置换表内存上限(MB)
+TT_ENTRY_BYTES = 22 # 置换表单条记录占用字节数：key 8 + score 8 + move 4 + depth 1 + flag 1
+# 置换表记录的分数类型：精确值、下界(beta截断)、上界(没有超过alpha)
+TT_FLAG_EXACT = 0
+TT_FLAG_LOWER = 1
+TT_FLAG_UPPER = 2
+# zobrist哈希随机数，固定种子，保证不同进程、不同局之间同一局面的哈希一致
+ZOBRIST_SEED = 20240511
+_zobrist_random = random.Random(ZOBRIST_SEED)
+# ZOBRIST_TABLE[i][j][0]：黑棋，ZOBRIST_TABLE[i][j][1]：白棋
+ZOBRIST_TABLE = [[(_zobrist_random.getrandbits(64), _zobrist_random.getrandbits(64)) for _ in range(BOARD_LINE_NUMS)] for _ in range(BOARD_LINE_NUMS)]
+ZOBRIST_BLACK_TURN = _zobrist_random.getrandbits(64) # 轮到黑棋走时异或到局面哈希上
+NEIGHBOR_RADIUS = 1 # 候选着法范围：已有棋子周围几格内的空位，可选1或2
+MAX_PLY = 64 # killer表支持的最大搜索层数
+ORDER_STATIC_MIN_DEPTH = 2 # 剩余深度不小于该值时才用静态增益排序，叶子上一层排序的代价和直接搜索相当
+MAX_SEARCH_DEPTH = 10 # 迭代加深的最大深度
+SEARCH_TIME_BUDGET = 2.0 # 电脑每步思考时间(秒)
+DEADLINE_CHECK_INTERVAL = 1024 # 每搜索多少个节点检查一次是否超时，必须是2的幂
+PARALLEL_MIN_DEPTH = 2 # 并行搜索时，深度小于该值的轮次仍在主进程串行搜索，省去进程间通信
+# 威胁空间搜索：只走冲四/活三的必胜搜索
+VCF_MAX_DEPTH = 12 # 连续冲四最多几步
+VCT_MAX_DEPTH = 4 # 冲四活三最多几步，每一步对方的所有防守都要试
+THREAT_MAX_NODES = 3000 # 不限时搜索时单次威胁搜索的节点上限，超过后放弃，按没找到处理
+THREAT_TIME_SHARE = 0.25 # 限时搜索时威胁搜索(双方的必胜和化解着法合计)最多用思考时间的这个比例，超时后放弃，照常迭代加深
+THREAT_MAX_PLY = 60 # 单条威胁序列最多几手(含对方的防守和反冲四)
+THREAT_CACHE_SIZE = 200000 # 证明缓存条目上限，超过后清空
+QUIESCENCE_MAX_DEPTH = 4 # 叶子节点之后最多再延伸几步冲四/挡四/挡活三
+ASPIRATION_WINDOW = 400 # 渴望窗口的半宽，以上一轮分数为中心，落在窗口外时全窗口重搜
+LMR_MIN_DEPTH = 3 # 剩余深度不小于该值时才做后续着法减层
+LMR_MIN_MOVES = 4 # 排序后前几个着法不减层
+LMR_REDUCTION = 1 # 后续着法减几层
+# 蒙特卡洛树搜索：ChessEngine(search=SEARCH_MCTS)时get_best_move用MCTS代替迭代加深
+SEARCH_ALPHABETA = 'alphabeta'
+SEARCH_MCTS = 'mcts'
+MCTS_POLICY_PUCT = 'puct' # 选子节点：Q + c * 先验 * sqrt(N) / (1 + n)
+MCTS_POLICY_UCT = 'uct' # 选子节点：Q + c * sqrt(ln N / n)，先按先验顺序把没访问过的子节点走一遍
+MCTS_PUCT_C = 2.0
+MCTS_UCT_C = 0.5
+MCTS_MAX_CHILDREN = 16 # 展开时按先验只保留前几个着法
+MCTS_EXPAND_VISITS = 1 # 叶子被访问过几次后才展开，只走过一次的叶子不算先验
+MCTS_PRIOR_TEMPERATURE = 400.0 # 先验 = softmax((进攻增益 + 防守增益) / 温度)，增益是score_gain的分数
+MCTS_ROLLOUT_DEPTH = 20 # 模拟最多走几步，没分出胜负时按当前分数估胜率
+MCTS_ROLLOUT_THREAT_RATE = 0.8 # 模拟时有活四点、挡活三点、冲四点可走时按这个概率走，否则随机走候选着法
+MCTS_SCORE_SCALE = 2000.0 # 分数换成黑棋胜率：1 / (1 + exp(-分数 / MCTS_SCORE_SCALE))
+MCTS_DEFAULT_PLAYOUTS = 2000 # 既不限时也没设模拟次数时模拟几次
+MCTS_MAX_NODES = 1 << 20 # 树的节点上限，满了以后叶子不再展开
+MCTS_SEED = 0 # 模拟走子的随机数种子，根并行时每个进程的种子不同
+# 打开搜索统计时被包装的方法
+STATS_WRAPPED_METHODS = ('get_best_move', 'search_root', 'search_root_parallel', 'minimax', 'get_available_moves', 'order_moves',
+                         'record_cutoff', 'push_chess', 'pop_chess', 'score_gain', 'check_win')
+
+class TranspositionTable():
+    """
+    固定大小的置换表，用zobrist哈希的低位寻址\n
+    size_mb: 内存上限(MB)，条目数取不超过上限的2的幂\n
+    第一次写入时才分配内存，只下棋不搜索的引擎不占用置换表内存
+    """
+    def __init__(self, size_mb=TT_SIZE_MB):
+        capacity = 1
+        while capacity * 2 * TT_ENTRY_BYTES <= size_mb * 1024 * 1024:
+            capacity *= 2
+        self.capacity = capacity
+        self.mask = capacity - 1
+        self.keys = self.scores = self.moves = self.depths = self.flags = self.generations = None
+        self.generation = 0
+
+    def allocate(self):
+        capacity = self.capacity
+        self.keys = array('Q', bytes(8 * capacity))
+        self.scores = array('q', bytes(8 * capacity))
+        self.moves = array('i', [-1]) * capacity
+        self.depths = array('b', [-1]) * capacity # -1表示空位
+        self.flags = array('B', bytes(capacity))
+        self.generations = array('B', bytes(capacity))
+
+    def new_search(self):
+        """
+        每次get_best_move开始时调用，旧搜索留下的记录优先被替换
+        """
+        self.generation = (self.generation + 1) & 0xFF
+
+    def clear(self):
+        if self.depths is not None:
+            self.depths = array('b', [-1]) * self.capacity
+
+    def probe(self, key):
+        """
+        查找局面，命中返回(depth, flag, score, move)，否则返回None\n
+        move为ChessEngine.encode_move的编码，-1表示没有记录最佳着法
+        """
+        if self.depths is None:
+            return None
+        slot = key & self.mask
+        if self.depths[slot] < 0 or self.keys[slot] != key:
+            return None
+        return self.depths[slot], self.flags[slot], self.scores[slot], self.moves[slot]
+
+    def store(self, key, depth, flag, score, move):
+        """
+        替换策略：空位、同一局面、旧搜索留下的记录、或者新记录深度不小于旧记录时才覆盖
+        """
+        if self.depths is None:
+            self.allocate()
+        slot = key & self.mask
+        old_depth = self.depths[slot]
+        if old_depth >= 0 and self.keys[slot] != key and self.generations[slot] == self.generation and depth < old_depth:
+            return
+        self.keys[slot] = key
+        self.depths[slot] = depth
+        self.flags[slot] = flag
+        self.scores[slot] = score
+        self.moves[slot] = move
+        self.generations[slot] = self.generation
+
+# ====位棋盘==== #
+# 四个方向：横线 --、竖线 |、斜线 ///、斜线 \\\
+LINE_ROW = 0
+LINE_COL = 1
+LINE_OBLIQUE = 2 # ///，同一条线上 i + j 相同
+LINE_BACK_OBLIQUE = 3 # \\\，同一条线上 j - i 相同
+
+MIN_BOARD_SIZE = SUCCEED_CHESS_NUMS # 有边界棋盘的最小线数
+MAX_BOARD_SIZE = 20 # 有边界棋盘的最大线数(Gomocup的20路)，更大的棋盘用不限大小的SparseChessEngine
+
+def _build_cell_lines(size=BOARD_LINE_NUMS):
+    """
+    计算每个位置在四个方向上所属的线编号，以及在该线上的位置(从0开始)\n
+    返回cell_lines[i][j] = ((line_id, pos) * 4)，按LINE_ROW..LINE_BACK_OBLIQUE排列
+    """
+    cell_lines = [[None] * size for _ in range(size)]
+    for i in range(size):
+        for j in range(size):
+            oblique_line = i + j
+            back_oblique_line = j - i + size - 1
+            cell_lines[i][j] = ((i, j), (j, i),
+                                (oblique_line, i - max(0, oblique_line - (size - 1))),
+                                (back_oblique_line, i - max(0, i - j)))
+    return cell_lines
+
+def _build_line_lengths(size=BOARD_LINE_NUMS):
+    """
+    每个方向上各条线的长度
+    """
+    return (
+        [size] * size,
+        [size] * size,
+        [size - abs(line - (size - 1)) for line in range(2 * size - 1)],
+        [size - abs(line - (size - 1)) for line in range(2 * size - 1)],
+    )
+
+def _build_line_cells(cell_lines, line_lengths):
+    """
+    line_cells[direction][line][pos]：线上第pos个位置对应的棋盘坐标，cell_lines的反查表
+    """
+    line_cells = [[[None] * length for length in line_lengths[direction]] for direction in range(4)]
+    for i, row in enumerate(cell_lines):
+        for j, lines in enumerate(row):
+            for direction, (line, pos) in enumerate(lines):
+                line_cells[direction][line][pos] = (i, j)
+    return line_cells
+
+# 连五的起点落在[pos - 4, pos]之间时，这个连五经过pos
+FIVE_WINDOW_MASKS = [((1 << (pos + 1)) - 1) & ~((1 << max(0, pos - SUCCEED_CHESS_NUMS + 1)) - 1) for pos in range(MAX_BOARD_SIZE)]
+
+class BoardGeometry():
+    """
+    size × size棋盘的查表数据，同一线数的引擎共用一份，用get_board_geometry取\n
+    cell_lines、line_lengths、line_cells同模块里15路的CELL_LINES、LINE_LENGTHS、LINE_CELLS，
+    cell_five_windows[i][j] = ((line_id, 连五起点掩码) * 4)，zobrist_table[i][j] = (黑棋, 白棋)
+    """
+    def __init__(self, size):
+        if not MIN_BOARD_SIZE <= size <= MAX_BOARD_SIZE:
+            raise ValueError("board_size must be between {} and {}".format(MIN_BOARD_SIZE, MAX_BOARD_SIZE))
+        self.size = size
+        self.cell_lines = _build_cell_lines(size)
+        self.line_lengths = _build_line_lengths(size)
+        self.line_cells = _build_line_cells(self.cell_lines, self.line_lengths)
+        self.cell_five_windows = [[tuple((line, FIVE_WINDOW_MASKS[pos]) for line, pos in lines) for lines in row] for row in self.cell_lines]
+        if size == BOARD_LINE_NUMS:
+            self.zobrist_table = ZOBRIST_TABLE # 15路沿用原来的随机数，开局库和局面缓存里的key不变
+        else:
+            zobrist_random = random.Random(ZOBRIST_SEED + size)
+            self.zobrist_table = [[(zobrist_random.getrandbits(64), zobrist_random.getrandbits(64)) for _ in range(size)] for _ in range(size)]
+        self.neighbor_indexes = {} # key：radius，value：每个位置周围radius格内的位置
+        self.threat_cells_cache = {} # _line_threat_cells的缓存
+
+    def get_neighbor_indexes(self, radius):
+        if radius not in self.neighbor_indexes:
+            self.neighbor_indexes[radius] = _build_neighbor_indexes(radius, self.size)
+        return self.neighbor_indexes[radius]
+
+_board_geometries = {} # key：线数，value：BoardGeometry
+
+def get_board_geometry(size=BOARD_LINE_NUMS):
+    if size not in _board_geometries:
+        _board_geometries[size] = BoardGeometry(size)
+    return _board_geometries[size]
+
+_geometry = get_board_geometry()
+CELL_LINES = _geometry.cell_lines
+LINE_LENGTHS = _geometry.line_lengths
+# CELL_FIVE_WINDOWS[i][j] = ((line_id, 连五起点掩码) * 4)，check_win时免去逐个方向查表
+CELL_FIVE_WINDOWS = _geometry.cell_five_windows
+# LINE_CELLS[direction][line][pos]：线上第pos个位置对应的棋盘坐标，CELL_LINES的反查表
+LINE_CELLS = _geometry.line_cells
+
+class BitBoard():
+    """
+    位棋盘：每种颜色在横、竖、两个斜向上各存一组整数位掩码，每条线一个整数\n
+    masks[color][direction][line]，color 0：黑棋，1：白棋，第pos位表示该线上第pos个位置有子\n
+    geometry: 棋盘的BoardGeometry，默认15路
+    """
+    def __init__(self, geometry=None):
+        self.geometry = geometry if geometry is not None else get_board_geometry()
+        self.cell_lines = self.geometry.cell_lines
+        self.line_lengths = self.geometry.line_lengths
+        self.cell_five_windows = self.geometry.cell_five_windows
+        self.masks = [[[0] * len(self.line_lengths[direction]) for direction in range(4)] for _ in range(2)]
+
+    def place(self, index, color):
+        masks = self.masks[color]
+        for direction, (line, pos) in enumerate(self.cell_lines[index[0]][index[1]]):
+            masks[direction][line] |= 1 << pos
+
+    def remove(self, index, color):
+        masks = self.masks[color]
+        for direction, (line, pos) in enumerate(self.cell_lines[index[0]][index[1]]):
+            masks[direction][line] &= ~(1 << pos)
+
+    def check_five(self, index, color, direction):
+        """
+        检查color颜色在direction方向上是否有经过index的连五
+        """
+        line, pos = self.cell_lines[index[0]][index[1]][direction]
+        x = self.masks[color][direction][line]
+        return (x & (x >> 1) & (x >> 2) & (x >> 3) & (x >> 4) & FIVE_WINDOW_MASKS[pos]) != 0
+
+    def check_win(self, index, color):
+        """
+        检查color颜色在四个方向上是否有经过index的连五
+        """
+        row_masks, col_masks, oblique_masks, back_oblique_masks = self.masks[color]
+        (row, row_window), (col, col_window), (oblique, oblique_window), (back_oblique, back_oblique_window) = self.cell_five_windows[index[0]][index[1]]
+        x = row_masks[row]
+        if x & (x >> 1) & (x >> 2) & (x >> 3) & (x >> 4) & row_window:
+            return True
+        x = col_masks[col]
+        if x & (x >> 1) & (x >> 2) & (x >> 3) & (x >> 4) & col_window:
+            return True
+        x = oblique_masks[oblique]
+        if x & (x >> 1) & (x >> 2) & (x >> 3) & (x >> 4) & oblique_window:
+            return True
+        x = back_oblique_masks[back_oblique]
+        return (x & (x >> 1) & (x >> 2) & (x >> 3) & (x >> 4) & back_oblique_window) != 0
+
+    def get_line(self, direction, line):
+        """
+        取出一条线：返回(黑棋掩码, 白棋掩码, 线长)
+        """
+        return self.masks[0][direction][line], self.masks[1][direction][line], self.line_lengths[direction][line]
+
+    def line_ids(self, direction):
+        """
+        direction方向上所有线的编号
+        """
+        return range(len(self.line_lengths[direction]))
+
+    def line_threat_cells(self, direction, line, x, y):
+        """
+        一条线上己方(x)对对方(y)的威胁，换算成棋盘坐标，格式同_line_threat_cells
+        """
+        return _line_threat_cells(self.geometry, direction, line, x, y)
+
+    def threats_at(self, index, color):
+        """
+        经过index的4条线上color一方的威胁：[(LINE_THREAT_*, 位置元组)]
+        """
+        own_masks, opponent_masks = self.masks[color], self.masks[1 - color]
+        threats = []
+        for direction, (line, _) in enumerate(self.cell_lines[index[0]][index[1]]):
+            threats += _line_threat_cells(self.geometry, direction, line, own_masks[direction][line], opponent_masks[direction][line])
+        return threats
+
+# ====不限大小的棋盘==== #
+SPARSE_COORD_LIMIT = 1 << 13 # SparseChessEngine的坐标范围[-SPARSE_COORD_LIMIT, SPARSE_COORD_LIMIT)
+# 着法编码：(i + SPARSE_MOVE_OFFSET) * SPARSE_MOVE_SPAN + j + SPARSE_MOVE_OFFSET，候选着法比棋子多出邻域半径，编码放得进置换表的32位整数
+SPARSE_MOVE_OFFSET = 1 << 14
+SPARSE_MOVE_SPAN = 1 << 15
+SPARSE_LINE_MARGIN = 8 # 新建一条线或者重定基准时，基准位置比落子位置低几位
+
+def _sparse_cell_lines(i, j):
+    """
+    不限大小的棋盘上(i, j)所在的4条线：((line_id, pos) * 4)，按LINE_ROW..LINE_BACK_OBLIQUE排列
+    """
+    return ((i, j), (j, i), (i + j, i), (j - i, i))
+
+def _sparse_line_cell(direction, line, pos):
+    """
+    _sparse_cell_lines的反查
+    """
+    if direction == LINE_ROW:
+        return line, pos
+    if direction == LINE_COL:
+        return pos, line
+    if direction == LINE_OBLIQUE:
+        return pos, line - pos
+    return pos, pos + line
+
+_sparse_threat_cells_cache = {} # SparseBitBoard.line_threat_cells的缓存，key：(x, y, 基准位置, line, direction)
+
+class SparseBitBoard():
+    """
+    不限大小的位棋盘：只存有子的线，masks[color][direction]为{line: 掩码}，bases[direction]为{line: 基准位置}\n
+    线上第pos个位置对应掩码的第pos - base位；有子的位始终不低于第SUCCEED_CHESS_NUMS位，
+    低位的空位就是线外延伸出去的空位，连五检查和威胁窗口都不用处理边界\n
+    一条线上的子全部提掉后，这条线的记录一起删掉，存储和棋子数成正比
+    """
+    def __init__(self):
+        self.masks = [[{} for _ in range(4)] for _ in range(2)]
+        self.bases = [{} for _ in range(4)]
+
+    def place(self, index, color):
+        black_masks, white_masks = self.masks
+        own_masks = self.masks[color]
+        for direction, (line, pos) in enumerate(_sparse_cell_lines(index[0], index[1])):
+            bases = self.bases[direction]
+            base = bases.get(line)
+            if base is None:
+                base = bases[line] = pos - SPARSE_LINE_MARGIN
+                black_masks[direction][line] = white_masks[direction][line] = 0
+            elif pos - base < SUCCEED_CHESS_NUMS:
+                # 落在基准附近，基准下移，两种颜色的掩码一起左移
+                shift = base - (pos - SPARSE_LINE_MARGIN)
+                base = bases[line] = pos - SPARSE_LINE_MARGIN
+                black_masks[direction][line] <<= shift
+                white_masks[direction][line] <<= shift
+            own_masks[direction][line] |= 1 << (pos - base)
+
+    def remove(self, index, color):
+        black_masks, white_masks = self.masks
+        own_masks = self.masks[color]
+        for direction, (line, pos) in enumerate(_sparse_cell_lines(index[0], index[1])):
+            bases = self.bases[direction]
+            own_masks[direction][line] &= ~(1 << (pos - bases[line]))
+            if not black_masks[direction][line] and not white_masks[direction][line]:
+                del black_masks[direction][line], white_masks[direction][line], bases[line]
+
+    def check_win(self, index, color):
+        """
+        检查color颜色在四个方向上是否有经过index的连五：把index左边4位移到最低位，看低5位里有没有连五的起点
+        """
+        own_masks = self.masks[color]
+        for direction, (line, pos) in enumerate(_sparse_cell_lines(index[0], index[1])):
+            x = own_masks[direction].get(line)
+            if x:
+                x >>= pos - self.bases[direction][line] - (SUCCEED_CHESS_NUMS - 1)
+                if x & (x >> 1) & (x >> 2) & (x >> 3) & (x >> 4) & 31:
+                    return True
+        return False
+
+    def get_line(self, direction, line):
+        """
+        取出一条线：返回(黑棋掩码, 白棋掩码, 基准位置)，没有子的线返回(0, 0, None)
+        """
+        base = self.bases[direction].get(line)
+        if base is None:
+            return 0, 0, None
+        return self.masks[0][direction][line], self.masks[1][direction][line], base
+
+    def line_ids(self, direction):
+        """
+        direction方向上有子的线的编号
+        """
+        return self.bases[direction].keys()
+
+    def line_threat_cells(self, direction, line, x, y):
+        """
+        一条线上己方(x)对对方(y)的威胁，换算成棋盘坐标，格式同_line_threat_cells\n
+        只需要看到最高位的子再往后4格，低位有足够的空位
+        """
+        base = self.bases[direction][line]
+        key = (x, y, base, line, direction)
+        threat_cells = _sparse_threat_cells_cache.get(key)
+        if threat_cells is None:
+            threat_cells = []
+            for kind, points in enumerate(_line_threats(x, y, (x | y).bit_length() + SUCCEED_CHESS_NUMS - 1)):
+                if points:
+                    cells = []
+                    while points:
+                        low_bit = points & -points
+                        points ^= low_bit
+                        cells.append(_sparse_line_cell(direction, line, base + low_bit.bit_length() - 1))
+                    threat_cells.append((kind, tuple(cells)))
+            if len(_sparse_threat_cells_cache) >= LINE_THREAT_CACHE_SIZE:
+                _sparse_threat_cells_cache.clear()
+            _sparse_threat_cells_cache[key] = threat_cells
+        return threat_cells
+
+    def threats_at(self, index, color):
+        """
+        经过index的4条线上color一方的威胁：[(LINE_THREAT_*, 位置元组)]
+        """
+        own_masks, opponent_masks = self.masks[color], self.masks[1 - color]
+        threats = []
+        for direction, (line, _) in enumerate(_sparse_cell_lines(index[0], index[1])):
+            x = own_masks[direction].get(line)
+            if x:
+                threats += self.line_threat_cells(direction, line, x, opponent_masks[direction][line])
+        return threats
+
+# ====棋型分数表==== #
+# 一条线按空位切成若干段连续的棋子，每段的分数只取决于段内黑白排列和两端是否为空位，
+# 预先算好所有段的分数，计算一条线的分数只需要按段查表
+# 下标：((1 << 段长 | 段内黑棋掩码) << 2) | 左端是空位 << 1 | 右端是空位
+SEGMENT_TABLE_SIZE = 1 << (BOARD_LINE_NUMS + 3)
+SEGMENT_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'segment_score_table.bin') # 分数表磁盘缓存
+_segment_score_tables = {} # key：分数权重指纹，value：分数表
+
+def _segment_score_fingerprint(checkup_score):
+    """
+    分数表依赖的全部权重，权重变了缓存就失效
+    """
+    return tuple(checkup_score(is_black_chess, nums, block_chess_nums) for is_black_chess in (True, False)
+                 for nums in range(1, SUCCEED_CHESS_NUMS + 1) for block_chess_nums in range(3))
+
+def _segment_runs(pattern, length):
+    """
+    把段切成同色的连续棋子，段内相邻的两串必然颜色不同，互为阻拦\n
+    返回[(是否为黑棋, 连续数, 是否在段的左端, 是否在段的右端)]
+    """
+    runs = []
+    start = 0
+    for pos in range(1, length + 1):
+        if pos == length or (pattern >> pos) & 1 != (pattern >> start) & 1:
+            runs.append(((pattern >> start) & 1 == 1, pos - start, start == 0, pos == length))
+            start = pos
+    return runs
+
+def segment_score(checkup_score, pattern, length, left_open, right_open):
+    """
+    单段的分数：pattern为段内黑棋掩码，left_open/right_open为两端是否为空位\n
+    分数表只覆盖不超过BOARD_LINE_NUMS的段长，更长的段(19、20路棋盘和不限大小的棋盘)直接用这个函数算
+    """
+    score = 0
+    for is_black_chess, nums, at_left, at_right in _segment_runs(pattern, length):
+        block_chess_nums = (0 if at_left and left_open else 1) + (0 if at_right and right_open else 1)
+        score += checkup_score(is_black_chess, nums, block_chess_nums)
+    return score
+
+def build_segment_score_table(checkup_score):
+    """
+    checkup_score: 计算单段连续同色棋子分数的函数，参数同ChessEngine.checkup_score
+    """
+    table = array('i', bytes(4 * SEGMENT_TABLE_SIZE))
+    for length in range(1, BOARD_LINE_NUMS + 1):
+        for pattern in range(1 << length):
+            runs = _segment_runs(pattern, length)
+            for left_open in (0, 1):
+                for right_open in (0, 1):
+                    score = 0
+                    for is_black_chess, nums, at_left, at_right in runs:
+                        block_chess_nums = (0 if at_left and left_open else 1) + (0 if at_right and right_open else 1)
+                        score += checkup_score(is_black_chess, nums, block_chess_nums)
+                    table[(((1 << length) | pattern) << 2) | (left_open << 1) | right_open] = score
+    return table
+
+def _load_score_table(cache_file, header, size, build_table):
+    """
+    从磁盘缓存读分数表，表头(header)不一致或者缓存不存在时用build_table()重新建表并写回
+    """
+    try:
+        with open(cache_file, 'rb') as f:
+            cached_header = array('i')
+            cached_header.fromfile(f, len(header))
+            if cached_header == header:
+                table = array('i')
+                table.fromfile(f, size)
+                return table
+    except (OSError, EOFError):
+        pass
+    table = build_table()
+    try:
+        # 先写临时文件再替换，多个进程同时建表时不会读到写了一半的文件
+        temp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(temp_file, 'wb') as f:
+            header.tofile(f)
+            table.tofile(f)
+        os.replace(temp_file, cache_file)
+    except OSError:
+        pass # 缓存写不了不影响使用
+    return table
+
+def load_segment_score_table(checkup_score, cache_file=SEGMENT_TABLE_FILE):
+    """
+    取分数表：同一组权重只建一次；优先从磁盘缓存读，缓存不存在或者权重不一致时重新建表并写回
+    """
+    fingerprint = _segment_score_fingerprint(checkup_score)
+    table = _segment_score_tables.get(fingerprint)
+    if table is None:
+        header = array('i', (BOARD_LINE_NUMS,) + fingerprint)
+        table = _segment_score_tables[fingerprint] = _load_score_table(cache_file, header, SEGMENT_TABLE_SIZE, lambda: build_segment_score_table(checkup_score))
+    return table
+
+# ====带空位的棋型分数表==== #
+# 按颜色分别计分：一条线先被对方棋子和线的两端切成段，不到5格的段里连不成五，不计分；
+# 段内己方相邻两子相隔不到SUCCEED_CHESS_NUMS格的归为一串，每串只看它两侧各SUCCEED_CHESS_NUMS格以内的空位(不到5格的按段的端点截断)，
+# 别的串当作空位，按再落一子能成什么定棋型：已有连五为五，成五点有两个以上为活4、一个为冲4，
+# 再落一子能成活4为活3、能成冲4为眠3，能成活3为活2、能成眠3为眠2，能成活2为活1、能成眠2为眠1，
+# X_XX、XX_XX这样中间有空位的三、四和连续的三、四一样计分
+# 下标：1 << 串长(含两侧的空位) | 串内己方棋子掩码，值为黑棋的分数，白棋取相反数
+PATTERN_TABLE_MAX_LENGTH = BOARD_LINE_NUMS # 分数表覆盖的串长，更长的(19路以上的棋盘上才有)现算并缓存
+PATTERN_TABLE_SIZE = 1 << (PATTERN_TABLE_MAX_LENGTH + 1)
+PATTERN_TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pattern_score_table.bin') # 分数表磁盘缓存
+PATTERN_CACHE_SIZE = 1 << 18 # 长串棋型和整线分数缓存的条目上限，超过后清空
+# 棋型，从弱到强
+SHAPE_NONE = 0
+SHAPE_SLEEP_ONE = 1
+SHAPE_LIVE_ONE = 2
+SHAPE_SLEEP_TWO = 3
+SHAPE_LIVE_TWO = 4
+SHAPE_SLEEP_THREE = 5
+SHAPE_LIVE_THREE = 6
+SHAPE_RUSH_FOUR = 7
+SHAPE_LIVE_FOUR = 8
+SHAPE_FIVE = 9
+# 再落一子能成的最强棋型 -> 现在的棋型，不在表里的为SHAPE_NONE
+SHAPE_BEFORE = {SHAPE_LIVE_FOUR: SHAPE_LIVE_THREE, SHAPE_RUSH_FOUR: SHAPE_SLEEP_THREE, SHAPE_LIVE_THREE: SHAPE_LIVE_TWO,
+                SHAPE_SLEEP_THREE: SHAPE_SLEEP_TWO, SHAPE_LIVE_TWO: SHAPE_LIVE_ONE, SHAPE_SLEEP_TWO: SHAPE_SLEEP_ONE}
+# 棋型对应checkup_score的(连续数, 阻拦数)，分数沿用同一组权重
+SHAPE_CHECKUP_ARGS = {SHAPE_FIVE: (5, 0), SHAPE_LIVE_FOUR: (4, 0), SHAPE_RUSH_FOUR: (4, 1), SHAPE_LIVE_THREE: (3, 0), SHAPE_SLEEP_THREE: (3, 1),
+                      SHAPE_LIVE_TWO: (2, 0), SHAPE_SLEEP_TWO: (2, 1), SHAPE_LIVE_ONE: (1, 0), SHAPE_SLEEP_ONE: (1, 1)}
+_pattern_score_tables = {} # key：分数权重指纹，value：(分数表, 整线分数缓存)
+_pattern_shapes = {} # 超出分数表的长串的棋型，key同分数表下标
+
+def _five_point_count(mask, length):
+    """
+    长为length的空段里己方棋子为mask时，落下就成五的空位数，已有连五时返回-1
+    """
+    if mask & mask >> 1 & mask >> 2 & mask >> 3 & mask >> 4:
+        return -1
+    points = 0
+    for start in range(length - SUCCEED_CHESS_NUMS + 1):
+        window = 31 << start
+        if bin(mask & window).count('1') == SUCCEED_CHESS_NUMS - 1:
+            points |= window & ~mask
+    return bin(points).count('1')
+
+def _shape_from_children(five_points, best_child):
+    if five_points < 0:
+        return SHAPE_FIVE
+    if five_points >= 2:
+        return SHAPE_LIVE_FOUR
+    if five_points == 1:
+        return SHAPE_RUSH_FOUR
+    return SHAPE_BEFORE.get(best_child, SHAPE_NONE)
+
+def pattern_shape(mask, length):
+    """
+    长为length的空段里己方棋子为mask时的棋型SHAPE_*，递归试落每个空位，结果记在_pattern_shapes里\n
+    分数表覆盖的长度直接按层建表(build_pattern_score_table)，这个函数只给更长的串用
+    """
+    key = 1 << length | mask
+    shape = _pattern_shapes.get(key)
+    if shape is None:
+        five_points = _five_point_count(mask, length)
+        best_child = SHAPE_NONE
+        if five_points == 0:
+            for pos in range(length):
+                if not mask >> pos & 1:
+                    best_child = max(best_child, pattern_shape(mask | 1 << pos, length))
+        shape = _shape_from_children(five_points, best_child)
+        if len(_pattern_shapes) >= PATTERN_CACHE_SIZE:
+            _pattern_shapes.clear()
+        _pattern_shapes[key] = shape
+    return shape
+
+def build_pattern_score_table(checkup_score):
+    """
+    checkup_score: 计算棋型分数的函数，参数同ChessEngine.checkup_score\n
+    每个长度按棋子从多到少的顺序定棋型，落一子后的棋型都已经算好
+    """
+    shape_scores = [0] * (SHAPE_FIVE + 1)
+    for shape, args in SHAPE_CHECKUP_ARGS.items():
+        shape_scores[shape] = checkup_score(True, *args)
+    table = array('i', bytes(4 * PATTERN_TABLE_SIZE))
+    for length in range(SUCCEED_CHESS_NUMS, PATTERN_TABLE_MAX_LENGTH + 1):
+        shapes = bytearray(1 << length)
+        bits = [1 << pos for pos in range(length)]
+        for mask in sorted(range(1 << length), key=lambda mask: -bin(mask).count('1')):
+            five_points = _five_point_count(mask, length)
+            best_child = SHAPE_NONE
+            if five_points == 0:
+                best_child = max([shapes[mask | bit] for bit in bits if not mask & bit], default=SHAPE_NONE)
+            shapes[mask] = _shape_from_children(five_points, best_child)
+            table[1 << length | mask] = shape_scores[shapes[mask]]
+    return table
+
+def load_pattern_score_table(checkup_score, cache_file=PATTERN_TABLE_FILE):
+    """
+    取带空位的棋型分数表和这组权重共用的整线分数缓存：同一组权重只建一次，磁盘缓存同load_segment_score_table
+    """
+    fingerprint = _segment_score_fingerprint(checkup_score)
+    tables = _pattern_score_tables.get(fingerprint)
+    if tables is None:
+        header = array('i', (PATTERN_TABLE_MAX_LENGTH,) + fingerprint)
+        table = _load_score_table(cache_file, header, PATTERN_TABLE_SIZE, lambda: build_pattern_score_table(checkup_score))
+        tables = _pattern_score_tables[fingerprint] = (table, {})
+    return tables
+
+def _pattern_side_score(table, checkup_score, x, y, length):
+    """
+    一条线上己方(x)各串棋型的分数之和(按黑棋计，为正)，y为对方棋子
+    """
+    score = 0
+    free = ((1 << length) - 1) & ~y
+    segment_starts = free & ~(free << 1)
+    segment_ends = free & ~(free >> 1)
+    while segment_starts:
+        start_bit = segment_starts & -segment_starts
+        end_bit = segment_ends & -segment_ends
+        segment_starts ^= start_bit
+        segment_ends ^= end_bit
+        stones = x & ((end_bit << 1) - start_bit)
+        if not stones or end_bit < start_bit << (SUCCEED_CHESS_NUMS - 1):
+            continue # 段里没有己方棋子，或者不到5格
+        low_limit, high_limit = start_bit.bit_length() - 1, end_bit.bit_length() - 1
+        # 每个子往高位涂3格，相隔不到5格的子涂完连在一起，连成的每一片是一串
+        smear = stones | stones << 1 | stones << 2 | stones << 3
+        cluster_starts = smear & ~(smear << 1)
+        cluster_ends = smear & ~(smear >> 1)
+        while cluster_starts:
+            first_bit = cluster_starts & -cluster_starts
+            last_bit = cluster_ends & -cluster_ends
+            cluster_starts ^= first_bit
+            cluster_ends ^= last_bit
+            cluster = stones & ((last_bit << 1) - first_bit)
+            low = max(low_limit, first_bit.bit_length() - 1 - SUCCEED_CHESS_NUMS)
+            cluster_length = min(high_limit, cluster.bit_length() - 1 + SUCCEED_CHESS_NUMS) - low + 1
+            index = 1 << cluster_length | cluster >> low
+            try:
+                score += table[index]
+            except IndexError:
+                shape = pattern_shape(cluster >> low, cluster_length)
+                if shape != SHAPE_NONE:
+                    score += checkup_score(True, *SHAPE_CHECKUP_ARGS[shape])
+    return score
+
+def pattern_line_score(table, checkup_score, black_mask, white_mask, length):
+    """
+    一条线上带空位的棋型分数：黑棋各串的分数减去白棋各串的分数，table为load_pattern_score_table取出的分数表
+    """
+    return (_pattern_side_score(table, checkup_score, black_mask, white_mask, length)
+            - _pattern_side_score(table, checkup_score, white_mask, black_mask, length))
+
+_reference_shapes = {} # _reference_shape的结果，key：棋型字符串
+
+def _reference_shape(cells):
+    """
+    cells: 'x'(己方棋子)和'.'(空位)组成的字符串，两端之外是边界，返回棋型SHAPE_*\n
+    直接按棋型的定义逐个试落空位，不用位运算和分数表，只给reference_line_score用
+    """
+    shape = _reference_shapes.get(cells)
+    if shape is not None:
+        return shape
+    children = [cells[:pos] + 'x' + cells[pos + 1:] for pos in range(len(cells)) if cells[pos] == '.']
+    five_points = sum('x' * SUCCEED_CHESS_NUMS in child for child in children)
+    if 'x' * SUCCEED_CHESS_NUMS in cells:
+        shape = SHAPE_FIVE
+    elif five_points >= 2:
+        shape = SHAPE_LIVE_FOUR
+    elif five_points == 1:
+        shape = SHAPE_RUSH_FOUR
+    else:
+        shape = SHAPE_BEFORE.get(max([_reference_shape(child) for child in children], default=SHAPE_NONE), SHAPE_NONE)
+    _reference_shapes[cells] = shape
+    return shape
+
+def reference_line_score(cells, checkup_score, evaluator):
+    """
+    逐格按定义算一条线的分数(黑棋为正，不按线长缩减)，不查表、不用位棋盘，很慢，只用来核对增量评估\n
+    cells: 线上从一端到另一端的BOARD_MAP_*，两端之外是边界；evaluator: EVALUATOR_*
+    """
+    if len(cells) < SUCCEED_CHESS_NUMS:
+        return 0
+    score = 0
+    if evaluator == EVALUATOR_RUNS:
+        # 每串连续的同色棋子，两端是边界或者对方棋子的算阻拦
+        start = 0
+        while start < len(cells):
+            end = start
+            while end < len(cells) and cells[end] == cells[start]:
+                end += 1
+            if cells[start] != BOARD_MAP_NONE:
+                block_chess_nums = (start == 0 or cells[start - 1] != BOARD_MAP_NONE) + (end == len(cells) or cells[end] != BOARD_MAP_NONE)
+                score += checkup_score(cells[start] == BOARD_MAP_BLACK_CHESS, end - start, block_chess_nums)
+            start = end
+        return score
+    for chess in (BOARD_MAP_BLACK_CHESS, BOARD_MAP_WHITE_CHESS):
+        text = ''.join('x' if cell == chess else '.' if cell == BOARD_MAP_NONE else '|' for cell in cells)
+        for segment in text.split('|'):
+            if len(segment) < SUCCEED_CHESS_NUMS:
+                continue
+            stones = [pos for pos, cell in enumerate(segment) if cell == 'x']
+            clusters = []
+            for pos in stones:
+                if clusters and pos - clusters[-1][-1] < SUCCEED_CHESS_NUMS:
+                    clusters[-1].append(pos)
+                else:
+                    clusters.append([pos])
+            for cluster in clusters:
+                low, high = max(0, cluster[0] - SUCCEED_CHESS_NUMS), min(len(segment) - 1, cluster[-1] + SUCCEED_CHESS_NUMS)
+                shape = _reference_shape(''.join('x' if pos in cluster else '.' for pos in range(low, high + 1)))
+                if shape != SHAPE_NONE:
+                    score += checkup_score(chess == BOARD_MAP_BLACK_CHESS, *SHAPE_CHECKUP_ARGS[shape])
+    return score
+
+def _build_neighbor_indexes(radius, size=BOARD_LINE_NUMS):
+    """
+    每个位置周围radius格内的位置，由BoardGeometry按线数缓存，各个引擎实例共用
+    """
+    return [[[(i, j) for i in range(idx0 - radius, idx0 + radius + 1) for j in range(idx1 - radius, idx1 + radius + 1)
+              if 0 <= i < size and 0 <= j < size and (i, j) != (idx0, idx1)]
+             for idx1 in range(size)] for idx0 in range(size)]
+
+def _build_neighbor_offsets(radius):
+    """
+    不限大小的棋盘用的邻域：周围radius格内的相对位移
+    """
+    return [(di, dj) for di in range(-radius, radius + 1) for dj in range(-radius, radius + 1) if (di, dj) != (0, 0)]
+
+# ====开局库==== #
+# 棋盘的8种对称变换(4种旋转 × 是否翻转)，SYMMETRY_INDEXES[s][i][j]为(i, j)变换后的位置
+def _symmetry_transform(symmetry, i, j):
+    n = BOARD_LINE_NUMS - 1
+    if symmetry & 4:
+        i, j = j, i
+    for _ in range(symmetry & 3):
+        i, j = j, n - i
+    return i, j
+
+SYMMETRY_INDEXES = [[[_symmetry_transform(symmetry, i, j) for j in range(BOARD_LINE_NUMS)] for i in range(BOARD_LINE_NUMS)] for symmetry in range(8)]
+# SYMMETRY_INVERSE_INDEXES[s][i][j]：变换s的逆变换
+SYMMETRY_INVERSE_INDEXES = [[[None] * BOARD_LINE_NUMS for _ in range(BOARD_LINE_NUMS)] for _ in range(8)]
+for _symmetry in range(8):
+    for _i in range(BOARD_LINE_NUMS):
+        for _j in range(BOARD_LINE_NUMS):
+            _ti, _tj = SYMMETRY_INDEXES[_symmetry][_i][_j]
+            SYMMETRY_INVERSE_INDEXES[_symmetry][_ti][_tj] = (_i, _j)
+# SYMMETRY_ZOBRIST[color][i * BOARD_LINE_NUMS + j]：(i, j)经8种变换后的zobrist值，color 0：黑棋，1：白棋
+SYMMETRY_ZOBRIST = [[tuple(ZOBRIST_TABLE[SYMMETRY_INDEXES[symmetry][i][j][0]][SYMMETRY_INDEXES[symmetry][i][j][1]][color] for symmetry in range(8))
+                     for i in range(BOARD_LINE_NUMS) for j in range(BOARD_LINE_NUMS)] for color in range(2)]
+
+OPENING_BOOK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'opening_book.bin') # 默认的开局库文件
+OPENING_BOOK_MAGIC = b'FCBK'
+# 文件头：magic、棋盘线数、收录的最大棋子数、zobrist种子、条目数
+OPENING_BOOK_HEADER = struct.Struct('<4sHHII')
+# 条目：局面key、着法(i * BOARD_LINE_NUMS + j，标准朝向下)、权重(对局数或搜索深度)，按key升序排列
+OPENING_BOOK_ENTRY = struct.Struct('<QHH')
+
+def canonical_position(bitboard, chess, max_stones=BOARD_LINE_NUMS * BOARD_LINE_NUMS):
+    """
+    计算局面在8种对称变换下的标准key：各变换的zobrist哈希取最小值，轮到黑棋时再异或ZOBRIST_BLACK_TURN\n
+    返回(key, 取到最小值的变换)，棋子数超过max_stones时返回None\n
+    只看横线掩码取出棋子，开局时只有几个子，开销在微秒级
+    """
+    hashes = [0] * 8
+    stones = 0
+    for color in range(2):
+        symmetry_zobrist = SYMMETRY_ZOBRIST[color]
+        for i, x in enumerate(bitboard.masks[color][LINE_ROW]):
+            while x:
+                low_bit = x & -x
+                values = symmetry_zobrist[i * BOARD_LINE_NUMS + low_bit.bit_length() - 1]
+                for symmetry in range(8):
+                    hashes[symmetry] ^= values[symmetry]
+                stones += 1
+                if stones > max_stones:
+                    return None
+                x ^= low_bit
+    key = min(hashes)
+    symmetry = hashes.index(key)
+    if chess == BOARD_MAP_BLACK_CHESS:
+        key ^= ZOBRIST_BLACK_TURN
+    return key, symmetry
+
+def write_opening_book(entries, max_stones, book_file=OPENING_BOOK_FILE):
+    """
+    把开局库写成按key排序的二进制文件\n
+    entries: {key: (move_code, weight)}，move_code为标准朝向下的i * BOARD_LINE_NUMS + j
+    """
+    temp_file = '{}.{}.tmp'.format(book_file, os.getpid())
+    with open(temp_file, 'wb') as f:
+        f.write(OPENING_BOOK_HEADER.pack(OPENING_BOOK_MAGIC, BOARD_LINE_NUMS, max_stones, ZOBRIST_SEED, len(entries)))
+        for key in sorted(entries):
+            move_code, weight = entries[key]
+            f.write(OPENING_BOOK_ENTRY.pack(key, move_code, min(weight, 0xFFFF)))
+    os.replace(temp_file, book_file)
+
+class OpeningBook():
+    """
+    只读的开局库：文件用mmap打开，不整体读入内存，按key二分查找\n
+    多个进程打开同一个文件时共用操作系统的页缓存
+    """
+    def __init__(self, book_file=OPENING_BOOK_FILE):
+        self.book_file = book_file
+        with open(book_file, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, board_line_nums, self.max_stones, zobrist_seed, self.count = OPENING_BOOK_HEADER.unpack_from(self.data, 0)
+        if magic != OPENING_BOOK_MAGIC or board_line_nums != BOARD_LINE_NUMS or zobrist_seed != ZOBRIST_SEED:
+            self.data.close()
+            raise ValueError("{} is not an opening book for this engine".format(book_file))
+
+    def probe(self, key):
+        """
+        二分查找key，命中返回(move_code, weight)，否则返回None
+        """
+        data, unpack_from, entry_size = self.data, OPENING_BOOK_ENTRY.unpack_from, OPENING_BOOK_ENTRY.size
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) >> 1
+            entry_key, move_code, weight = unpack_from(data, OPENING_BOOK_HEADER.size + middle * entry_size)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return move_code, weight
+        return None
+
+    def lookup(self, bitboard, board_map, chess):
+        """
+        查chess一方在当前局面下的库着法，没有收录或者着法不能下时返回None
+        """
+        position = canonical_position(bitboard, chess, self.max_stones)
+        if position is None:
+            return None
+        key, symmetry = position
+        entry = self.probe(key)
+        if entry is None:
+            return None
+        i, j = divmod(entry[0], BOARD_LINE_NUMS)
+        move = SYMMETRY_INVERSE_INDEXES[symmetry][i][j]
+        return move if board_map[move[0]][move[1]] == BOARD_MAP_NONE else None
+
+    def close(self):
+        self.data.close()
+
+_opening_books = {} # key：文件路径，value：OpeningBook，同一进程里的引擎共用一份映射
+
+def load_opening_book(book_file=OPENING_BOOK_FILE):
+    book_file = os.path.abspath(book_file)
+    if book_file not in _opening_books:
+        _opening_books[book_file] = OpeningBook(book_file)
+    return _opening_books[book_file]
+
+# ====局面缓存==== #
+POSITION_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'position_cache.sqlite') # 默认的局面缓存文件
+POSITION_CACHE_MAX_ENTRIES = 1000000 # 缓存条目上限，超过后按最近使用时间淘汰
+POSITION_CACHE_EVICT_INTERVAL = 256 # 每写多少次检查一次是否超过上限
+POSITION_CACHE_MIN_DEPTH = 2 # 搜索深度不小于该值的结果才写入缓存
+POSITION_CACHE_WARM_ENTRIES = 100000 # 引擎创建时预先载入置换表的条目数
+
+def _to_signed64(value):
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+class PositionCache():
+    """
+    多个进程共用的磁盘局面缓存：SQLite WAL模式，局面key -> (搜索深度, 分数, 最佳着法)\n
+    config: 影响搜索结果的引擎配置指纹，不同配置的结果互不干扰\n
+    每个进程打开自己的连接，fork之后第一次使用时重新连接
+    """
+    def __init__(self, cache_file=POSITION_CACHE_FILE, config=0, max_entries=POSITION_CACHE_MAX_ENTRIES):
+        self.cache_file = cache_file
+        self.config = _to_signed64(config)
+        self.max_entries = max_entries
+        self.connection = None
+        self.pid = None
+        self.writes = 0
+
+    def connect(self):
+        if self.connection is None or self.pid != os.getpid():
+            self.connection = sqlite3.connect(self.cache_file, timeout=30, isolation_level=None)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS positions (config INTEGER, key INTEGER, depth INTEGER, score INTEGER, move INTEGER, used REAL, '
+                                    'PRIMARY KEY (config, key)) WITHOUT ROWID')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS positions_used ON positions (used)')
+            self.pid = os.getpid()
+        return self.connection
+
+    def lookup(self, key):
+        """
+        查局面，命中返回(depth, score, move_code)并刷新使用时间，否则返回None
+        """
+        connection = self.connect()
+        key = _to_signed64(key)
+        row = connection.execute('SELECT depth, score, move FROM positions WHERE config = ? AND key = ?', (self.config, key)).fetchone()
+        if row is not None:
+            connection.execute('UPDATE positions SET used = ? WHERE config = ? AND key = ?', (time.time(), self.config, key))
+        return row
+
+    def store(self, key, depth, score, move_code):
+        """
+        写入搜索结果，已有记录更深时保留旧记录
+        """
+        connection = self.connect()
+        connection.execute('INSERT INTO positions VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (config, key) DO UPDATE SET '
+                           'depth = excluded.depth, score = excluded.score, move = excluded.move, used = excluded.used WHERE excluded.depth >= positions.depth',
+                           (self.config, _to_signed64(key), depth, score, move_code, time.time()))
+        self.writes += 1
+        if self.writes % POSITION_CACHE_EVICT_INTERVAL == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        条目数超过上限时，删掉最久没用过的记录，留出十分之一的空间
+        """
+        connection = self.connect()
+        count = connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+        if count > self.max_entries:
+            connection.execute('DELETE FROM positions WHERE used <= (SELECT used FROM positions ORDER BY used LIMIT 1 OFFSET ?)',
+                               (count - self.max_entries * 9 // 10,))
+
+    def warm_load(self, transposition_table, limit=POSITION_CACHE_WARM_ENTRIES):
+        """
+        把最近用过的limit条记录载入置换表，记录是根节点的精确值，深度比根节点下的搜索深度多一层
+        """
+        rows = self.connect().execute('SELECT key, depth, score, move FROM positions WHERE config = ? ORDER BY used DESC LIMIT ?', (self.config, limit))
+        for key, depth, score, move_code in rows:
+            transposition_table.store(key & 0xFFFFFFFFFFFFFFFF, depth + 1, TT_FLAG_EXACT, score, move_code)
+
+    def close(self):
+        if self.connection is not None and self.pid == os.getpid():
+            self.connection.close()
+        self.connection = None
+
+_position_caches = {} # key：(文件路径, 配置指纹)，value：PositionCache，同一进程里的引擎共用连接
+
+def load_position_cache(cache_file=POSITION_CACHE_FILE, config=0):
+    cache_key = (os.path.abspath(cache_file), config)
+    if cache_key not in _position_caches:
+        _position_caches[cache_key] = PositionCache(cache_key[0], config)
+    return _position_caches[cache_key]
+
+# ====威胁空间搜索==== #
+def _line_window_starts(x, length):
+    """
+    一条线上至少有一个己方(x)子的五格窗口的起点，只和子数有关，不和线长有关
+    """
+    starts = set()
+    last_start = length - SUCCEED_CHESS_NUMS
+    while x:
+        low_bit = x & -x
+        x ^= low_bit
+        pos = low_bit.bit_length() - 1
+        starts.update(range(max(0, pos - SUCCEED_CHESS_NUMS + 1), min(pos, last_start) + 1))
+    return starts
+
+def _line_window_points(x, y, length, need):
+    """
+    一条线上每个五格窗口里己方(x)正好need个子、对方(y)没有子时，窗口里的空位，返回位掩码
+    """
+    points = 0
+    for start in _line_window_starts(x, length):
+        window = 31 << start
+        if not y & window and bin(x & window).count('1') == need:
+            points |= window & ~x
+    return points
+
+def _line_open_four_points(x, y, length):
+    """
+    一条线上落子后能形成两个以上成五点(活四)的空位，返回位掩码，非0说明这条线上有活三
+    """
+    points = 0
+    four_points = _line_window_points(x, y, length, 3)
+    while four_points:
+        low_bit = four_points & -four_points
+        four_points ^= low_bit
+        if bin(_line_window_points(x | low_bit, y, length, 4)).count('1') >= 2:
+            points |= low_bit
+    return points
+
+# _line_threats返回值的下标
+LINE_THREAT_FIVE = 0 # 成五点
+LINE_THREAT_FOUR = 1 # 冲四点：落下后形成冲四
+LINE_THREAT_TWO = 2 # 窗口里只有两个子的空位，活三的候选
+LINE_THREAT_OPEN_FOUR = 3 # 活四点：非0说明有活三
+LINE_THREAT_DEFENSE = 4 # 对方挡在这些位置后，这条线上不再有活四点
+_line_threat_cache = {} # key：(x, y, 线长)合成的整数，威胁搜索里同一条线的排列反复出现，算一次就够
+LINE_THREAT_CACHE_SIZE = 1 << 20
+
+def _line_threats(x, y, length):
+    """
+    一条线上己方(x)对对方(y)的威胁：各项都是线上位置的位掩码，按LINE_THREAT_*排列
+    """
+    key = (x << length | y) << 16 | length
+    threats = _line_threat_cache.get(key)
+    if threats is not None:
+        return threats
+    points = [0, 0, 0]
+    for start in _line_window_starts(x, length):
+        window = 31 << start
+        if y & window:
+            continue
+        count = bin(x & window).count('1')
+        if 2 <= count <= 4:
+            points[4 - count] |= window & ~x
+    open_four_points = 0
+    four_points = points[LINE_THREAT_FOUR]
+    while four_points:
+        low_bit = four_points & -four_points
+        four_points ^= low_bit
+        if bin(_line_window_points(x | low_bit, y, length, 4)).count('1') >= 2:
+            open_four_points |= low_bit
+    defenses = 0
+    if open_four_points:
+        low = max(0, (open_four_points & -open_four_points).bit_length() - SUCCEED_CHESS_NUMS)
+        high = min(length - 1, open_four_points.bit_length() + SUCCEED_CHESS_NUMS - 2)
+        for pos in range(low, high + 1):
+            if not (x | y) >> pos & 1 and not _line_open_four_points(x, y | 1 << pos, length):
+                defenses |= 1 << pos
+    threats = (points[0], points[1], points[2], open_four_points, defenses)
+    if len(_line_threat_cache) >= LINE_THREAT_CACHE_SIZE:
+        _line_threat_cache.clear()
+    _line_threat_cache[key] = threats
+    return threats
+
+def _line_threat_cells(geometry, direction, line, x, y):
+    """
+    _line_threats换算成geometry棋盘上的坐标：返回[(LINE_THREAT_*, 位置元组)]，只列出非空的项
+    """
+    key = (((x << geometry.size | y) << 6 | line) << 2) | direction
+    cache = geometry.threat_cells_cache
+    threat_cells = cache.get(key)
+    if threat_cells is None:
+        line_cells = geometry.line_cells[direction][line]
+        length = geometry.line_lengths[direction][line]
+        threat_cells = []
+        for kind, points in enumerate(_line_threats(x, y, length)):
+            if points:
+                threat_cells.append((kind, tuple(line_cells[pos] for pos in range(length) if points >> pos & 1)))
+        if len(cache) >= LINE_THREAT_CACHE_SIZE:
+            cache.clear()
+        cache[key] = threat_cells
+    return threat_cells
+
+class ThreatSolver():
+    """
+    威胁空间搜索：进攻方只走冲四(VCF)或冲四、活三(VCT)，防守方只考虑挡点和反冲四\n
+    直接在引擎的棋盘上试落子(place_stone/remove_stone)，只更新棋子、位棋盘和哈希，搜完恢复原样\n
+    证明缓存：key为(局面哈希, 进攻方, 是否VCT)，value为(步数, 必胜着法或None)\n
+    deadline: 截止时间(time.perf_counter())，由调用方在每步搜索前设置，这一步的所有威胁搜索共用；为None时按max_nodes限制单次搜索\n
+    超时、超过节点上限或者引擎的search_stop_event被设置时aborted为True，结果按没找到处理
+    """
+    def __init__(self, engine, vcf_depth=VCF_MAX_DEPTH, vct_depth=VCT_MAX_DEPTH, max_nodes=THREAT_MAX_NODES):
+        self.engine = engine
+        self.vcf_depth = vcf_depth
+        self.vct_depth = vct_depth
+        self.max_nodes = max_nodes
+        self.deadline = None
+        self.proof_cache = {}
+        self.nodes = 0
+        self.total_nodes = 0 # 累计节点数，不随单次搜索清零，基准测试用
+        self.aborted = False
+
+    def check_stop(self):
+        """
+        每个节点检查一次：超过截止时间(或没有截止时间时超过节点上限)、收到外部停止信号时标记aborted
+        """
+        self.nodes += 1
+        self.total_nodes += 1
+        if self.deadline is None:
+            if self.nodes > self.max_nodes:
+                self.aborted = True
+        elif time.perf_counter() >= self.deadline:
+            self.aborted = True
+        stop_event = self.engine.search_stop_event
+        if stop_event is not None and stop_event.is_set():
+            self.aborted = True
+
+    def find_win(self, chess):
+        """
+        找chess一方的必胜着法：直接成五 > VCF > VCT，找不到(或中止)返回None
+        """
+        color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+        self.nodes = 0
+        self.aborted = False
+        fives = self.scan(color)[0][LINE_THREAT_FIVE]
+        if fives:
+            return min(fives)
+        move = self.attacker_node(color, self.vcf_depth, False, 0)
+        if move is None and self.vct_depth > 0 and not self.aborted:
+            self.nodes = 0
+            move = self.attacker_node(color, self.vct_depth, True, 0)
+        return move
+
+    def find_defenses(self, chess):
+        """
+        对方有必胜着法时，找chess一方能化解的着法：试落对方的成五点、冲四点、活三挡点以及己方的冲四点，
+        落子后对方找不到必胜着法的保留，返回排好序的列表；中途中止时没试完的着法不知道能不能化解，返回空列表
+        """
+        color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+        own_threats, opponent_threats = self.scan(color)
+        candidates = opponent_threats[LINE_THREAT_FIVE] | opponent_threats[LINE_THREAT_FOUR] | opponent_threats[LINE_THREAT_DEFENSE] | own_threats[LINE_THREAT_FOUR]
+        defenses = []
+        for move in sorted(candidates):
+            self.place(move, color)
+            refuted = self.find_win(-chess) is not None
+            self.remove(move, color)
+            if self.aborted:
+                return []
+            if not refuted:
+                defenses.append(move)
+        return defenses
+
+    def place(self, index, color):
+        self.engine.place_stone(index, color)
+
+    def remove(self, index, color):
+        self.engine.remove_stone(index, color)
+
+    def scan(self, color):
+        """
+        扫描全盘，返回(color一方的威胁, 对方的威胁)，每一方是按LINE_THREAT_*排列的5个位置集合
+        """
+        bitboard = self.engine.bitboard
+        own_masks, opponent_masks = bitboard.masks[color], bitboard.masks[1 - color]
+        own_threats = [set(), set(), set(), set(), set()]
+        opponent_threats = [set(), set(), set(), set(), set()]
+        for direction in range(4):
+            own_lines, opponent_lines = own_masks[direction], opponent_masks[direction]
+            for line in bitboard.line_ids(direction):
+                x, y = own_lines[line], opponent_lines[line]
+                if x:
+                    for kind, cells in bitboard.line_threat_cells(direction, line, x, y):
+                        own_threats[kind].update(cells)
+                if y:
+                    for kind, cells in bitboard.line_threat_cells(direction, line, y, x):
+                        opponent_threats[kind].update(cells)
+        return own_threats, opponent_threats
+
+    def creates_threat(self, index, color, vct):
+        """
+        刚在index落下的子是否形成冲四(或VCT时的活三)，落子前这一方没有成五点，所以经过index的线上的成五点都是这一步形成的
+        """
+        for kind, _ in self.engine.bitboard.threats_at(index, color):
+            if kind == LINE_THREAT_FIVE or vct and kind == LINE_THREAT_OPEN_FOUR:
+                return True
+        return False
+
+    def attacker_node(self, color, depth, vct, ply):
+        """
+        轮到进攻方：返回能在depth步威胁内取胜的着法，否则返回None
+        """
+        self.check_stop()
+        if self.aborted or ply >= THREAT_MAX_PLY:
+            return None
+        own_threats, opponent_threats = self.scan(color)
+        if own_threats[LINE_THREAT_FIVE]:
+            return min(own_threats[LINE_THREAT_FIVE])
+        opponent_fives = opponent_threats[LINE_THREAT_FIVE]
+        if len(opponent_fives) > 1:
+            return None # 对方有两个成五点，挡不住
+        key = (self.engine.zobrist_hash, color, vct)
+        cached = self.proof_cache.get(key)
+        if cached is not None:
+            cached_depth, cached_move = cached
+            if cached_move is not None and cached_depth <= depth or cached_move is None and cached_depth >= depth:
+                return cached_move
+        if vct:
+            # 先看只用冲四能不能赢，VCF的分支少得多
+            move = self.attacker_node(color, self.vcf_depth, False, ply)
+            if move is not None or self.aborted:
+                return move
+        if opponent_fives:
+            candidates = list(opponent_fives) # 对方冲四，必须先挡，挡完不算一步威胁
+        elif depth == 0:
+            return None
+        else:
+            four_points = own_threats[LINE_THREAT_FOUR]
+            candidates = sorted(four_points)
+            if vct and not opponent_threats[LINE_THREAT_OPEN_FOUR]:
+                # 对方有活三时走活三太慢，对方冲成活四就输了，只能冲四
+                candidates += sorted(own_threats[LINE_THREAT_TWO] - four_points)
+        result = None
+        for move in candidates:
+            self.place(move, color)
+            if opponent_fives:
+                win = self.defender_node(color, depth, vct, ply + 1)
+            else:
+                win = self.creates_threat(move, color, vct) and self.defender_node(color, depth - 1, vct, ply + 1)
+            self.remove(move, color)
+            if win:
+                result = move
+                break
+            if self.aborted:
+                return None
+        if len(self.proof_cache) >= THREAT_CACHE_SIZE:
+            self.proof_cache.clear()
+        self.proof_cache[key] = (depth, result)
+        return result
+
+    def defender_node(self, color, depth, vct, ply):
+        """
+        轮到防守方(color是进攻方)：防守方的所有挡法和反冲四都挡不住时返回True
+        """
+        self.check_stop()
+        if self.aborted or ply >= THREAT_MAX_PLY:
+            return False
+        opponent = 1 - color
+        own_threats, opponent_threats = self.scan(color)
+        if opponent_threats[LINE_THREAT_FIVE]:
+            return False # 防守方自己有成五点，直接赢
+        fives = own_threats[LINE_THREAT_FIVE]
+        if len(fives) >= 2:
+            return True
+        if fives:
+            replies = fives
+        elif vct and own_threats[LINE_THREAT_OPEN_FOUR]:
+            replies = own_threats[LINE_THREAT_DEFENSE] | opponent_threats[LINE_THREAT_FOUR] # 挡活三，或者先反冲四
+        else:
+            return False
+        for reply in sorted(replies):
+            self.place(reply, opponent)
+            win = self.attacker_node(color, depth, vct, ply + 1) is not None
+            self.remove(reply, opponent)
+            if not win:
+                return False
+        return True
+
+class MCTSTree():
+    """
+    数组存储的蒙特卡洛搜索树：节点编号就是下标，每个字段一个array，不为每个节点建Python对象\n
+    同一节点的子节点编号连续，从first_child[node]开始共child_counts[node]个，first_child为-1表示还没展开\n
+    values是走到该节点的一方的累计收益(胜1、和0.5、负0)，0号节点是树根
+    """
+    def __init__(self):
+        self.moves = array('i') # 走到该节点的着法编码，树根为-1
+        self.priors = array('d')
+        self.visits = array('i')
+        self.values = array('d')
+        self.first_child = array('i')
+        self.child_counts = array('i')
+        self.add_node(-1, 1.0)
+
+    def __len__(self):
+        return len(self.moves)
+
+    def add_node(self, move_code, prior):
+        self.moves.append(move_code)
+        self.priors.append(prior)
+        self.visits.append(0)
+        self.values.append(0.0)
+        self.first_child.append(-1)
+        self.child_counts.append(0)
+        return len(self.moves) - 1
+
+    def children(self, node):
+        first = self.first_child[node]
+        return range(first, first + self.child_counts[node]) if first >= 0 else range(0)
+
+    def find_child(self, node, move_code):
+        """
+        node下着法为move_code的子节点，没有时返回-1
+        """
+        for child in self.children(node):
+            if self.moves[child] == move_code:
+                return child
+        return -1
+
+    def best_child(self, node):
+        """
+        访问次数最多的子节点，次数相同时取收益高的，没有子节点时返回-1
+        """
+        best, best_key = -1, None
+        for child in self.children(node):
+            key = (self.visits[child], self.values[child])
+            if best_key is None or key > best_key:
+                best, best_key = child, key
+        return best
+
+    def subtree(self, node):
+        """
+        把以node为根的子树复制成一棵新树，其余节点丢掉，子节点仍然连续存放
+        """
+        tree = MCTSTree()
+        tree.visits[0], tree.values[0] = self.visits[node], self.values[node]
+        pending = [(node, 0)]
+        while pending:
+            old_node, new_node = pending.pop()
+            first, count = self.first_child[old_node], self.child_counts[old_node]
+            if first < 0:
+                continue
+            new_first = len(tree)
+            for child in range(first, first + count):
+                new_child = tree.add_node(self.moves[child], self.priors[child])
+                tree.visits[new_child], tree.values[new_child] = self.visits[child], self.values[child]
+                pending.append((child, new_child))
+            tree.first_child[new_node], tree.child_counts[new_node] = new_first, count
+        return tree
+
+class MonteCarloTreeSearch():
+    """
+    蒙特卡洛树搜索：按PUCT/UCT选到叶子，展开时用score_gain的进攻和防守增益算先验，
+    再从叶子按冲四活三等棋型引导的快速走子模拟到分出胜负或走满MCTS_ROLLOUT_DEPTH步\n
+    直接在引擎的棋盘上push_chess/pop_chess，每次模拟完恢复原样\n
+    树在两次搜索之间保留：当前局面是上次树根局面走了几步之后的局面时，对应的子树成为新树根，之前的模拟接着用
+    """
+    def __init__(self, engine, policy=MCTS_POLICY_PUCT, seed=MCTS_SEED):
+        if policy not in (MCTS_POLICY_PUCT, MCTS_POLICY_UCT):
+            raise ValueError("unknown mcts policy: {}".format(policy))
+        self.engine = engine
+        self.policy = policy
+        self.random = random.Random(seed)
+        self.tree = MCTSTree()
+        self.root_chess = None # 树根轮到的一方
+        self.root_stones = None # 树根局面的棋子集合{(index, chess)}，None表示还没有树
+        self.playouts = 0 # 最近一次search的模拟次数
+
+    def find_node(self, chess):
+        """
+        当前局面(轮到chess)在树里对应的节点：树根局面之后的几步都在落子记录里、并且都是树里的着法时才找得到，否则返回-1
+        """
+        engine = self.engine
+        if self.root_stones is None:
+            return -1
+        stones = set(engine.get_stones())
+        added = len(stones) - len(self.root_stones)
+        if added < 0 or added > len(engine.move_history) or not self.root_stones <= stones:
+            return -1
+        node, turn = 0, self.root_chess
+        new_stones = set()
+        for index, _ in engine.move_history[len(engine.move_history) - added:]:
+            node = self.tree.find_child(node, engine.encode_move(index))
+            if node < 0:
+                return -1
+            new_stones.add((index, turn))
+            turn = -turn
+        if turn != chess or new_stones != stones - self.root_stones:
+            return -1
+        return node
+
+    def reset(self, chess, node=-1):
+        """
+        以当前局面为树根：node是当前局面在老树里的节点时复用它的子树，否则新建一棵树
+        """
+        if node < 0:
+            self.tree = MCTSTree()
+        elif node > 0:
+            self.tree = self.tree.subtree(node)
+        self.root_chess = chess
+        self.root_stones = frozenset(self.engine.get_stones())
+
+    def search(self, root_moves, chess, time_budget=None, max_playouts=None, restricted=False):
+        """
+        从当前局面为chess一方模拟，返回树根各子节点的统计{着法: (访问次数, 收益)}\n
+        root_moves: 树根的候选着法，树根已经展开(复用老树)时不用；restricted为True表示只能走root_moves(对方有必胜时的化解着法)，不复用老树\n
+        time_budget/max_playouts: 思考时间和模拟次数上限，None表示不限；引擎的外部停止信号也会中止
+        """
+        engine = self.engine
+        self.reset(chess, -1 if restricted else self.find_node(chess))
+        tree = self.tree
+        if tree.first_child[0] < 0:
+            self.expand(0, chess, root_moves)
+        history = engine.move_history
+        last_moves = (history[-2][0] if len(history) > 1 else None, history[-1][0] if history else None)
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        stop_event = engine.search_stop_event
+        self.playouts = 0
+        while max_playouts is None or self.playouts < max_playouts:
+            if deadline is not None and time.perf_counter() >= deadline:
+                break
+            if stop_event is not None and stop_event.is_set():
+                break
+            self.playout(chess, last_moves)
+            self.playouts += 1
+        return {engine.decode_move(tree.moves[child]): (tree.visits[child], tree.values[child]) for child in tree.children(0)}
+
+    def playout(self, chess, last_moves):
+        """
+        一次模拟：从树根选到叶子(必要时展开)，从叶子快速走子，把黑棋视角的收益沿路径回传\n
+        last_moves: 树根之前双方的最后两步(己方, 对方)，快速走子找威胁要用
+        """
+        engine, tree = self.engine, self.tree
+        prev_move, last_move = last_moves
+        node = 0
+        path = [0]
+        value = None # 黑棋视角的收益
+        while True:
+            if tree.first_child[node] < 0:
+                if tree.visits[node] < MCTS_EXPAND_VISITS or len(tree) >= MCTS_MAX_NODES:
+                    break
+                self.expand(node, chess, engine.candidate_moves)
+            if tree.child_counts[node] == 0:
+                break # 没有候选着法，快速走子里按和棋算
+            node = self.select_child(node)
+            move = engine.decode_move(tree.moves[node])
+            engine.push_chess(move, chess)
+            path.append(node)
+            prev_move, last_move = last_move, move
+            if engine.check_win(move):
+                value = 1.0 if chess == BOARD_MAP_BLACK_CHESS else 0.0
+                break
+            chess = -chess
+        if value is None:
+            value = self.rollout(chess, last_move, prev_move)
+        # 树根是对方走到的，往下每层换一方
+        visits, values = tree.visits, tree.values
+        black_moved = self.root_chess != BOARD_MAP_BLACK_CHESS
+        for node in path:
+            visits[node] += 1
+            values[node] += value if black_moved else 1.0 - value
+            black_moved = not black_moved
+        for _ in range(len(path) - 1):
+            engine.pop_chess()
+
+    def select_child(self, node):
+        tree = self.tree
+        visits, values, priors = tree.visits, tree.values, tree.priors
+        first = tree.first_child[node]
+        parent_visits = visits[node]
+        best, best_score = first, -math.inf
+        if self.policy == MCTS_POLICY_PUCT:
+            factor = MCTS_PUCT_C * math.sqrt(parent_visits)
+            unvisited_value = 1.0 - values[node] / parent_visits if parent_visits else 0.5 # 没访问过的子节点按父节点对手的平均收益估
+            for child in range(first, first + tree.child_counts[node]):
+                n = visits[child]
+                score = (values[child] / n if n else unvisited_value) + factor * priors[child] / (1 + n)
+                if score > best_score:
+                    best, best_score = child, score
+        else:
+            factor = MCTS_UCT_C * math.sqrt(math.log(max(parent_visits, 1)))
+            for child in range(first, first + tree.child_counts[node]):
+                n = visits[child]
+                if n == 0:
+                    return child # 子节点按先验排好序，先走先验高的
+                score = values[child] / n + factor / math.sqrt(n)
+                if score > best_score:
+                    best, best_score = child, score
+        return best
+
+    def expand(self, node, chess, moves):
+        """
+        展开node(轮到chess)：每个着法的先验取自在该处落己方子的增益加上对方在该处落子的增益，只保留前MCTS_MAX_CHILDREN个
+        """
+        engine, tree = self.engine, self.tree
+        color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+        sign = 1 if color == 0 else -1
+        gains = [((engine.score_gain(move, color) - engine.score_gain(move, 1 - color)) * sign, move) for move in moves]
+        gains.sort(key=lambda item: (-item[0], item[1]))
+        del gains[MCTS_MAX_CHILDREN:]
+        if not gains:
+            tree.first_child[node] = len(tree)
+            return
+        top = gains[0][0]
+        weights = [math.exp((gain - top) / MCTS_PRIOR_TEMPERATURE) for gain, _ in gains]
+        total = sum(weights)
+        tree.first_child[node], tree.child_counts[node] = len(tree), len(gains)
+        for weight, (_, move) in zip(weights, gains):
+            tree.add_node(engine.encode_move(move), weight / total)
+
+    def rollout(self, chess, last_move, prev_move):
+        """
+        从当前局面(轮到chess)快速走子，返回黑棋视角的收益，走子都在返回前撤回\n
+        每步只看双方最后一步所在的线：己方有成五点直接走，对方有成五点必须挡，
+        否则按MCTS_ROLLOUT_THREAT_RATE的概率走己方活四点、挡对方活三、己方冲四点，再否则随机走候选着法
+        """
+        engine = self.engine
+        threats_at, rnd = engine.bitboard.threats_at, self.random
+        value = None
+        pushed = 0
+        for _ in range(MCTS_ROLLOUT_DEPTH):
+            candidates = engine.candidate_moves
+            if not candidates:
+                value = 0.5
+                break
+            color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+            move = None
+            open_fours, fours, defenses = [], [], []
+            if prev_move is not None:
+                for kind, cells in threats_at(prev_move, color):
+                    if kind == LINE_THREAT_FIVE:
+                        move = cells[0]
+                        break
+                    if kind == LINE_THREAT_OPEN_FOUR:
+                        open_fours += cells
+                    elif kind == LINE_THREAT_FOUR:
+                        fours += cells
+            if move is None and last_move is not None:
+                for kind, cells in threats_at(last_move, 1 - color):
+                    if kind == LINE_THREAT_FIVE:
+                        move = cells[0]
+                        break
+                    if kind == LINE_THREAT_DEFENSE:
+                        defenses += cells
+            if move is None:
+                tactical = open_fours or defenses or fours
+                if tactical and rnd.random() < MCTS_ROLLOUT_THREAT_RATE:
+                    move = rnd.choice(tactical)
+                else:
+                    move = rnd.choice(tuple(candidates))
+            engine.push_chess(move, chess)
+            pushed += 1
+            if engine.check_win(move):
+                value = 1.0 if chess == BOARD_MAP_BLACK_CHESS else 0.0
+                break
+            prev_move, last_move = last_move, move
+            chess = -chess
+        if value is None:
+            value = 1.0 / (1.0 + math.exp(-engine.score / MCTS_SCORE_SCALE))
+        for _ in range(pushed):
+            engine.pop_chess()
+        return value
+
+    def principal_depth(self):
+        """
+        从树根沿访问最多的子节点能走几步
+        """
+        depth, node = 0, self.tree.best_child(0)
+        while node >= 0:
+            depth += 1
+            node = self.tree.best_child(node)
+        return depth
+
+    def predicted_reply(self, chess):
+        """
+        当前局面(轮到chess)在树里时，访问最多的子节点的着法，否则返回None
+        """
+        node = self.find_node(chess)
+        if node < 0:
+            return None
+        child = self.tree.best_child(node)
+        return self.engine.decode_move(self.tree.moves[child]) if child >= 0 else None
+
+class SearchStats():
+    """
+    一次get_best_move的搜索统计，由ChessEngine.enable_stats打开后收集\n
+    并行搜索时进程池里的节点只计入总节点数和每轮节点数，分层、截断、耗时只统计主进程
+    """
+    def __init__(self):
+        self.best_move = None
+        self.depth_reached = -1
+        self.nodes = 0
+        self.time = 0.0
+        self.nodes_per_ply = [0] * (MAX_PLY + 1) # 每层(距根节点的步数)访问的节点数
+        self.iterations = [] # 迭代加深每一轮：(深度, 节点数, 耗时)，超时作废的那一轮也记录
+        self.interior_nodes = 0 # 生成了着法的内部节点数
+        self.moves_generated = 0 # 内部节点生成的候选着法总数
+        self.cutoffs = 0 # beta截断次数
+        self.first_move_cutoffs = 0 # 排序后第一个着法就截断的次数
+        self.tt_probes = 0
+        self.tt_hits = 0
+        # 各部分耗时(秒)，分数更新包括push_chess/pop_chess和排序时的score_gain，着法生成不含排序里score_gain的时间
+        self.time_move_generation = 0.0
+        self.time_update_score = 0.0
+        self.time_check_win = 0.0
+        self.update_score_calls = 0
+        self.check_win_calls = 0
+
+    def cutoff_rate(self):
+        return self.cutoffs / self.interior_nodes if self.interior_nodes else 0.0
+
+    def first_move_cutoff_ratio(self):
+        return self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0
+
+    def branching_factor(self):
+        """
+        内部节点的平均候选着法数
+        """
+        return self.moves_generated / self.interior_nodes if self.interior_nodes else 0.0
+
+    def effective_branching_factor(self):
+        """
+        最后两轮完整搜索的节点数之比，反映剪枝后每加深一层的实际代价
+        """
+        completed = [nodes for depth, nodes, _ in self.iterations if depth <= self.depth_reached]
+        if len(completed) < 2 or completed[-2] == 0:
+            return 0.0
+        return completed[-1] / completed[-2]
+
+    def tt_hit_rate(self):
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+
+    def to_dict(self):
+        """
+        转成可以直接写成JSON的字典
+        """
+        last_ply = max((ply for ply, nodes in enumerate(self.nodes_per_ply) if nodes), default=0)
+        return {
+            'best_move': list(self.best_move) if self.best_move is not None else None,
+            'depth_reached': self.depth_reached,
+            'nodes': self.nodes,
+            'time': round(self.time, 4),
+            'nps': round(self.nodes / self.time) if self.time > 0 else 0,
+            'nodes_per_ply': self.nodes_per_ply[:last_ply + 1],
+            'iterations': [[depth, nodes, round(elapsed_time, 4)] for depth, nodes, elapsed_time in self.iterations],
+            'cutoff_rate': round(self.cutoff_rate(), 4),
+            'first_move_cutoff_ratio': round(self.first_move_cutoff_ratio(), 4),
+            'branching_factor': round(self.branching_factor(), 2),
+            'effective_branching_factor': round(self.effective_branching_factor(), 2),
+            'tt_hit_rate': round(self.tt_hit_rate(), 4),
+            'time_move_generation': round(self.time_move_generation, 4),
+            'time_update_score': round(self.time_update_score, 4),
+            'time_check_win': round(self.time_check_win, 4),
+        }
+
+    def __str__(self):
+        return ('move {} depth {} nodes {} in {:.3f}s ({:.0f} nps)  cutoff {:.1%} first-move {:.1%}  '
+                'bf {:.1f} ebf {:.1f}  tt hit {:.1%}  movegen {:.3f}s score {:.3f}s win {:.3f}s').format(
+            self.best_move, self.depth_reached, self.nodes, self.time, self.nodes / self.time if self.time > 0 else 0,
+            self.cutoff_rate(), self.first_move_cutoff_ratio(), self.branching_factor(), self.effective_branching_factor(),
+            self.tt_hit_rate(), self.time_move_generation, self.time_update_score, self.time_check_win)
+
+class ChessEngine():
+    """
+    不依赖pygame的五子棋引擎，每个实例有自己的棋盘、分数、置换表和搜索状态，一个进程里可以同时跑很多局\n
+    对局接口：make/unmake/legal_moves/is_terminal/best_move，白棋先行
+    """
+    def __init__(self, tt_size_mb=TT_SIZE_MB, neighbor_radius=NEIGHBOR_RADIUS, max_width=None, workers=1, chess_scores=None, collect_stats=False, book_file=None, cache_file=None, threat_search=True, quiescence_depth=QUIESCENCE_MAX_DEPTH,
+                 pvs=False, aspiration_window=None, lmr=False, board_size=BOARD_LINE_NUMS, search=SEARCH_ALPHABETA, mcts_policy=MCTS_POLICY_PUCT, mcts_playouts=None,
+                 evaluator=EVALUATOR_PATTERNS):
+        if neighbor_radius not in (1, 2):
+            raise ValueError("neighbor_radius must be 1 or 2")
+        if search not in (SEARCH_ALPHABETA, SEARCH_MCTS):
+            raise ValueError("unknown search: {}".format(search))
+        if evaluator not in (EVALUATOR_PATTERNS, EVALUATOR_RUNS):
+            raise ValueError("unknown evaluator: {}".format(evaluator))
+        if not 0 <= quiescence_depth <= QUIESCENCE_MAX_DEPTH:
+            # path_moves按QUIESCENCE_MAX_DEPTH分配，更深的静态搜索放不下，minimax里的保护条件会让静态搜索整个不做
+            raise ValueError("quiescence_depth must be between 0 and {}".format(QUIESCENCE_MAX_DEPTH))
+        if chess_scores is not None and not set(chess_scores) <= set(CHESS_SCORES):
+            raise ValueError("unknown chess_scores keys: {}".format(sorted(set(chess_scores) - set(CHESS_SCORES))))
+        if book_file is not None and board_size != BOARD_LINE_NUMS:
+            raise ValueError("opening books are only available for {0} x {0} boards".format(BOARD_LINE_NUMS))
+        self.chess_scores = dict(CHESS_SCORES, **(chess_scores or {})) # 棋型分数权重
+        self.board_size = board_size # 棋盘线数，SparseChessEngine为None(不限大小)
+        # 对局状态：轮到哪一方、胜者、落子记录[(index, 落子前的胜者)]
+        self.turn = BOARD_MAP_WHITE_CHESS
+        self.winner = None
+        self.move_history = []
+        self.undo_stack = [] # push_chess压入的恢复记录：(index, color, [落子前总分, 4条线的分数], 新加入的候选着法, 落子前是否为候选着法)
+        self.tt_size_mb = tt_size_mb
+        self.neighbor_radius = neighbor_radius
+        # 并行搜索：workers > 1时根节点着法分给进程池搜索，每个进程有自己的棋盘和置换表
+        self.workers = workers
+        self.search_pool = None
+        self.zobrist_hash = 0 # 当前局面的zobrist哈希，随落子/提子增量更新
+        self.transposition_table = TranspositionTable(tt_size_mb)
+        # 候选着法边界：neighbor_counts记录每个位置周围radius格内的棋子数，计数大于0的空位就是候选着法
+        # 落子/提子时只更新周围(2 * radius + 1)^2个位置，生成着法的代价只和候选数有关
+        self.candidate_moves = set()
+        self.init_board()
+        # 着法排序：每层两个killer着法，以及按颜色区分的history表{着法: 分数}
+        self.killer_moves = [[None, None] for _ in range(MAX_PLY)]
+        self.history_table = [{}, {}]
+        self.max_width = max_width # 每个节点最多搜索的候选着法数，None表示不限制
+        self.quiescence_depth = quiescence_depth # 叶子节点的静态搜索深度，0表示不做静态搜索
+        self.path_moves = [None] * (MAX_PLY + QUIESCENCE_MAX_DEPTH + 2) # path_moves[ply]：搜索路径上走到第ply层的着法
+        # 搜索窗口和减层，都可以单独开关：
+        # pvs: 第一个着法之后用零窗口试搜，可能更好时再全窗口重搜
+        # aspiration_window: 迭代加深时根节点以上一轮分数为中心、该值为半宽的窗口搜索，None表示不用
+        # lmr: 排序靠后的安静着法先减层搜索，可能更好时再按原深度重搜
+        self.pvs = pvs
+        self.aspiration_window = aspiration_window
+        self.lmr = lmr
+        self.opening_book = load_opening_book(book_file) if book_file is not None else None # 开局库，get_best_move先查库再搜索
+        self.threat_solver = ThreatSolver(self) if threat_search else None # 搜索前先找双方的冲四活三必胜
+        # search=SEARCH_MCTS时get_best_move查库、威胁搜索之后用蒙特卡洛树搜索代替迭代加深，mcts_playouts为每步的模拟次数上限，None表示只按时间
+        self.mcts = MonteCarloTreeSearch(self, mcts_policy) if search == SEARCH_MCTS else None
+        self.mcts_playouts = mcts_playouts
+        # 磁盘局面缓存：get_best_move先查缓存，搜完写回；按影响搜索结果的配置区分，创建时把最近的记录载入置换表
+        self.position_cache = None
+        if cache_file is not None:
+            config = (sorted(self.chess_scores.items()), neighbor_radius, max_width, threat_search, quiescence_depth, pvs, aspiration_window, lmr, board_size)
+            if search != SEARCH_ALPHABETA:
+                config += (search, mcts_policy) # alpha-beta的配置不变，已有的缓存仍然可用
+            if evaluator != EVALUATOR_RUNS:
+                config += (evaluator,)
+            config = repr(config).encode()
+            self.position_cache = load_position_cache(cache_file, int.from_bytes(hashlib.blake2b(config, digest_size=8).digest(), 'little'))
+            self.position_cache.warm_load(self.transposition_table)
+        # 线分数：默认按带空位的棋型计分，evaluator=EVALUATOR_RUNS时换成只数连续棋子的calculate_run_line_score
+        self.evaluator = evaluator
+        if evaluator == EVALUATOR_RUNS:
+            self.segment_score_table = load_segment_score_table(self.checkup_score)
+            self.calculate_line_score = self.calculate_run_line_score
+        else:
+            self.pattern_score_table, self.pattern_line_scores = load_pattern_score_table(self.checkup_score)
+        self.score = self.evaluate_board_score_total()
+        self.depth = MAX_SEARCH_DEPTH # 迭代加深的最大深度
+        self.time_budget = SEARCH_TIME_BUDGET # 每步思考时间，None表示不限时，搜满self.depth
+        # 搜索状态：节点计数、截止时间、是否因为超时中止
+        self.nodes = 0
+        self.search_deadline = None
+        self.search_aborted = False
+        self.search_stop_event = None # 外部设置的停止信号(threading/multiprocessing的Event)，用于中止后台思考
+        self.search_depth_reached = -1 # 最近一次get_best_move完整搜完的深度
+        self.search_score = None # 最近一次get_best_move完整搜完那一轮的分数
+        # 搜索统计：关闭时搜索代码里没有任何统计开销，打开时用带统计的包装方法覆盖实例上的同名方法
+        self.search_stats = None # 最近一次get_best_move的SearchStats，没打开统计时为None
+        self.stats_log = None # 每步的统计摘要写到这里(文件对象)，None表示不输出
+        if collect_stats:
+            self.enable_stats()
+
+    def init_board(self):
+        """
+        按self.board_size建空棋盘：棋子、位棋盘、zobrist随机数、候选着法计数和每条线的分数，同一线数的查表数据各实例共用
+        """
+        geometry = get_board_geometry(self.board_size)
+        size = self.board_size
+        self.board_map = [[BOARD_MAP_NONE] * size for _ in range(size)] # 棋盘上存储每个位置棋的内容的map
+        self.bitboard = BitBoard(geometry) # 和board_map同步更新，用于连五检查和按线计算分数
+        self.zobrist_table = geometry.zobrist_table
+        self.cell_lines, self.line_lengths = geometry.cell_lines, geometry.line_lengths
+        self.neighbor_indexes = geometry.get_neighbor_indexes(self.neighbor_radius)
+        self.neighbor_counts = [[0] * size for _ in range(size)]
+        # 每条线的分数，line_scores[direction][line]，direction同位棋盘LINE_ROW..LINE_BACK_OBLIQUE
+        self.line_scores = [[0] * len(self.line_lengths[direction]) for direction in range(4)]
+        self.center = (size // 2, size // 2) # 空棋盘的第一手
+
+    def stone_at(self, index):
+        """
+        index处的棋子，BOARD_MAP_*
+        """
+        return self.board_map[index[0]][index[1]]
+
+    def encode_move(self, move):
+        """
+        着法编成非负整数，用于置换表和局面缓存
+        """
+        return move[0] * self.board_size + move[1]
+
+    def decode_move(self, move_code):
+        return divmod(move_code, self.board_size)
+
+    # ====对局接口==== #
+    def make(self, index):
+        """
+        轮到的一方在index落子，更新分数并判断胜负
+        """
+        chess = self.turn
+        self.push_chess(index, chess)
+        self.move_history.append((index, self.winner))
+        if self.winner is None and self.check_win(index):
+            self.winner = chess
+        self.turn = -chess
+
+    def unmake(self):
+        """
+        撤销最后一步
+        """
+        index, self.winner = self.move_history.pop()
+        self.turn = self.stone_at(index)
+        self.pop_chess()
+
+    def legal_moves(self):
+        """
+        所有能落子的空位，对局结束后为空
+        """
+        if self.winner is not None:
+            return []
+        return [(i, j) for i in range(self.board_size) for j in range(self.board_size) if self.board_map[i][j] == BOARD_MAP_NONE]
+
+    def is_terminal(self):
+        return self.winner is not None or len(self.move_history) == self.board_size * self.board_size
+
+    def best_move(self, time_budget=None, depth=None):
+        """
+        为轮到的一方搜索最佳着法；空棋盘下天元(self.center)，对局结束返回None
+        """
+        if self.is_terminal():
+            return None
+        if not self.move_history:
+            return self.center
+        return self.get_best_move(time_budget, depth, self.turn)
+
+    def best_move_with_stats(self, time_budget=None, depth=None):
+        """
+        和best_move一样搜索，返回(着法, SearchStats)，没打开统计时只在这一步临时打开
+        """
+        stats_enabled = self.stats_enabled()
+        if not stats_enabled:
+            self.enable_stats()
+        self.search_stats = SearchStats() # 空棋盘或对局结束时不会搜索，也返回一份空统计
+        try:
+            move = self.best_move(time_budget, depth)
+        finally:
+            if not stats_enabled:
+                self.disable_stats()
+        return move, self.search_stats
+
+    # ====搜索统计==== #
+    def stats_enabled(self):
+        return 'minimax' in self.__dict__
+
+    def enable_stats(self, log=None):
+        """
+        打开搜索统计：用带计数和计时的包装方法覆盖实例上的搜索方法，类上的原方法不变\n
+        log: 每次get_best_move后写入一行统计摘要的文件对象，None表示保持原来的设置
+        """
+        if log is not None:
+            self.stats_log = log
+        if self.stats_enabled():
+            return
+        self.search_stats = SearchStats()
+        get_best_move, search_root, search_root_parallel = self.get_best_move, self.search_root, self.search_root_parallel
+        minimax, order_moves, get_available_moves = self.minimax, self.order_moves, self.get_available_moves
+        record_cutoff, check_win = self.record_cutoff, self.check_win
+        push_chess, pop_chess, score_gain = self.push_chess, self.pop_chess, self.score_gain
+        probe = self.transposition_table.probe
+        first_moves = [None] * (MAX_PLY + 1) # 每层排序后的第一个着法，用于统计第一个着法就截断的比例
+        perf_counter = time.perf_counter
+
+        def profiled_get_best_move(time_budget=None, depth=None, chess=BOARD_MAP_BLACK_CHESS):
+            stats = self.search_stats = SearchStats()
+            start_time = perf_counter()
+            move = get_best_move(time_budget, depth, chess)
+            stats.time = perf_counter() - start_time
+            stats.nodes = self.nodes
+            stats.depth_reached = self.search_depth_reached
+            stats.best_move = move
+            if self.stats_log is not None:
+                self.stats_log.write(str(stats) + '\n')
+            return move
+
+        def profiled_search_root(depth, root_moves, chess, alpha=-math.inf, beta=math.inf, search_root=search_root):
+            nodes, start_time = self.nodes, perf_counter()
+            result = search_root(depth, root_moves, chess, alpha, beta)
+            self.search_stats.iterations.append((depth, self.nodes - nodes, perf_counter() - start_time))
+            return result
+
+        def profiled_minimax(depth, alpha, beta, maximizing_player, index, ply=1):
+            if ply <= MAX_PLY:
+                self.search_stats.nodes_per_ply[ply] += 1
+            return minimax(depth, alpha, beta, maximizing_player, index, ply)
+
+        def profiled_get_available_moves():
+            stats = self.search_stats
+            start_time = perf_counter()
+            moves = get_available_moves()
+            stats.time_move_generation += perf_counter() - start_time
+            return moves
+
+        def profiled_order_moves(moves, chess, depth, ply, tt_move):
+            stats = self.search_stats
+            start_time, score_time = perf_counter(), stats.time_update_score
+            ordered_moves = order_moves(moves, chess, depth, ply, tt_move)
+            # 排序时试落子的分数计算算在score_gain里，这里扣掉
+            stats.time_move_generation += perf_counter() - start_time - (stats.time_update_score - score_time)
+            if ply > 0:
+                stats.interior_nodes += 1
+                stats.moves_generated += len(moves)
+            if ply <= MAX_PLY:
+                first_moves[ply] = ordered_moves[0] if ordered_moves else None
+            return ordered_moves
+
+        def profiled_record_cutoff(move, chess, depth, ply):
+            stats = self.search_stats
+            stats.cutoffs += 1
+            if ply <= MAX_PLY and first_moves[ply] == move:
+                stats.first_move_cutoffs += 1
+            record_cutoff(move, chess, depth, ply)
+
+        def profiled_push_chess(index, chess):
+            stats = self.search_stats
+            start_time = perf_counter()
+            score = push_chess(index, chess)
+            stats.time_update_score += perf_counter() - start_time
+            stats.update_score_calls += 1
+            return score
+
+        def profiled_pop_chess():
+            stats = self.search_stats
+            start_time = perf_counter()
+            pop_chess()
+            stats.time_update_score += perf_counter() - start_time
+
+        def profiled_score_gain(index, color):
+            stats = self.search_stats
+            start_time = perf_counter()
+            gain = score_gain(index, color)
+            stats.time_update_score += perf_counter() - start_time
+            stats.update_score_calls += 1
+            return gain
+
+        def profiled_check_win(index):
+            stats = self.search_stats
+            start_time = perf_counter()
+            win = check_win(index)
+            stats.time_check_win += perf_counter() - start_time
+            stats.check_win_calls += 1
+            return win
+
+        def profiled_probe(key):
+            stats = self.search_stats
+            entry = probe(key)
+            stats.tt_probes += 1
+            if entry is not None:
+                stats.tt_hits += 1
+            return entry
+
+        self.get_best_move = profiled_get_best_move
+        self.search_root = profiled_search_root
+        self.search_root_parallel = lambda depth, root_moves, chess: profiled_search_root(depth, root_moves, chess, search_root=lambda depth, root_moves, chess, alpha, beta: search_root_parallel(depth, root_moves, chess))
+        self.minimax = profiled_minimax
+        self.get_available_moves = profiled_get_available_moves
+        self.order_moves = profiled_order_moves
+        self.record_cutoff = profiled_record_cutoff
+        self.push_chess = profiled_push_chess
+        self.pop_chess = profiled_pop_chess
+        self.score_gain = profiled_score_gain
+        self.check_win = profiled_check_win
+        self.transposition_table.probe = profiled_probe
+
+    def disable_stats(self):
+        """
+        关闭搜索统计，恢复类上的原方法，search_stats保留最后一次的结果
+        """
+        for name in STATS_WRAPPED_METHODS:
+            self.__dict__.pop(name, None)
+        self.transposition_table.__dict__.pop('probe', None)
+
+    # ====搜索==== #
+    def get_current_score(self):
+        return self.score
+
+    def place_chess(self, index, chess):
+        """
+        落子，同时更新zobrist哈希（不更新分数）
+        """
+        i, j = index
+        color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+        self.board_map[i][j] = chess
+        self.bitboard.place(index, color)
+        self.zobrist_hash ^= self.zobrist_table[i][j][color]
+        board_map, neighbor_counts, candidate_moves = self.board_map, self.neighbor_counts, self.candidate_moves
+        for neighbor in self.neighbor_indexes[i][j]:
+            neighbor_counts[neighbor[0]][neighbor[1]] += 1
+            if board_map[neighbor[0]][neighbor[1]] == BOARD_MAP_NONE:
+                candidate_moves.add(neighbor)
+        candidate_moves.discard(index)
+
+    def remove_chess(self, index):
+        """
+        提子，同时更新zobrist哈希（不更新分数）
+        """
+        i, j = index
+        color = 0 if self.board_map[i][j] == BOARD_MAP_BLACK_CHESS else 1
+        self.zobrist_hash ^= self.zobrist_table[i][j][color]
+        self.bitboard.remove(index, color)
+        self.board_map[i][j] = BOARD_MAP_NONE
+        neighbor_counts, candidate_moves = self.neighbor_counts, self.candidate_moves
+        for neighbor in self.neighbor_indexes[i][j]:
+            neighbor_counts[neighbor[0]][neighbor[1]] -= 1
+            if neighbor_counts[neighbor[0]][neighbor[1]] == 0:
+                candidate_moves.discard(neighbor)
+        if neighbor_counts[i][j] > 0:
+            candidate_moves.add(index)
+
+    def place_stone(self, index, color):
+        """
+        威胁空间搜索用的试落子：只更新棋子、位棋盘和哈希，不更新分数和候选着法，remove_stone恢复\n
+        color 0：黑棋，1：白棋
+        """
+        i, j = index
+        self.board_map[i][j] = BOARD_MAP_BLACK_CHESS if color == 0 else BOARD_MAP_WHITE_CHESS
+        self.bitboard.place(index, color)
+        self.zobrist_hash ^= self.zobrist_table[i][j][color]
+
+    def remove_stone(self, index, color):
+        i, j = index
+        self.board_map[i][j] = BOARD_MAP_NONE
+        self.bitboard.remove(index, color)
+        self.zobrist_hash ^= self.zobrist_table[i][j][color]
+
+    def push_chess(self, index, chess):
+        """
+        搜索用的落子：等同place_chess + update_score_map_by_index\n
+        把落子前的4条线分数、总分和新加入的候选着法压入undo栈，pop_chess直接恢复，不用重算线分数
+        """
+        i, j = index
+        color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+        board_map, neighbor_counts, candidate_moves = self.board_map, self.neighbor_counts, self.candidate_moves
+        board_map[i][j] = chess
+        self.zobrist_hash ^= self.zobrist_table[i][j][color]
+        added_moves = []
+        for neighbor in self.neighbor_indexes[i][j]:
+            ni, nj = neighbor
+            neighbor_counts[ni][nj] += 1
+            if board_map[ni][nj] == BOARD_MAP_NONE and neighbor not in candidate_moves:
+                candidate_moves.add(neighbor)
+                added_moves.append(neighbor)
+        was_candidate = index in candidate_moves
+        candidate_moves.discard(index)
+        # 位棋盘和4条线的分数一起更新
+        own_masks = self.bitboard.masks[color]
+        black_masks, white_masks = self.bitboard.masks
+        line_scores, calculate_line_score, line_lengths = self.line_scores, self.calculate_line_score, self.line_lengths
+        saved_scores = [self.score]
+        score = self.score
+        direction = 0
+        for line, pos in self.cell_lines[i][j]:
+            own_masks[direction][line] |= 1 << pos
+            old_score = line_scores[direction][line]
+            saved_scores.append(old_score)
+            line_score = calculate_line_score(black_masks[direction][line], white_masks[direction][line], line_lengths[direction][line])
+            line_scores[direction][line] = line_score
+            score += line_score - old_score
+            direction += 1
+        self.score = score
+        self.undo_stack.append((index, color, saved_scores, added_moves, was_candidate))
+        return score
+
+    def pop_chess(self):
+        """
+        撤销最近一次push_chess：位棋盘、哈希、候选着法和分数都按undo栈里的记录直接恢复
+        """
+        index, color, saved_scores, added_moves, was_candidate = self.undo_stack.pop()
+        i, j = index
+        self.board_map[i][j] = BOARD_MAP_NONE
+        self.zobrist_hash ^= self.zobrist_table[i][j][color]
+        own_masks, line_scores = self.bitboard.masks[color], self.line_scores
+        self.score = saved_scores[0]
+        direction = 0
+        for line, pos in self.cell_lines[i][j]:
+            own_masks[direction][line] &= ~(1 << pos)
+            line_scores[direction][line] = saved_scores[direction + 1]
+            direction += 1
+        neighbor_counts = self.neighbor_counts
+        for ni, nj in self.neighbor_indexes[i][j]:
+            neighbor_counts[ni][nj] -= 1
+        self.candidate_moves.difference_update(added_moves)
+        if was_candidate:
+            self.candidate_moves.add(index)
+
+    def score_gain(self, index, color):
+        """
+        在index试落color颜色的一子时总分的变化，不改动棋盘和线分数
+        """
+        black_masks, white_masks = self.bitboard.masks
+        own_masks = black_masks if color == 0 else white_masks
+        line_scores, calculate_line_score, line_lengths = self.line_scores, self.calculate_line_score, self.line_lengths
+        gain = 0
+        direction = 0
+        for line, pos in self.cell_lines[index[0]][index[1]]:
+            bit = 1 << pos
+            own_masks[direction][line] |= bit
+            gain += calculate_line_score(black_masks[direction][line], white_masks[direction][line], line_lengths[direction][line]) - line_scores[direction][line]
+            own_masks[direction][line] ^= bit
+            direction += 1
+        return gain
+
+    def evaluate_board_score_total(self):
+        """
+        统计当前棋盘分数，不更新
+        """
+        total_score = 0
+        for scores in self.line_scores:
+            total_score += sum(scores)
+        # print(total_score) # debug log
+        return total_score
+    
+    def update_score_map_by_index(self, index):
+        """
+        通过落子位置更新棋盘评估分数，只需要重新计算经过该位置的4条线
+        index: 落子位置
+        """
+        black_masks, white_masks = self.bitboard.masks
+        for direction, (line, _) in enumerate(self.cell_lines[index[0]][index[1]]):
+            line_score = self.calculate_line_score(black_masks[direction][line], white_masks[direction][line], self.line_lengths[direction][line])
+            self.score += line_score - self.line_scores[direction][line]
+            self.line_scores[direction][line] = line_score
+        return self.score
+    
+    def calculate_score(self, i, j, direction):
+        """
+        计算从(i, j)出发沿direction方向的一整条线的分数，线上的棋子从位棋盘中取出
+        """
+        if direction[0] == 0:
+            line_direction, line = LINE_ROW, i
+        elif direction[1] == 0:
+            line_direction, line = LINE_COL, j
+        elif direction[0] == -direction[1]:
+            line_direction, line = LINE_OBLIQUE, i + j
+        else:
+            line_direction, line = LINE_BACK_OBLIQUE, j - i + self.board_size - 1
+        return self.calculate_line_score(*self.bitboard.get_line(line_direction, line))
+
+    def calculate_line_score(self, black_mask, white_mask, length):
+        """
+        black_mask, white_mask: 这条线上黑棋、白棋的位掩码\n
+        length: 线长\n
+        按带空位的棋型计分(pattern_line_score)，整条线的分数按(黑棋, 白棋, 线长)缓存，斜向的分数按线长等比缩减
+        """
+        if length < 5:
+            return 0
+        key = (black_mask << length | white_mask) << 16 | length
+        line_scores = self.pattern_line_scores
+        score = line_scores.get(key)
+        if score is None:
+            score = pattern_line_score(self.pattern_score_table, self.checkup_score, black_mask, white_mask, length)
+            if len(line_scores) >= PATTERN_CACHE_SIZE:
+                line_scores.clear()
+            line_scores[key] = score
+        if length != self.board_size:
+            score = score * length // self.board_size
+        return score
+
+    def calculate_run_line_score(self, black_mask, white_mask, length):
+        """
+        evaluator=EVALUATOR_RUNS时的calculate_line_score，参数相同\n
+        按空位把线切成连续棋子段，每段查一次分数表，超出分数表的长段(19、20路棋盘上才会有)用segment_score现算
+        """
+        if length < 5:
+            return 0 # 总长小于5，必不可能连成5子，里面的所有子都不计分数
+        table = self.segment_score_table
+        occupied = black_mask | white_mask
+        segment_starts = occupied & ~(occupied << 1)
+        segment_ends = occupied & ~(occupied >> 1)
+        score = 0
+        line_end_bit = 1 << length
+        while segment_starts:
+            start_bit = segment_starts & -segment_starts
+            end_bit = segment_ends & -segment_ends
+            segment_starts ^= start_bit
+            segment_ends ^= end_bit
+            # 段内黑棋掩码加上段长标记位，移到最低位，再拼上两端是否为空位
+            segment = ((black_mask & ((end_bit << 1) - start_bit)) | (end_bit << 1)) >> (start_bit.bit_length() - 1)
+            try:
+                score += table[(segment << 2) | ((start_bit != 1) << 1) | ((end_bit << 1) != line_end_bit)]
+            except IndexError:
+                segment_length = segment.bit_length() - 1
+                score += segment_score(self.checkup_score, segment ^ (1 << segment_length), segment_length, start_bit != 1, (end_bit << 1) != line_end_bit)
+        if length != self.board_size:
+            # 斜向的分数，根据斜向长度，等比缩减
+            score = score * length // self.board_size
+        return score
+
+    def checkup_score(self, is_black_chess:bool, nums:int, block_chess_nums:int):
+        """
+        is_black_chess: 是否是黑棋\n
+        nums: 统计的连续棋子数目\n
+        block_chess_nums: 该连续棋子两端是否有阻拦，阻拦的个数
+        """
+        chess_scores = self.chess_scores
+        score = 0
+        if nums >= 5:
+            score = chess_scores['five'] # 5子 或以上
+        elif nums == 4:
+            if block_chess_nums == 0:
+                score = chess_scores['live_four'] # 活4
+            elif block_chess_nums == 1:
+                score = chess_scores['rush_four'] # 单4
+            elif block_chess_nums == 2:
+                score = 0 # 死4
+        elif nums == 3:
+            if block_chess_nums == 0:
+                score = chess_scores['live_three'] # 活3
+            elif block_chess_nums == 1:
+                score = chess_scores['sleep_three'] # 单3
+            elif block_chess_nums == 2:
+                score = 0 # 死3
+        elif nums == 2:
+            if block_chess_nums == 0:
+                score = chess_scores['live_two'] # 活2
+            elif block_chess_nums == 1:
+                score = chess_scores['sleep_two'] # 单2
+            elif block_chess_nums == 2:
+                score = 0 # 死2
+        elif nums == 1:
+            if block_chess_nums == 0:
+                score = chess_scores['live_one'] # 活1
+            elif block_chess_nums == 1:
+                score = chess_scores['sleep_one'] # 单1
+            elif block_chess_nums == 2:
+                score = 0
+        else:
+            score = 0
+        return score if is_black_chess else -1 * score
+        
+
+    def make_score_max(self):
+        """
+        打印当前分数，以及黑棋在候选着法里落一子能达到的最高分和位置，只试候选着法，不扫全盘
+        """
+        score_now = self.get_current_score()
+        max_score = score_now
+        max_index = None
+        for move in sorted(self.candidate_moves):
+            # 遍历下一个能下棋的位置
+            score_current = score_now + self.score_gain(move, 0)
+            if score_current > max_score:
+                max_score = score_current
+                max_index = move
+        print('score_now:' + str(score_now))
+        print('score_next_max:' + str(max_score))
+        print(max_index)
+
+    def get_best_move(self, time_budget=None, depth=None, chess=BOARD_MAP_BLACK_CHESS):
+        """
+        迭代加深搜索chess一方(默认黑棋)的最佳着法，黑棋取分数最大，白棋取分数最小\n
+        time_budget: 思考时间(秒)，默认self.time_budget；为None时不限时，搜满depth层\n
+        depth: 最大搜索深度，默认self.depth\n
+        超时后放弃正在进行的那一轮，返回最后一轮完整搜索的结果；开局库里有的局面直接返回库着法，不搜索\n
+        搜索前先做威胁空间搜索：己方有冲四活三必胜时直接走，对方有必胜时只在能化解的着法里搜，限时搜索时最多用THREAT_TIME_SHARE的时间\n
+        search=SEARCH_MCTS时之后用search_mcts代替迭代加深，不用depth，也不写局面缓存
+        """
+        time_budget = self.time_budget if time_budget is None else time_budget
+        max_depth = self.depth if depth is None else depth
+        start_time = time.perf_counter()
+        self.transposition_table.new_search()
+        self.new_search_ordering()
+        self.nodes = 0
+        self.search_aborted = False
+        self.search_deadline = None # 第一轮必须搜完，保证总有着法可以返回(外部停止信号除外)
+        self.search_depth_reached = -1
+        self.search_score = None
+        if self.opening_book is not None:
+            book_move = self.opening_book.lookup(self.bitboard, self.board_map, chess)
+            if book_move is not None:
+                return book_move
+        cached_move = None
+        if self.position_cache is not None:
+            root_key = self.zobrist_hash ^ ZOBRIST_BLACK_TURN if chess == BOARD_MAP_BLACK_CHESS else self.zobrist_hash
+            entry = self.position_cache.lookup(root_key)
+            if entry is not None:
+                cached_depth, cached_score, cached_move_code = entry
+                cached_move = self.decode_move(cached_move_code)
+                if self.stone_at(cached_move) != BOARD_MAP_NONE:
+                    cached_move = None
+                elif cached_depth >= max_depth:
+                    # 缓存里的结果已经够深，直接使用
+                    self.search_depth_reached, self.search_score = cached_depth, cached_score
+                    return cached_move
+        self.path_moves[0] = self.move_history[-1][0] if self.move_history else None # 对方的上一步，静态搜索要用
+        # 缓存里不够深的着法仍然放在第一个搜
+        root_moves = self.order_moves(self.get_available_moves(), chess, max_depth + 1, 0, cached_move)
+        restricted = False
+        if self.threat_solver is not None:
+            self.threat_solver.deadline = None if time_budget is None else start_time + time_budget * THREAT_TIME_SHARE
+            win_move = self.threat_solver.find_win(chess)
+            if win_move is not None:
+                return win_move
+            if self.threat_solver.find_win(-chess) is not None:
+                # 对方有必胜，只搜能化解的着法；化解不了时照常搜索
+                defenses = self.threat_solver.find_defenses(chess)
+                if defenses:
+                    root_moves = [move for move in root_moves if move in defenses] + [move for move in defenses if move not in root_moves]
+                    restricted = True
+        best_move = None
+        if not root_moves:
+            return best_move
+        if self.mcts is not None:
+            return self.search_mcts(root_moves, chess, time_budget, restricted)
+        for search_depth in range(max_depth + 1):
+            if self.workers > 1 and search_depth >= PARALLEL_MIN_DEPTH:
+                result = self.search_root_parallel(search_depth, root_moves, chess)
+            elif self.aspiration_window is not None and self.search_score is not None:
+                alpha, beta = self.search_score - self.aspiration_window, self.search_score + self.aspiration_window
+                result = self.search_root(search_depth, root_moves, chess, alpha, beta)
+                if result is not None and not alpha < result[1] < beta:
+                    result = self.search_root(search_depth, root_moves, chess) # 落在窗口外，全窗口重搜
+            else:
+                result = self.search_root(search_depth, root_moves, chess)
+            if result is None:
+                break # 超时，这一轮结果作废
+            best_move, best_eval = result
+            self.search_depth_reached, self.search_score = search_depth, best_eval
+            # 上一轮的最佳着法放在最前面，其余保持原有顺序
+            root_moves.remove(best_move)
+            root_moves.insert(0, best_move)
+            if time_budget is not None:
+                elapsed_time = time.perf_counter() - start_time
+                if elapsed_time * 2 >= time_budget:
+                    break # 剩下的时间大概率不够再搜完一轮
+                self.search_deadline = start_time + time_budget
+        self.search_deadline = None
+        self.search_aborted = False
+        if self.position_cache is not None and self.search_depth_reached >= POSITION_CACHE_MIN_DEPTH:
+            self.position_cache.store(root_key, self.search_depth_reached, self.search_score, self.encode_move(best_move))
+        # print(f"Elapsed time: {time.perf_counter() - start_time} seconds, depth: {search_depth}, nodes: {self.nodes}")
+        # print(best_move)
+        # print("best score:" + str(best_eval))
+        return best_move
+
+    def search_root_parallel(self, depth, root_moves, chess):
+        """
+        并行搜索一轮：第一个着法在主进程里搜出分数，其余着法以这个分数为窗口边界分给进程池\n
+        比这个分数好的着法都是精确值，按root_moves的顺序取第一个最好的，和串行搜索选出的着法相同
+        """
+        maximizing_player = chess == BOARD_MAP_BLACK_CHESS
+        first_move = root_moves[0]
+        self.push_chess(first_move, chess)
+        first_eval = self.minimax(depth, -math.inf, math.inf, not maximizing_player, first_move)
+        self.pop_chess()
+        if self.search_aborted:
+            return None
+        if len(root_moves) == 1:
+            return first_move, first_eval
+        if self.search_pool is None:
+            self.search_pool = multiprocessing.Pool(self.workers, initializer=_init_search_worker, initargs=(self.tt_size_mb, self.neighbor_radius, self.max_width, self.chess_scores, self.quiescence_depth, self.pvs, self.lmr, self.board_size, self.evaluator))
+        stones = self.get_stones()
+        time_left = None if self.search_deadline is None else self.search_deadline - time.perf_counter()
+        tasks = [(stones, self.path_moves[0], move, chess, depth, first_eval, time_left) for move in root_moves[1:]]
+        move_evals = {}
+        for move, move_eval, nodes in self.search_pool.imap_unordered(_search_root_move, tasks):
+            self.nodes += nodes
+            if move_eval is None:
+                self.search_aborted = True # 有进程超时，这一轮作废，剩下的任务也会很快超时返回
+            move_evals[move] = move_eval
+        if self.search_aborted:
+            return None
+        best_move, best_eval = first_move, first_eval
+        for move in root_moves[1:]:
+            if move_evals[move] > best_eval if maximizing_player else move_evals[move] < best_eval:
+                best_eval = move_evals[move]
+                best_move = move
+        return best_move, best_eval
+
+    def search_mcts(self, root_moves, chess, time_budget, restricted):
+        """
+        蒙特卡洛树搜索chess一方的着法，返回树根访问次数最多的着法\n
+        workers > 1时根并行：进程池里另外workers - 1个进程各自建树、用不同的种子同时模拟，按着法合并树根的访问次数\n
+        time_budget和self.mcts_playouts都为None时模拟MCTS_DEFAULT_PLAYOUTS次，模拟次数记入self.nodes
+        """
+        max_playouts = self.mcts_playouts
+        if time_budget is None and max_playouts is None:
+            max_playouts = MCTS_DEFAULT_PLAYOUTS
+        pending = None
+        if self.workers > 1:
+            if self.search_pool is None:
+                self.search_pool = multiprocessing.Pool(self.workers - 1, initializer=_init_mcts_worker, initargs=(self.neighbor_radius, self.chess_scores, self.mcts.policy, self.board_size, self.evaluator))
+            # 落子记录单独发过去，进程里补走新增的着法，树可以接着用
+            history = [(index, self.stone_at(index)) for index, _ in self.move_history]
+            base = sorted(set(self.get_stones()) - set(history))
+            tasks = [(base, history, root_moves, chess, time_budget, max_playouts, restricted, MCTS_SEED + len(history) * self.workers + worker) for worker in range(1, self.workers)]
+            pending = self.search_pool.map_async(_mcts_worker_search, tasks, chunksize=1)
+        root_stats = self.mcts.search(root_moves, chess, time_budget, max_playouts, restricted)
+        self.nodes = self.mcts.playouts
+        if pending is not None:
+            for worker_stats, playouts in pending.get():
+                self.nodes += playouts
+                for move, (visits, value) in worker_stats.items():
+                    total_visits, total_value = root_stats.get(move, (0, 0.0))
+                    root_stats[move] = (total_visits + visits, total_value + value)
+        self.search_depth_reached = self.mcts.principal_depth()
+        return max(root_stats, key=root_stats.get)
+
+    def close_search_pool(self):
+        if self.search_pool is not None:
+            self.search_pool.terminate()
+            self.search_pool = None
+
+    def get_stones(self):
+        """
+        返回棋盘上所有棋子[((i, j), chess)]
+        """
+        return [((i, j), self.board_map[i][j]) for i in range(self.board_size) for j in range(self.board_size) if self.board_map[i][j] != BOARD_MAP_NONE]
+
+    def load_position(self, stones):
+        """
+        把棋盘摆成stones给出的局面，只增删有差别的棋子，分数、哈希、候选着法同步更新\n
+        摆出的局面不再能用unmake撤回，落子记录和undo栈一起清空
+        """
+        self.move_history.clear()
+        self.undo_stack.clear()
+        current = dict(self.get_stones())
+        target = dict(stones)
+        for index, chess in current.items():
+            if target.get(index) != chess:
+                self.remove_chess(index)
+                self.update_score_map_by_index(index)
+        for index, chess in target.items():
+            if current.get(index) != chess:
+                self.place_chess(index, chess)
+                self.update_score_map_by_index(index)
+
+    def check_search_stop(self):
+        """
+        超过截止时间或者收到外部停止信号时，标记本轮搜索中止
+        """
+        if self.search_deadline is not None and time.perf_counter() >= self.search_deadline:
+            self.search_aborted = True
+        elif self.search_stop_event is not None and self.search_stop_event.is_set():
+            self.search_aborted = True
+
+    def get_predicted_reply(self):
+        """
+        从置换表中取出轮到的一方在当前局面下的预期着法，没有记录时返回None；MCTS从树里取
+        """
+        if self.mcts is not None:
+            move = self.mcts.predicted_reply(self.turn)
+            return move if move is not None and self.stone_at(move) == BOARD_MAP_NONE else None
+        entry = self.transposition_table.probe(self.zobrist_hash ^ ZOBRIST_BLACK_TURN if self.turn == BOARD_MAP_BLACK_CHESS else self.zobrist_hash)
+        if entry is None or entry[3] < 0:
+            return None
+        move = self.decode_move(entry[3])
+        return move if self.stone_at(move) == BOARD_MAP_NONE else None
+
+    def search_root(self, depth, root_moves, chess, alpha=-math.inf, beta=math.inf):
+        """
+        按root_moves的顺序搜索一轮chess一方的着法，返回(best_move, best_eval)，超时中止时返回None\n
+        alpha, beta: 根节点窗口，best_eval落在窗口外时只是边界，由调用方全窗口重搜
+        """
+        maximizing_player = chess == BOARD_MAP_BLACK_CHESS
+        best_move = None
+        best_eval = -math.inf if maximizing_player else math.inf
+        for move in root_moves:
+            self.push_chess(move, chess)
+            # 根节点把当前最好分数作为窗口边界传下去，分数不比它好的着法不会被选中
+            if maximizing_player:
+                lower = max(alpha, best_eval)
+                if self.pvs and best_move is not None:
+                    move_eval = self.minimax(depth, lower, lower + 1, False, move)
+                    if lower < move_eval < beta:
+                        move_eval = self.minimax(depth, lower, beta, False, move)
+                else:
+                    move_eval = self.minimax(depth, lower, beta, False, move)
+            else:
+                upper = min(beta, best_eval)
+                if self.pvs and best_move is not None:
+                    move_eval = self.minimax(depth, upper - 1, upper, True, move)
+                    if alpha < move_eval < upper:
+                        move_eval = self.minimax(depth, alpha, upper, True, move)
+                else:
+                    move_eval = self.minimax(depth, alpha, upper, True, move)
+            self.pop_chess()
+            if self.search_aborted:
+                return None
+            if move_eval > best_eval if maximizing_player else move_eval < best_eval:
+                best_eval = move_eval
+                best_move = move
+            if best_eval >= beta if maximizing_player else best_eval <= alpha:
+                break # 超出根节点窗口
+        return best_move, best_eval
+    
+    def minimax(self, depth, alpha, beta, maximizing_player, index, ply=1):
+        self.nodes += 1
+        if self.nodes & (DEADLINE_CHECK_INTERVAL - 1) == 0:
+            self.check_search_stop()
+        if self.search_aborted:
+            return 0 # 超时中止，返回值不会被使用
+        if self.check_win(index):
+            return self.get_current_score()
+        if ply < len(self.path_moves):
+            self.path_moves[ply] = index
+        if depth == 0:
+            if self.quiescence_depth > 0 and ply + self.quiescence_depth < len(self.path_moves):
+                return self.quiescence(alpha, beta, maximizing_player, ply, self.quiescence_depth)
+            return self.get_current_score()
+        # 查置换表：深度足够时直接使用记录的分数或收窄窗口，否则只拿记录的最佳着法先搜
+        tt_key = self.zobrist_hash ^ ZOBRIST_BLACK_TURN if maximizing_player else self.zobrist_hash
+        tt_move = None
+        entry = self.transposition_table.probe(tt_key)
+        if entry is not None:
+            tt_depth, tt_flag, tt_score, tt_move_code = entry
+            if tt_depth >= depth:
+                if tt_flag == TT_FLAG_EXACT:
+                    return tt_score
+                elif tt_flag == TT_FLAG_LOWER:
+                    alpha = max(alpha, tt_score)
+                else:
+                    beta = min(beta, tt_score)
+                if beta <= alpha:
+                    return tt_score
+            if tt_move_code >= 0:
+                tt_move = self.decode_move(tt_move_code)
+        alpha_orig, beta_orig = alpha, beta
+        moves = self.get_available_moves()
+        if not moves:
+            return self.get_current_score() # 棋盘已满
+        best_move = None
+        if maximizing_player:
+            # 黑棋
+            max_eval = -math.inf
+            for move_count, move in enumerate(self.order_moves(moves, BOARD_MAP_BLACK_CHESS, depth, ply, tt_move)):
+                self.push_chess(move, BOARD_MAP_BLACK_CHESS)
+                if move_count > 0 and (self.pvs or self.lmr):
+                    eval = self.search_late_move(depth, alpha, beta, True, move, ply, move_count)
+                else:
+                    eval = self.minimax(depth - 1, alpha, beta, False, move, ply + 1)
+                self.pop_chess()
+                if self.search_aborted:
+                    return 0
+                if eval > max_eval:
+                    max_eval = eval
+                    best_move = move
+                alpha = max(alpha, eval)
+                if beta <= alpha:
+                    self.record_cutoff(move, BOARD_MAP_BLACK_CHESS, depth, ply)
+                    break
+            best_eval = max_eval
+        else:
+            # 白棋
+            min_eval = math.inf
+            for move_count, move in enumerate(self.order_moves(moves, BOARD_MAP_WHITE_CHESS, depth, ply, tt_move)):
+                self.push_chess(move, BOARD_MAP_WHITE_CHESS)
+                if move_count > 0 and (self.pvs or self.lmr):
+                    eval = self.search_late_move(depth, alpha, beta, False, move, ply, move_count)
+                else:
+                    eval = self.minimax(depth - 1, alpha, beta, True, move, ply + 1)
+                self.pop_chess()
+                if self.search_aborted:
+                    return 0
+                if eval < min_eval:
+                    min_eval = eval
+                    best_move = move
+                beta = min(beta, eval)
+                if beta <= alpha:
+                    self.record_cutoff(move, BOARD_MAP_WHITE_CHESS, depth, ply)
+                    break
+            best_eval = min_eval
+        # 存置换表
+        if best_eval <= alpha_orig:
+            tt_flag = TT_FLAG_UPPER
+        elif best_eval >= beta_orig:
+            tt_flag = TT_FLAG_LOWER
+        else:
+            tt_flag = TT_FLAG_EXACT
+        self.transposition_table.store(tt_key, depth, tt_flag, best_eval, self.encode_move(best_move))
+        return best_eval
+
+    def search_late_move(self, depth, alpha, beta, maximizing_player, move, ply, move_count):
+        """
+        minimax里第一个之后的着法(已经落子)：pvs时先用零窗口试搜，lmr时排序靠后的非killer着法先减层试搜\n
+        试搜结果可能好于当前最好分数时，先恢复原深度，再恢复原窗口重搜\n
+        maximizing_player: 落子的一方是否为黑棋(取最大)
+        """
+        killers = self.killer_moves[ply] if ply < MAX_PLY else (None, None)
+        reduction = 0
+        if self.lmr and depth >= LMR_MIN_DEPTH and move_count >= LMR_MIN_MOVES and move != killers[0] and move != killers[1]:
+            reduction = LMR_REDUCTION
+        if not self.pvs:
+            window_alpha, window_beta = alpha, beta
+        elif maximizing_player:
+            window_alpha, window_beta = alpha, alpha + 1
+        else:
+            window_alpha, window_beta = beta - 1, beta
+        eval = self.minimax(depth - 1 - reduction, window_alpha, window_beta, not maximizing_player, move, ply + 1)
+        if reduction and (eval > alpha if maximizing_player else eval < beta) and not self.search_aborted:
+            eval = self.minimax(depth - 1, window_alpha, window_beta, not maximizing_player, move, ply + 1)
+        if self.pvs and alpha < eval < beta and not self.search_aborted:
+            eval = self.minimax(depth - 1, alpha, beta, not maximizing_player, move, ply + 1)
+        return eval
+
+    def quiescence(self, alpha, beta, maximizing_player, ply, qdepth):
+        """
+        叶子节点的静态搜索：只延伸冲四、挡四和挡活三，其余情况按当前分数站住(stand pat)\n
+        只看最后两步所在的线：上一步(对方)形成的冲四和活三，以及轮到的一方上上步形成的成五点、冲四点
+        """
+        self.nodes += 1
+        if self.nodes & (DEADLINE_CHECK_INTERVAL - 1) == 0:
+            self.check_search_stop()
+        if self.search_aborted:
+            return 0
+        chess = BOARD_MAP_BLACK_CHESS if maximizing_player else BOARD_MAP_WHITE_CHESS
+        color = 0 if maximizing_player else 1
+        threats_at = self.bitboard.threats_at
+        # 对方上一步形成的成五点(必须挡)和活三挡点
+        index = self.path_moves[ply]
+        block_moves, three_defenses = set(), set()
+        for kind, cells in threats_at(index, 1 - color):
+            if kind == LINE_THREAT_FIVE:
+                block_moves.update(cells)
+            elif kind == LINE_THREAT_DEFENSE:
+                three_defenses.update(cells)
+        # 己方上上步形成的成五点和冲四点
+        own_fives, own_fours = set(), set()
+        prev_index = self.path_moves[ply - 1] if ply > 0 else None
+        if prev_index is not None and self.stone_at(prev_index) == chess:
+            for kind, cells in threats_at(prev_index, color):
+                if kind == LINE_THREAT_FIVE:
+                    own_fives.update(cells)
+                elif kind == LINE_THREAT_FOUR:
+                    own_fours.update(cells)
+        best_eval = -math.inf if maximizing_player else math.inf
+        if own_fives:
+            moves = [min(own_fives)] # 直接成五
+        elif block_moves:
+            moves = sorted(block_moves) # 对方冲四，只能挡，不能站住
+        elif three_defenses:
+            moves = sorted(three_defenses | own_fours) # 对方活三，挡住或者先冲四，不能站住
+        else:
+            # 没有被迫应对的威胁，可以按当前分数站住，只延伸己方冲四
+            best_eval = self.get_current_score()
+            if maximizing_player:
+                if best_eval >= beta:
+                    return best_eval
+                alpha = max(alpha, best_eval)
+            else:
+                if best_eval <= alpha:
+                    return best_eval
+                beta = min(beta, best_eval)
+            moves = sorted(own_fours)
+        if qdepth == 0:
+            return self.get_current_score()
+        for move in moves:
+            self.push_chess(move, chess)
+            self.path_moves[ply + 1] = move
+            if self.check_win(move):
+                eval = self.get_current_score()
+            else:
+                eval = self.quiescence(alpha, beta, not maximizing_player, ply + 1, qdepth - 1)
+            self.pop_chess()
+            if self.search_aborted:
+                return 0
+            if maximizing_player:
+                best_eval = max(best_eval, eval)
+                alpha = max(alpha, eval)
+            else:
+                best_eval = min(best_eval, eval)
+                beta = min(beta, eval)
+            if beta <= alpha:
+                break
+        return best_eval
+
+    def new_search_ordering(self):
+        """
+        新一轮搜索前清空killer表，history表减半，让旧局面的统计逐渐失效
+        """
+        for killers in self.killer_moves:
+            killers[0] = killers[1] = None
+        for history in self.history_table:
+            for move in history:
+                history[move] >>= 1
+
+    def order_moves(self, moves, chess, depth, ply, tt_move):
+        """
+        候选着法排序：置换表着法 > 本层killer着法 > 静态增益 > history分数\n
+        静态增益：在该位置试落一子时总分的变化(score_gain，按落子方取正负)\n
+        剩余深度较浅时只用置换表/killer/history排序；设置了max_width时只保留前max_width个着法
+        """
+        killers = self.killer_moves[ply] if ply < MAX_PLY else (None, None)
+        history = self.history_table[0 if chess == BOARD_MAP_BLACK_CHESS else 1]
+        use_static_gain = depth >= ORDER_STATIC_MIN_DEPTH or self.max_width is not None
+        sign = 1 if chess == BOARD_MAP_BLACK_CHESS else -1
+        color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+        score_gain = self.score_gain
+        keyed_moves = []
+        for move in moves:
+            gain = 0
+            if use_static_gain:
+                gain = score_gain(move, color) * sign
+            if move == tt_move:
+                priority = 2
+            elif move == killers[0] or move == killers[1]:
+                priority = 1
+            else:
+                priority = 0
+            keyed_moves.append((priority, gain, history.get(move, 0), move))
+        keyed_moves.sort(reverse=True)
+        if self.max_width is not None and use_static_gain:
+            del keyed_moves[self.max_width:]
+        return [keyed_move[3] for keyed_move in keyed_moves]
+
+    def record_cutoff(self, move, chess, depth, ply):
+        """
+        beta截断时记录killer着法和history分数
+        """
+        if ply < MAX_PLY:
+            killers = self.killer_moves[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        history = self.history_table[0 if chess == BOARD_MAP_BLACK_CHESS else 1]
+        history[move] = history.get(move, 0) + depth * depth
+    
+    def get_available_moves(self):
+        """
+        返回候选着法(已有棋子周围的空位)的副本，由place_chess/remove_chess增量维护
+        """
+        return set(self.candidate_moves)
+    
+    def get_availabel_idex_around(self, index):
+        around_none_place = []
+        for i in range(index[0] - 1, index[0] + 2):
+            for j in range(index[1] - 1, index[1] + 2):
+                if 0 <= i < self.board_size and 0 <= j < self.board_size and self.board_map[i][j] == BOARD_MAP_NONE:
+                    around_none_place.append((i, j))
+        return around_none_place
+    
+    def evaluate_board_score(self):
+        """
+        逐格重算整个棋盘的分数：按线从board_map取出棋子，用reference_line_score按定义计分，斜向同样按线长缩减\n
+        不用位棋盘、分数表和增量维护的线分数，很慢，只用来核对self.score(check_incremental_evaluation)
+        """
+        geometry = get_board_geometry(self.board_size)
+        board_map = self.board_map
+        score = 0
+        for direction in range(4):
+            for cells in geometry.line_cells[direction]:
+                line_score = reference_line_score([board_map[i][j] for i, j in cells], self.checkup_score, self.evaluator)
+                score += line_score * len(cells) // self.board_size
+        return score
+
+    # 每下一步棋，根据当前的棋的位置index检查一下落在index上的这一方是否满足了胜利条件
+    def check_win(self, index):
+        check_num = self.board_map[index[0]][index[1]]
+        if check_num == BOARD_MAP_NONE:
+            return False
+        return self.bitboard.check_win(index, 0 if check_num == BOARD_MAP_BLACK_CHESS else 1)
+    
+    # 水平方向检查
+    def check_horizon(self, index, check_num):
+        return self.bitboard.check_five(index, 0 if check_num == BOARD_MAP_BLACK_CHESS else 1, LINE_ROW)
+    
+    # 竖直方向检查
+    def check_vertical(self, index, check_num):
+        return self.bitboard.check_five(index, 0 if check_num == BOARD_MAP_BLACK_CHESS else 1, LINE_COL)
+
+    # 斜向检查
+    def check_oblique(self, index, check_num):
+        color = 0 if check_num == BOARD_MAP_BLACK_CHESS else 1
+        return self.bitboard.check_five(index, color, LINE_OBLIQUE) or self.bitboard.check_five(index, color, LINE_BACK_OBLIQUE)
+
+_sparse_zobrist_values = {} # key：位置，value：(黑棋, 白棋)的zobrist值，不限大小的棋盘用到哪个位置算哪个
+
+def _sparse_zobrist(index):
+    """
+    不限大小的棋盘上index的zobrist值：位置编码后做splitmix64，同一位置在不同进程里的值相同
+    """
+    values = _sparse_zobrist_values.get(index)
+    if values is None:
+        values = []
+        for color in range(2):
+            x = (((index[0] + SPARSE_MOVE_OFFSET) * SPARSE_MOVE_SPAN + index[1] + SPARSE_MOVE_OFFSET) * 2 + color) ^ (ZOBRIST_SEED << 32)
+            x = (x + 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+            x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+            x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+            values.append(x ^ (x >> 31))
+        values = _sparse_zobrist_values[index] = tuple(values)
+    return values
+
+class SparseChessEngine(ChessEngine):
+    """
+    不限大小的棋盘：只存有子的位置(stones为{(i, j): chess})和有子的线，坐标可以为负\n
+    落子、提子、评估、着法生成、威胁检测的代价只和棋子数有关，和棋盘面积无关；线没有边界，分数不按线长缩减\n
+    对局接口和搜索同ChessEngine，不支持开局库
+    """
+    def __init__(self, *args, **kwargs):
+        kwargs['board_size'] = None
+        super().__init__(*args, **kwargs)
+
+    def init_board(self):
+        self.stones = {}
+        self.bitboard = SparseBitBoard()
+        self.neighbor_offsets = _build_neighbor_offsets(self.neighbor_radius)
+        self.neighbor_counts = {} # 只存计数大于0的位置
+        self.line_scores = [{} for _ in range(4)] # line_scores[direction][line]，只存有子的线
+        self.center = (0, 0)
+
+    def check_index(self, index):
+        if not (-SPARSE_COORD_LIMIT <= index[0] < SPARSE_COORD_LIMIT and -SPARSE_COORD_LIMIT <= index[1] < SPARSE_COORD_LIMIT):
+            raise ValueError("{} is outside the sparse board range [{}, {})".format(index, -SPARSE_COORD_LIMIT, SPARSE_COORD_LIMIT))
+
+    def stone_at(self, index):
+        return self.stones.get(index, BOARD_MAP_NONE)
+
+    def encode_move(self, move):
+        return (move[0] + SPARSE_MOVE_OFFSET) * SPARSE_MOVE_SPAN + move[1] + SPARSE_MOVE_OFFSET
+
+    def decode_move(self, move_code):
+        i, j = divmod(move_code, SPARSE_MOVE_SPAN)
+        return i - SPARSE_MOVE_OFFSET, j - SPARSE_MOVE_OFFSET
+
+    def make(self, index):
+        self.check_index(index)
+        super().make(index)
+
+    def legal_moves(self):
+        """
+        空位有无穷多，只返回候选着法(已有棋子周围的空位)，空棋盘返回[self.center]，对局结束后为空
+        """
+        if self.winner is not None:
+            return []
+        if not self.stones:
+            return [self.center]
+        return sorted(self.candidate_moves)
+
+    def is_terminal(self):
+        return self.winner is not None
+
+    def get_stones(self):
+        return list(self.stones.items())
+
+    def evaluate_board_score_total(self):
+        return sum(sum(scores.values()) for scores in self.line_scores)
+
+    def evaluate_board_score(self):
+        """
+        逐格重算：每条有子的线取最低、最高的子再往外SUCCEED_CHESS_NUMS格，两端之外的空位不影响棋型
+        """
+        lines = [{} for _ in range(4)]
+        for (i, j), chess in self.stones.items():
+            for direction, (line, pos) in enumerate(_sparse_cell_lines(i, j)):
+                lines[direction].setdefault(line, {})[pos] = chess
+        score = 0
+        for direction_lines in lines:
+            for cells in direction_lines.values():
+                positions = range(min(cells) - SUCCEED_CHESS_NUMS, max(cells) + SUCCEED_CHESS_NUMS + 1)
+                score += reference_line_score([cells.get(pos, BOARD_MAP_NONE) for pos in positions], self.checkup_score, self.evaluator)
+        return score
+
+    def place_stone(self, index, color):
+        self.stones[index] = BOARD_MAP_BLACK_CHESS if color == 0 else BOARD_MAP_WHITE_CHESS
+        self.bitboard.place(index, color)
+        self.zobrist_hash ^= _sparse_zobrist(index)[color]
+
+    def remove_stone(self, index, color):
+        del self.stones[index]
+        self.bitboard.remove(index, color)
+        self.zobrist_hash ^= _sparse_zobrist(index)[color]
+
+    def place_chess(self, index, chess):
+        self.check_index(index)
+        color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+        self.place_stone(index, color)
+        i, j = index
+        stones, neighbor_counts, candidate_moves = self.stones, self.neighbor_counts, self.candidate_moves
+        for di, dj in self.neighbor_offsets:
+            neighbor = (i + di, j + dj)
+            neighbor_counts[neighbor] = neighbor_counts.get(neighbor, 0) + 1
+            if neighbor not in stones:
+                candidate_moves.add(neighbor)
+        candidate_moves.discard(index)
+
+    def remove_chess(self, index):
+        self.remove_stone(index, 0 if self.stones[index] == BOARD_MAP_BLACK_CHESS else 1)
+        i, j = index
+        neighbor_counts, candidate_moves = self.neighbor_counts, self.candidate_moves
+        for di, dj in self.neighbor_offsets:
+            neighbor = (i + di, j + dj)
+            count = neighbor_counts[neighbor] - 1
+            if count:
+                neighbor_counts[neighbor] = count
+            else:
+                del neighbor_counts[neighbor]
+                candidate_moves.discard(neighbor)
+        if index in neighbor_counts:
+            candidate_moves.add(index)
+
+    def push_chess(self, index, chess):
+        i, j = index
+        color = 0 if chess == BOARD_MAP_BLACK_CHESS else 1
+        stones, neighbor_counts, candidate_moves = self.stones, self.neighbor_counts, self.candidate_moves
+        stones[index] = chess
+        self.zobrist_hash ^= _sparse_zobrist(index)[color]
+        added_moves = []
+        for di, dj in self.neighbor_offsets:
+            neighbor = (i + di, j + dj)
+            neighbor_counts[neighbor] = neighbor_counts.get(neighbor, 0) + 1
+            if neighbor not in stones and neighbor not in candidate_moves:
+                candidate_moves.add(neighbor)
+                added_moves.append(neighbor)
+        was_candidate = index in candidate_moves
+        candidate_moves.discard(index)
+        self.bitboard.place(index, color)
+        black_masks, white_masks = self.bitboard.masks
+        line_scores, calculate_line_score = self.line_scores, self.calculate_line_score
+        saved_scores = [self.score]
+        score = self.score
+        for direction, (line, _) in enumerate(_sparse_cell_lines(i, j)):
+            old_score = line_scores[direction].get(line, 0)
+            saved_scores.append(old_score)
+            line_score = calculate_line_score(black_masks[direction][line], white_masks[direction][line])
+            line_scores[direction][line] = line_score
+            score += line_score - old_score
+        self.score = score
+        self.undo_stack.append((index, color, saved_scores, added_moves, was_candidate))
+        return score
+
+    def pop_chess(self):
+        index, color, saved_scores, added_moves, was_candidate = self.undo_stack.pop()
+        i, j = index
+        del self.stones[index]
+        self.zobrist_hash ^= _sparse_zobrist(index)[color]
+        self.bitboard.remove(index, color)
+        bases, line_scores = self.bitboard.bases, self.line_scores
+        self.score = saved_scores[0]
+        for direction, (line, _) in enumerate(_sparse_cell_lines(i, j)):
+            if line in bases[direction]:
+                line_scores[direction][line] = saved_scores[direction + 1]
+            else:
+                del line_scores[direction][line] # 线上没有子了
+        neighbor_counts = self.neighbor_counts
+        for di, dj in self.neighbor_offsets:
+            neighbor = (i + di, j + dj)
+            count = neighbor_counts[neighbor] - 1
+            if count:
+                neighbor_counts[neighbor] = count
+            else:
+                del neighbor_counts[neighbor]
+        self.candidate_moves.difference_update(added_moves)
+        if was_candidate:
+            self.candidate_moves.add(index)
+
+    def score_gain(self, index, color):
+        """
+        在index试落color颜色的一子时总分的变化，不改动棋盘和线分数\n
+        落在线的基准附近时，把这条线的掩码整体左移后再算，线没有边界，平移不改变分数
+        """
+        black_masks, white_masks = self.bitboard.masks
+        bases, line_scores, calculate_line_score = self.bitboard.bases, self.line_scores, self.calculate_line_score
+        gain = 0
+        for direction, (line, pos) in enumerate(_sparse_cell_lines(index[0], index[1])):
+            base = bases[direction].get(line)
+            if base is None:
+                black, white, offset, old_score = 0, 0, SPARSE_LINE_MARGIN, 0
+            else:
+                black, white, offset, old_score = black_masks[direction][line], white_masks[direction][line], pos - base, line_scores[direction][line]
+                if offset < SUCCEED_CHESS_NUMS:
+                    shift = SPARSE_LINE_MARGIN - offset
+                    black, white, offset = black << shift, white << shift, SPARSE_LINE_MARGIN
+            if color == 0:
+                black |= 1 << offset
+            else:
+                white |= 1 << offset
+            gain += calculate_line_score(black, white) - old_score
+        return gain
+
+    def update_score_map_by_index(self, index):
+        black_masks, white_masks = self.bitboard.masks
+        for direction, (line, _) in enumerate(_sparse_cell_lines(index[0], index[1])):
+            old_score = self.line_scores[direction].pop(line, 0)
+            line_score = 0
+            if line in black_masks[direction]:
+                line_score = self.line_scores[direction][line] = self.calculate_line_score(black_masks[direction][line], white_masks[direction][line])
+            self.score += line_score - old_score
+        return self.score
+
+    def calculate_line_score(self, black_mask, white_mask, length=None):
+        """
+        black_mask, white_mask: 这条线上黑棋、白棋相对基准位置的位掩码，有子的位不低于第SUCCEED_CHESS_NUMS位\n
+        线没有边界：最高的子再往上留SUCCEED_CHESS_NUMS格空位当作线长，和无限长的线棋型相同，也不按线长缩减
+        """
+        length = (black_mask | white_mask).bit_length() + SUCCEED_CHESS_NUMS
+        key = (black_mask << length | white_mask) << 16 | length
+        line_scores = self.pattern_line_scores
+        score = line_scores.get(key)
+        if score is None:
+            score = pattern_line_score(self.pattern_score_table, self.checkup_score, black_mask, white_mask, length)
+            if len(line_scores) >= PATTERN_CACHE_SIZE:
+                line_scores.clear()
+            line_scores[key] = score
+        return score
+
+    def calculate_run_line_score(self, black_mask, white_mask, length=None):
+        """
+        evaluator=EVALUATOR_RUNS时的calculate_line_score：线没有边界，每段两端都是空位，也不按线长缩减
+        """
+        table = self.segment_score_table
+        occupied = black_mask | white_mask
+        segment_starts = occupied & ~(occupied << 1)
+        segment_ends = occupied & ~(occupied >> 1)
+        score = 0
+        while segment_starts:
+            start_bit = segment_starts & -segment_starts
+            end_bit = segment_ends & -segment_ends
+            segment_starts ^= start_bit
+            segment_ends ^= end_bit
+            segment = ((black_mask & ((end_bit << 1) - start_bit)) | (end_bit << 1)) >> (start_bit.bit_length() - 1)
+            try:
+                score += table[(segment << 2) | 3]
+            except IndexError:
+                segment_length = segment.bit_length() - 1
+                score += segment_score(self.checkup_score, segment ^ (1 << segment_length), segment_length, True, True)
+        return score
+
+    def check_win(self, index):
+        chess = self.stones.get(index)
+        if chess is None:
+            return False
+        return self.bitboard.check_win(index, 0 if chess == BOARD_MAP_BLACK_CHESS else 1)
+
+def create_chess_engine(board_size=BOARD_LINE_NUMS, **kwargs):
+    """
+    按棋盘大小创建引擎：board_size为None时是不限大小的SparseChessEngine，否则是board_size路的ChessEngine\n
+    kwargs: ChessEngine的其他参数
+    """
+    if board_size is None:
+        return SparseChessEngine(**kwargs)
+    return ChessEngine(board_size=board_size, **kwargs)
+
+# ====增量评估的差分核对==== #
+CHECK_MAX_PLIES = 60 # 每局随机落子最多几步
+CHECK_UNDO_RATE = 0.2 # 每一步悔一步棋的概率
+CHECK_FAR_RATE = 0.2 # 每一步不在候选着法里、随便落在棋盘上(不限大小的棋盘上是离天元CHECK_SPARSE_RADIUS以内)的概率
+CHECK_SPARSE_RADIUS = 12
+
+def check_incremental_evaluation(board_size=BOARD_LINE_NUMS, games=20, seed=0, evaluator=EVALUATOR_PATTERNS, chess_scores=None):
+    """
+    差分核对：随机落子、悔棋(颜色也随机，不必是合法对局)，每一步都把增量维护的score、落子前score_gain给出的增益、
+    load_position摆出的分数和evaluate_board_score的逐格重算比较，最后悔完所有棋子分数应回到0\n
+    board_size为None时核对不限大小的棋盘，返回(核对次数, 不一致的次数)
+    """
+    rnd = random.Random(seed)
+    engine = create_chess_engine(board_size, tt_size_mb=1, threat_search=False, evaluator=evaluator, chess_scores=chess_scores)
+    fresh = create_chess_engine(board_size, tt_size_mb=1, threat_search=False, evaluator=evaluator, chess_scores=chess_scores)
+    checks = mismatches = 0
+
+    def check(actual, expected):
+        nonlocal checks, mismatches
+        checks += 1
+        mismatches += actual != expected
+
+    for _ in range(games):
+        for _ in range(rnd.randint(1, CHECK_MAX_PLIES)):
+            if engine.undo_stack and rnd.random() < CHECK_UNDO_RATE:
+                engine.pop_chess()
+            else:
+                if not engine.candidate_moves or rnd.random() < CHECK_FAR_RATE:
+                    if board_size is None:
+                        move = (rnd.randint(-CHECK_SPARSE_RADIUS, CHECK_SPARSE_RADIUS), rnd.randint(-CHECK_SPARSE_RADIUS, CHECK_SPARSE_RADIUS))
+                    else:
+                        move = (rnd.randrange(board_size), rnd.randrange(board_size))
+                    if engine.stone_at(move) != BOARD_MAP_NONE:
+                        continue
+                else:
+                    move = rnd.choice(sorted(engine.candidate_moves))
+                chess = rnd.choice((BOARD_MAP_BLACK_CHESS, BOARD_MAP_WHITE_CHESS))
+                score = engine.score
+                gain = engine.score_gain(move, 0 if chess == BOARD_MAP_BLACK_CHESS else 1)
+                engine.push_chess(move, chess)
+                check(engine.score - score, gain)
+            check(engine.score, engine.evaluate_board_score())
+        fresh.load_position(engine.get_stones())
+        check(fresh.score, engine.score)
+        while engine.undo_stack:
+            engine.pop_chess()
+        check(engine.score, 0)
+    return checks, mismatches
+
+_search_worker_board = None # 并行搜索进程里的棋盘，进程存活期间一直复用，置换表保持热的
+
+def _init_search_worker(tt_size_mb, neighbor_radius, max_width, chess_scores, quiescence_depth, pvs, lmr, board_size, evaluator):
+    global _search_worker_board
+    _search_worker_board = create_chess_engine(board_size, tt_size_mb=tt_size_mb, neighbor_radius=neighbor_radius, max_width=max_width, chess_scores=chess_scores,
+                                               threat_search=False, quiescence_depth=quiescence_depth, pvs=pvs, lmr=lmr, evaluator=evaluator)
+
+_mcts_worker_engine = None # 根并行MCTS进程里的引擎，树在进程存活期间保留
+_mcts_worker_position = None # 进程里的引擎当前摆的局面：(初始棋子, 落子记录)
+
+def _init_mcts_worker(neighbor_radius, chess_scores, mcts_policy, board_size, evaluator):
+    global _mcts_worker_engine
+    _mcts_worker_engine = create_chess_engine(board_size, tt_size_mb=1, neighbor_radius=neighbor_radius, chess_scores=chess_scores, threat_search=False,
+                                              search=SEARCH_MCTS, mcts_policy=mcts_policy, evaluator=evaluator)
+
+def _mcts_worker_search(task):
+    """
+    根并行MCTS进程执行的任务：在base上依次走history得到的局面里为chess一方模拟，上次的局面是这次的前缀时只补走新增的着法\n
+    返回(树根各子节点的统计, 模拟次数)
+    """
+    global _mcts_worker_position
+    base, history, root_moves, chess, time_budget, max_playouts, restricted, seed = task
+    engine = _mcts_worker_engine
+    done = 0
+    if _mcts_worker_position is not None and _mcts_worker_position[0] == base and history[:len(_mcts_worker_position[1])] == _mcts_worker_position[1]:
+        done = len(_mcts_worker_position[1])
+    else:
+        engine.load_position(base)
+    for index, stone in history[done:]:
+        engine.turn = stone
+        engine.make(index)
+    _mcts_worker_position = (base, history)
+    engine.mcts.random.seed(seed)
+    root_stats = engine.mcts.search(root_moves, chess, time_budget, max_playouts, restricted)
+    return root_stats, engine.mcts.playouts
+
+def _search_root_move(task):
+    """
+    并行搜索进程执行的任务：在stones局面下(对方上一步为last_move)chess一方走move，搜索depth层，bound为主进程已知的最好分数\n
+    返回(move, 分数, 节点数)，超时返回的分数为None
+    """
+    stones, last_move, move, chess, depth, bound, time_left = task
+    board = _search_worker_board
+    board.load_position(stones)
+    board.nodes = 0
+    board.search_aborted = False
+    board.search_deadline = None if time_left is None else time.perf_counter() + time_left
+    board.path_moves[0] = last_move
+    board.push_chess(move, chess)
+    if chess == BOARD_MAP_BLACK_CHESS:
+        move_eval = board.minimax(depth, bound, math.inf, False, move)
+    else:
+        move_eval = board.minimax(depth, -math.inf, bound, True, move)
+    board.pop_chess()
+    if board.search_aborted:
+        move_eval = None
+    board.search_deadline = None
+    return move, move_eval, board.nodes
+
+def _ai_worker_main(request_queue, result_queue, stop_event, tt_size_mb, book_file):
+    """
+    后台思考进程：维护自己的一份引擎和置换表，一直保留到对局结束，电脑执黑，玩家执白\n
+    请求：('play', 玩家着法, 思考时间)：落下玩家着法并返回电脑着法；('ponder',)：猜测玩家应手并预先思考，直到stop_event被设置；None：退出
+    """
+    engine = ChessEngine(tt_size_mb, book_file=book_file)
+    engine.time_budget = None # 预先思考不限时，由stop_event停止
+    ponder_move, ponder_result, ponder_time = None, None, 0
+    while True:
+        request = request_queue.get()
+        if request is None:
+            break
+        if request[0] == 'ponder':
+            if engine.is_terminal():
+                continue # 电脑这一步结束了对局，没有可猜的应手
+            ponder_move = engine.get_predicted_reply()
+            if ponder_move is None:
+                continue
+            engine.make(ponder_move)
+            engine.search_stop_event = stop_event
+            start_time = time.perf_counter()
+            ponder_result = engine.best_move()
+            ponder_time = time.perf_counter() - start_time
+            engine.search_stop_event = None
+        elif request[0] == 'play':
+            _, human_move, time_budget = request
+            if ponder_move is not None and ponder_move != human_move:
+                # 猜错了，撤回猜测的着法
+                engine.unmake()
+                ponder_move = None
+            if ponder_move is None:
+                engine.make(human_move)
+                best_move = engine.best_move(time_budget)
+            elif ponder_result is not None and ponder_time >= time_budget:
+                best_move = ponder_result # 猜对了并且已经想够了，直接出棋
+            else:
+                # 猜对了，用剩下的时间接着搜，置换表是热的，前面几轮很快
+                best_move = engine.best_move(max(time_budget - ponder_time, 0.05))
+            ponder_move, ponder_result = None, None
+            engine.make(best_move)
+            result_queue.put(best_move)
+
+class AIPlayer():
+    """
+    在后台进程中思考的电脑玩家，主循环只负责发请求和取结果，不会被搜索卡住
+    """
+    def __init__(self, tt_size_mb=TT_SIZE_MB, book_file=None):
+        self.request_queue = multiprocessing.Queue()
+        self.result_queue = multiprocessing.Queue()
+        self.stop_event = multiprocessing.Event()
+        self.process = multiprocessing.Process(target=_ai_worker_main, args=(self.request_queue, self.result_queue, self.stop_event, tt_size_mb, book_file), daemon=True)
+        self.process.start()
+
+    def request_move(self, human_move, time_budget):
+        """
+        通知后台玩家的着法，并开始思考电脑的应手(正在预先思考的话先停下来)
+        """
+        self.stop_event.set()
+        self.request_queue.put(('play', human_move, time_budget))
+
+    def start_ponder(self):
+        """
+        电脑落子后，趁玩家思考时预先思考玩家最可能的应手
+        """
+        self.stop_event.clear() # 必须在发请求之前清，否则可能冲掉玩家下棋时发出的停止信号
+        self.request_queue.put(('ponder',))
+
+    def stop_pondering(self):
+        """
+        玩家的着法结束了对局，不会再有请求：停下预先思考，后台进程空闲等待
+        """
+        self.stop_event.set()
+
+    def get_move(self):
+        """
+        不阻塞地取电脑着法，还没算完返回None
+        """
+        try:
+            return self.result_queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.stop_event.set()
+        self.request_queue.put(None)
+        self.process.join(timeout=1)
+
+# 程序入口：增量评估和逐格重算的差分核对
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='差分核对：随机落子悔棋，增量维护的局面分数逐步和逐格重算的分数比较')
+    parser.add_argument('--games', type=int, default=200, help='每种棋盘核对几局')
+    parser.add_argument('--board-sizes', default='15,19,20,0', help='逗号分隔的棋盘线数，0表示不限大小的棋盘')
+    parser.add_argument('--evaluator', choices=(EVALUATOR_PATTERNS, EVALUATOR_RUNS), default=EVALUATOR_PATTERNS, help='局面评估')
+    parser.add_argument('--seed', type=int, default=0, help='随机落子的种子')
+    args = parser.parse_args()
+
+    failed = False
+    for board_size in [int(size) or None for size in args.board_sizes.split(',')]:
+        start_time = time.perf_counter()
+        checks, mismatches = check_incremental_evaluation(board_size, args.games, args.seed, args.evaluator)
+        sys.stderr.write('board {}: {} checks, {} mismatches, {:.1f}s\n'.format(board_size or 'unbounded', checks, mismatches, time.perf_counter() - start_time))
+        failed = failed or mismatches > 0
+    if failed:
+        sys.exit(1)
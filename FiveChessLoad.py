@@ -0,0 +1,156 @@
+import os
+import sys
+import json
+import time
+import math
+import random
+import socket
+import asyncio
+import argparse
+import subprocess
+import collections
+from FiveChessArena import random_opening
+from FiveChessEngine import BOARD_LINE_NUMS
+from FiveChessServer import SERVER_HOST, SERVER_PORT
+
+# ====压测配置==== #
+LOAD_CONNECTIONS = 8 # 并发连接数，每个连接发完一个请求、收到回复再发下一个
+LOAD_REQUESTS = 400 # 总请求数
+LOAD_POSITIONS = 40 # 请求从这么多个随机局面里抽，局面少于请求数时会命中缓存、合并搜索
+LOAD_MAX_OPENING_MOVES = 12 # 随机局面最多几手
+LOAD_TIME_BUDGET = 0.05 # 每个请求的思考时间(秒)
+LOAD_DEADLINE = 5.0 # 每个请求的deadline(秒)
+LOAD_PERCENTILES = (50, 90, 99)
+LOAD_SERVER_START_TIMEOUT = 30.0 # --spawn-server时最多等多久服务开始监听
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'FiveChessServer.py')
+
+def random_positions(rnd, count, board_size=BOARD_LINE_NUMS):
+    """
+    count个随机局面的着法序列，每个在天元附近随机摆1..LOAD_MAX_OPENING_MOVES手，没有连五
+    """
+    return [random_opening(rnd, rnd.randint(1, LOAD_MAX_OPENING_MOVES), board_size) for _ in range(count)]
+
+def percentile(sorted_values, p):
+    """
+    最近秩法的百分位数，sorted_values已经从小到大排好
+    """
+    if not sorted_values:
+        return math.nan
+    return sorted_values[min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))]
+
+async def run_connection(host, port, requests, latencies, outcomes):
+    """
+    一个连接：依次发requests里的请求，每个请求的延迟(秒)记进latencies，结果按ok/cached/coalesced/错误原因计数
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for request in requests:
+            start_time = time.perf_counter()
+            writer.write((json.dumps(request) + '\n').encode())
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("server closed the connection")
+            latencies.append(time.perf_counter() - start_time)
+            response = json.loads(line)
+            if 'error' in response:
+                outcomes['error: ' + response['error']] += 1
+            elif response['cached']:
+                outcomes['cached'] += 1
+            elif response['coalesced']:
+                outcomes['coalesced'] += 1
+            else:
+                outcomes['searched'] += 1
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+async def query_stats(host, port):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(b'{"op": "stats"}\n')
+        await writer.drain()
+        return json.loads(await reader.readline())
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+async def run_load(host, port, connections, requests, report=sys.stderr):
+    """
+    把requests轮流分给connections个连接并发发出，返回汇总：吞吐量、延迟百分位(毫秒)、各种结果的计数和服务端的计数
+    """
+    latencies = []
+    outcomes = collections.Counter()
+    start_time = time.perf_counter()
+    failures = await asyncio.gather(*(run_connection(host, port, requests[k::connections], latencies, outcomes) for k in range(connections)), return_exceptions=True)
+    for failure in failures:
+        if isinstance(failure, Exception): # 一个连接断了不影响其他连接，汇总里按原因计数
+            outcomes['connection failed: {}'.format(type(failure).__name__)] += 1
+    elapsed_time = time.perf_counter() - start_time
+    latencies.sort()
+    try:
+        server_stats = await query_stats(host, port)
+    except OSError: # 服务连不上时照样输出客户端这边的汇总
+        server_stats = None
+    summary = {
+        'requests': len(latencies),
+        'connections': connections,
+        'elapsed': round(elapsed_time, 3),
+        'throughput': round(len(latencies) / elapsed_time, 1),
+        # 没有请求或者所有连接都在第一个回复前失败时没有延迟可统计，和percentile一样给NaN
+        'latency_ms': dict({'p{}'.format(p): round(percentile(latencies, p) * 1000, 1) for p in LOAD_PERCENTILES},
+                           mean=round(sum(latencies) / len(latencies) * 1000, 1) if latencies else math.nan,
+                           max=round(latencies[-1] * 1000, 1) if latencies else math.nan),
+        'outcomes': dict(outcomes),
+        'server': server_stats,
+    }
+    report.write('{} requests over {} connections in {:.2f}s: {:.1f} requests/s\n'.format(len(latencies), connections, elapsed_time, summary['throughput']))
+    report.write('latency ms: {}\n'.format('  '.join('{} {}'.format(name, value) for name, value in summary['latency_ms'].items())))
+    report.write('outcomes: {}\n'.format('  '.join('{} {}'.format(name, count) for name, count in sorted(outcomes.items()))))
+    report.write('server: {}\n'.format(json.dumps(summary['server'], sort_keys=True)))
+    return summary
+
+def spawn_server(host, port, workers):
+    """
+    在子进程里启动FiveChessServer，等到端口能连上为止
+    """
+    process = subprocess.Popen([sys.executable, SERVER_SCRIPT, '--host', host, '--port', str(port), '--workers', str(workers)])
+    stop_time = time.perf_counter() + LOAD_SERVER_START_TIMEOUT
+    while True:
+        try:
+            socket.create_connection((host, port), timeout=1.0).close()
+            return process
+        except OSError:
+            if process.poll() is not None or time.perf_counter() > stop_time:
+                process.kill()
+                raise RuntimeError("server did not start listening on {}:{}".format(host, port))
+            time.sleep(0.1)
+
+# 程序入口
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='FiveChessServer的本机压测：多个连接并发请求随机局面，报告吞吐量和延迟百分位')
+    parser.add_argument('--host', default=SERVER_HOST, help='服务地址')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='服务端口')
+    parser.add_argument('--connections', type=int, default=LOAD_CONNECTIONS, help='并发连接数')
+    parser.add_argument('--requests', type=int, default=LOAD_REQUESTS, help='总请求数')
+    parser.add_argument('--positions', type=int, default=LOAD_POSITIONS, help='随机局面数，越少命中缓存和合并搜索越多')
+    parser.add_argument('--time-budget', type=float, default=LOAD_TIME_BUDGET, help='每个请求的思考时间(秒)')
+    parser.add_argument('--deadline', type=float, default=LOAD_DEADLINE, help='每个请求的deadline(秒)')
+    parser.add_argument('--seed', type=int, default=0, help='随机局面和请求顺序的种子')
+    parser.add_argument('--spawn-server', type=int, metavar='WORKERS', help='先在子进程里用WORKERS个搜索进程启动服务，压测完关掉')
+    parser.add_argument('--json', action='store_true', help='汇总以JSON输出到标准输出')
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    positions = random_positions(rnd, args.positions)
+    requests = [{'id': k, 'moves': [list(move) for move in rnd.choice(positions)], 'time_budget': args.time_budget, 'deadline': args.deadline}
+                for k in range(args.requests)]
+    server = spawn_server(args.host, args.port, args.spawn_server) if args.spawn_server else None
+    try:
+        summary = asyncio.run(run_load(args.host, args.port, args.connections, requests))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    if args.json:
+        print(json.dumps(summary))
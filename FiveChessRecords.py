@@ -0,0 +1,231 @@
+import os
+import re
+import sys
+import json
+import argparse
+from FiveChessEngine import BitBoard, get_board_geometry, BOARD_LINE_NUMS, MIN_BOARD_SIZE, MAX_BOARD_SIZE
+
+# ====对局记录格式==== #
+# 紧凑格式(.fcr)：每行一局"<线数> <结果> <着法>"，如"15 W h8i9i8j9"，#开头的行是注释
+# 着法用常见的五子棋坐标：列是字母(左起a)，行是数字(下起1)，第一手是白棋(本程序白棋先行)
+RECORD_COLUMNS = 'abcdefghijklmnopqrst' # 最多20路
+RECORD_WHITE_WINS = 'W'
+RECORD_BLACK_WINS = 'B'
+RECORD_DRAW = 'D' # 下满了
+RECORD_UNFINISHED = '?' # 没分出胜负就结束(认输、超时或者记录不全)
+RECORD_RESULTS = (RECORD_WHITE_WINS, RECORD_BLACK_WINS, RECORD_DRAW, RECORD_UNFINISHED)
+RECORD_FORMATS = ('fcr', 'renlib', 'psq', 'arena') # renlib：每行一局的坐标着法表；psq：Piskvork的对局文件，每个文件一局；arena：FiveChessArena的JSONL
+PSQ_FILE_SUFFIX = '.psq'
+_move_pattern = re.compile(r'([a-t])(\d{1,2})')
+_psq_header_pattern = re.compile(r'(\d+)x(\d+)')
+_psq_move_pattern = re.compile(r'^\s*(\d+)\s*,\s*(\d+)(\s*,\s*-?\d+)?\s*$')
+
+def format_move(move, board_size=BOARD_LINE_NUMS):
+    """
+    (i, j) -> 'h8'，i是从上往下的行，j是从左往右的列
+    """
+    return '{}{}'.format(RECORD_COLUMNS[move[1]], board_size - move[0])
+
+def parse_moves(text, board_size=BOARD_LINE_NUMS):
+    """
+    'h8 i9 j10'或'h8i9j10' -> [(i, j)]，大小写都可以，坐标超出棋盘时抛出ValueError
+    """
+    text = text.strip().lower()
+    moves = []
+    end = 0
+    for match in _move_pattern.finditer(text):
+        if text[end:match.start()].strip(' ,;'):
+            raise ValueError("bad move text: {!r}".format(text[end:match.start()]))
+        j = RECORD_COLUMNS.index(match.group(1))
+        i = board_size - int(match.group(2))
+        if not (0 <= i < board_size and j < board_size):
+            raise ValueError("move {} is off the {}x{} board".format(match.group(0), board_size, board_size))
+        moves.append((i, j))
+        end = match.end()
+    if text[end:].strip(' ,;'):
+        raise ValueError("bad move text: {!r}".format(text[end:]))
+    return moves
+
+def replay_result(board_size, moves):
+    """
+    按顺序摆一遍检查着法，返回结果RECORD_*：某一方连五即胜，下满为和，否则未完\n
+    着法出界、重复、分出胜负后还有着法时抛出ValueError；只用位棋盘，不建引擎
+    """
+    if not MIN_BOARD_SIZE <= board_size <= MAX_BOARD_SIZE:
+        raise ValueError("board_size must be between {} and {}".format(MIN_BOARD_SIZE, MAX_BOARD_SIZE))
+    bitboard = BitBoard(get_board_geometry(board_size))
+    occupied = set()
+    for ply, move in enumerate(moves):
+        if not (0 <= move[0] < board_size and 0 <= move[1] < board_size):
+            raise ValueError("move {} is off the board".format(move))
+        if move in occupied:
+            raise ValueError("move {} is played twice".format(format_move(move, board_size)))
+        color = 1 - (ply & 1) # 白棋先行：偶数手是白棋(1)，奇数手是黑棋(0)
+        bitboard.place(move, color)
+        occupied.add(move)
+        if bitboard.check_win(move, color):
+            if ply != len(moves) - 1:
+                raise ValueError("moves continue after five at ply {}".format(ply))
+            return RECORD_WHITE_WINS if color == 1 else RECORD_BLACK_WINS
+    return RECORD_DRAW if len(moves) == board_size * board_size else RECORD_UNFINISHED
+
+def format_record(board_size, moves, result):
+    return '{} {} {}'.format(board_size, result, ''.join(format_move(move, board_size) for move in moves))
+
+def parse_record(line):
+    """
+    紧凑格式的一行 -> (线数, 着法列表, 结果)
+    """
+    fields = line.split(None, 2)
+    if len(fields) < 2 or not fields[0].isdigit() or fields[1] not in RECORD_RESULTS:
+        raise ValueError("bad record line: {!r}".format(line.strip()))
+    board_size = int(fields[0])
+    return board_size, parse_moves(fields[2] if len(fields) > 2 else '', board_size), fields[1]
+
+def format_psq(board_size, moves):
+    """
+    Piskvork的对局文件：表头、每手一行"x,y,用时"(从1开始，x是列，y是从上往下的行)，最后一行-1
+    """
+    lines = ['Piskvorky {0}x{0}, 11:11, 0'.format(board_size)]
+    lines += ['{},{},0'.format(j + 1, i + 1) for i, j in moves]
+    lines.append('-1')
+    return '\n'.join(lines) + '\n'
+
+def parse_psq(text):
+    """
+    Piskvork的对局文件 -> (线数, 着法列表)，表头之后到第一行不是着法的行为止
+    """
+    lines = text.splitlines()
+    header = _psq_header_pattern.search(lines[0]) if lines else None
+    if header is None:
+        raise ValueError("missing psq header")
+    width, height = int(header.group(1)), int(header.group(2))
+    if width != height:
+        raise ValueError("only square boards are supported, got {}x{}".format(width, height))
+    moves = []
+    for line in lines[1:]:
+        match = _psq_move_pattern.match(line)
+        if match is None:
+            break
+        moves.append((int(match.group(2)) - 1, int(match.group(1)) - 1))
+    return width, moves
+
+def _iter_files(paths, suffix):
+    """
+    逐个返回文件路径，目录按文件名排序展开成其中以suffix结尾的文件
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith(suffix):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+def _iter_lines(paths):
+    for path in paths:
+        # 非UTF-8的字节换成替换字符，那一行解析失败后按格式不对跳过，不会中断整个导入
+        with (sys.stdin if path == '-' else open(path, errors='replace')) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+
+def _iter_raw_games(paths, record_format, board_size):
+    """
+    按格式逐局读出(线数, 着法列表, 记录里的结果或None)，解析失败的对局给出ValueError而不是记录
+    """
+    if record_format == 'psq':
+        for path in _iter_files(paths, PSQ_FILE_SUFFIX):
+            try:
+                with open(path) as f:
+                    yield parse_psq(f.read()) + (None,)
+            except (ValueError, OSError) as e: # UnicodeDecodeError是ValueError的子类；读不了的文件和格式不对的文件一样跳过
+                yield ValueError('{}: {}'.format(path, e))
+        return
+    for line in _iter_lines(paths):
+        try:
+            if record_format == 'fcr':
+                yield parse_record(line)
+            elif record_format == 'renlib':
+                yield board_size, parse_moves(line, board_size), None
+            else:
+                record = json.loads(line)
+                if record.get('board_size', BOARD_LINE_NUMS) is None:
+                    raise ValueError("unbounded board games have no compact notation")
+                yield record.get('board_size', BOARD_LINE_NUMS), [tuple(move) for move in record['opening'] + record['moves']], None
+        except (ValueError, KeyError, TypeError) as e:
+            yield ValueError('{!r}: {}'.format(line[:60], e))
+
+def iter_games(paths, record_format='fcr', board_size=BOARD_LINE_NUMS, errors=None):
+    """
+    惰性地逐局读对局记录，返回(线数, 着法列表, 结果RECORD_*)，一次只在内存里放一局\n
+    paths: 文件路径列表，-表示标准输入，psq格式可以给目录\n
+    record_format: RECORD_FORMATS之一；board_size: renlib格式的线数，其他格式自带线数\n
+    每局都重新摆一遍检查着法并算出结果，记录里的结果和摆出来的不一致时以摆出来的为准(未完的对局保留记录里的结果)\n
+    errors: 解析或检查失败的对局跳过，把ValueError传给errors，None表示直接抛出
+    """
+    if record_format not in RECORD_FORMATS:
+        raise ValueError("unknown record format: {}".format(record_format))
+    for number, game in enumerate(_iter_raw_games(paths, record_format, board_size)):
+        try:
+            if isinstance(game, ValueError):
+                raise game
+            size, moves, recorded = game
+            result = replay_result(size, moves)
+            if result == RECORD_UNFINISHED and recorded is not None:
+                result = recorded
+        except ValueError as e:
+            if errors is None:
+                raise
+            errors(ValueError('game {}: {}'.format(number, e)))
+            continue
+        yield size, moves, result
+
+def write_games(games, record_format, output):
+    """
+    把(线数, 着法列表, 结果)逐局写出：fcr/renlib写到output文件(-表示标准输出)，psq在output目录下每局一个文件\n
+    返回写出的对局数
+    """
+    count = 0
+    if record_format == 'psq':
+        os.makedirs(output, exist_ok=True)
+        for board_size, moves, _ in games:
+            with open(os.path.join(output, 'game{:07d}{}'.format(count, PSQ_FILE_SUFFIX)), 'w') as f:
+                f.write(format_psq(board_size, moves))
+            count += 1
+        return count
+    if record_format not in ('fcr', 'renlib'):
+        raise ValueError("cannot write records as {}".format(record_format))
+    f = sys.stdout if output == '-' else open(output, 'w')
+    try:
+        if record_format == 'fcr':
+            f.write('# <board size> <result W/B/D/?> <moves>\n')
+        for board_size, moves, result in games:
+            if record_format == 'fcr':
+                f.write(format_record(board_size, moves, result) + '\n')
+            else:
+                f.write(' '.join(format_move(move, board_size) for move in moves) + '\n')
+            count += 1
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return count
+
+# 程序入口
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='对局记录格式转换：紧凑格式、坐标着法表、Piskvork的psq和FiveChessArena的JSONL')
+    parser.add_argument('inputs', nargs='+', help='输入文件，-表示标准输入，psq格式可以给目录')
+    parser.add_argument('--from', dest='source', choices=RECORD_FORMATS, default='fcr', help='输入格式')
+    parser.add_argument('--to', dest='target', choices=('fcr', 'renlib', 'psq'), default='fcr', help='输出格式')
+    parser.add_argument('--output', default='-', help='输出文件，-表示标准输出；psq格式是输出目录')
+    parser.add_argument('--board-size', type=int, default=BOARD_LINE_NUMS, help='renlib格式输入的棋盘线数')
+    args = parser.parse_args()
+
+    skipped = [0]
+
+    def report_error(error):
+        skipped[0] += 1
+        sys.stderr.write('skipped: {}\n'.format(error))
+    count = write_games(iter_games(args.inputs, args.source, args.board_size, report_error), args.target, args.output)
+    sys.stderr.write('{} games written, {} skipped\n'.format(count, skipped[0]))
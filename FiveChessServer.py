@@ -0,0 +1,294 @@
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import collections
+import multiprocessing
+import concurrent.futures
+from FiveChessEngine import get_board_geometry, ZOBRIST_BLACK_TURN, BOARD_LINE_NUMS
+from FiveChessArena import create_engine, parse_config
+from FiveChessAnalysis import sync_engine
+from FiveChessRecords import replay_result, RECORD_UNFINISHED
+
+# ====分析服务配置==== #
+# 协议：TCP上每行一个JSON请求，每行一个JSON回复，回复带上请求里的id；同一连接上可以连发多个请求，回复按完成的先后返回
+# 请求：{"id": 任意, "moves": [[i, j], ...](白棋先行), "board_size": 15, "time_budget": 秒, "depth": 最大深度, "deadline": 秒}，除moves外都可以省略
+# 回复：{"id", "move": [i, j], "score", "depth", "nodes", "time", "cached": 是否来自缓存, "coalesced": 是否和别的请求合用一次搜索}
+#       出错时为{"id", "error": 原因}，原因为SERVER_ERROR_*或者请求格式的错误；{"op": "stats"}返回服务的计数
+SERVER_HOST = '127.0.0.1' # 只在本机监听
+SERVER_PORT = 8765
+SERVER_TIME_BUDGET = 0.5 # 请求没给time_budget时的思考时间(秒)
+SERVER_MAX_TIME_BUDGET = 30.0 # 单个请求最多能要多少思考时间
+SERVER_DEADLINE = 10.0 # 请求没给deadline时，从收到请求起多少秒内没有结果就回复超时
+SERVER_CACHE_ENTRIES = 10000 # 最近的搜索结果按局面哈希缓存，超过后淘汰最久没用到的
+SERVER_PENDING_PER_WORKER = 4 # 排队和正在进行的搜索最多是进程数的几倍，再多时新的搜索直接回复SERVER_ERROR_BUSY
+SERVER_CONNECTION_INFLIGHT = 32 # 每个连接最多同时处理几个请求，到了以后不再读这个连接，客户端的发送被TCP流控挡住
+SERVER_ERROR_BUSY = 'busy' # 排队的搜索满了，稍后重试
+SERVER_ERROR_DEADLINE = 'deadline' # deadline之前没有搜完；搜索不会因此中止，结果仍会进缓存
+SERVER_ERROR_GAME_OVER = 'game over' # 局面已经分出胜负或者下满了
+SERVER_ERROR_SHUTDOWN = 'shutting down'
+
+def position_hash(board_size, moves):
+    """
+    按moves走出的局面的zobrist哈希，同引擎里的zobrist_hash，轮到黑棋时再异或ZOBRIST_BLACK_TURN\n
+    着法顺序不同、局面相同时哈希相同，缓存和合并搜索都按局面而不是按着法序列
+    """
+    zobrist_table = get_board_geometry(board_size).zobrist_table
+    key = 0
+    for ply, (i, j) in enumerate(moves):
+        key ^= zobrist_table[i][j][1 - (ply & 1)] # 白棋先行：偶数手是白棋(1)，奇数手是黑棋(0)
+    if len(moves) & 1:
+        key ^= ZOBRIST_BLACK_TURN
+    return key
+
+def covers(time_budget, depth, request_time_budget, request_depth):
+    """
+    一次(time_budget, depth)的搜索能不能回答(request_time_budget, request_depth)的请求：思考时间不比请求的短，深度也不比请求的浅
+    """
+    return time_budget >= request_time_budget and (depth is None or request_depth is not None and depth >= request_depth)
+
+_server_config = None
+_server_engines = {} # 搜索进程里每种线数一个引擎，进程存活期间复用，置换表保持热的
+
+def _init_server_worker(config):
+    global _server_config
+    _server_config = config
+
+def search_position(task):
+    """
+    搜索进程执行的任务：摆好局面，在time_budget和expires(time.time()的绝对时间)之内搜索轮到的一方的最佳着法\n
+    排队到开始时已经过了expires的不再搜索，返回None；否则返回{'move', 'score', 'depth', 'nodes', 'time'}
+    """
+    board_size, moves, time_budget, depth, expires = task
+    time_left = expires - time.time()
+    if time_left <= 0:
+        return None
+    engine = _server_engines.get(board_size)
+    if engine is None:
+        engine = _server_engines[board_size] = create_engine(dict(_server_config, board_size=board_size))
+    sync_engine(engine, moves)
+    # 空棋盘直接下天元，不会搜索
+    engine.nodes, engine.search_depth_reached, engine.search_score = 0, -1, None
+    start_time = time.perf_counter()
+    move = engine.best_move(min(time_budget, time_left), depth)
+    return {
+        'move': list(move),
+        'score': engine.search_score,
+        'depth': engine.search_depth_reached,
+        'nodes': engine.nodes,
+        'time': round(time.perf_counter() - start_time, 4),
+    }
+
+class AnalysisServer():
+    """
+    本机的asyncio分析服务：请求分给搜索进程池，同一局面的并发请求合用一次搜索，最近的结果按局面哈希放在LRU缓存里\n
+    反压：每个连接最多同时处理connection_inflight个请求，全局排队的搜索最多max_pending个，超过的回复SERVER_ERROR_BUSY\n
+    每个请求有自己的deadline，到时回复SERVER_ERROR_DEADLINE；开始前所有等它的请求都已过期的搜索直接跳过
+    """
+    def __init__(self, config=None, workers=1, cache_entries=SERVER_CACHE_ENTRIES, max_pending=None, connection_inflight=SERVER_CONNECTION_INFLIGHT):
+        self.config = dict(config or {}) # 引擎配置，同FiveChessArena的create_engine，time_budget和depth由每个请求给
+        self.workers = workers
+        self.cache_entries = cache_entries
+        self.max_pending = workers * SERVER_PENDING_PER_WORKER if max_pending is None else max_pending
+        self.connection_inflight = connection_inflight
+        self.executor = None
+        self.server = None
+        # 缓存：{(线数, 局面哈希): (思考时间, 深度, 结果)}，按最近使用的顺序排列
+        self.cache = collections.OrderedDict()
+        # 正在排队或进行的搜索：{(线数, 局面哈希): (future, 思考时间, 深度)}
+        self.searches = {}
+        self.pending = 0
+        self.connections = {} # 打开的连接：{reader: 处理这个连接的任务}
+        self.closing = False
+        self.counters = collections.Counter() # requests, cache_hits, coalesced, searches, busy, expired, errors
+
+    async def start(self, host=SERVER_HOST, port=SERVER_PORT):
+        self.executor = concurrent.futures.ProcessPoolExecutor(self.workers, initializer=_init_server_worker, initargs=(self.config,))
+        self.server = await asyncio.start_server(self.handle_connection, host, port)
+        return self.server
+
+    async def close(self):
+        """
+        停止监听和读新的请求，取消排队的搜索(回复SERVER_ERROR_SHUTDOWN)，正在进行的搜索做完、回复写出后再断开连接
+        """
+        self.closing = True
+        if self.server is not None:
+            self.server.close()
+        for reader in self.connections:
+            reader.feed_eof()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.connections:
+            await asyncio.gather(*self.connections.values(), return_exceptions=True)
+        if self.server is not None:
+            await self.server.wait_closed()
+
+    def stats(self):
+        return dict(self.counters, cache_entries=len(self.cache), pending=self.pending, workers=self.workers)
+
+    async def handle_connection(self, reader, writer):
+        """
+        逐行读请求，每个请求一个任务，回复写完才释放名额；连接断开后等已收到的请求都回复完再关闭
+        """
+        inflight = asyncio.Semaphore(self.connection_inflight)
+        tasks = set()
+        self.connections[reader] = asyncio.current_task()
+        try:
+            while True:
+                await inflight.acquire()
+                line = await reader.readline()
+                if not line:
+                    inflight.release()
+                    break
+                task = asyncio.create_task(self.serve_line(line, writer, inflight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except (ConnectionError, ValueError):
+            pass # 客户端断开，或者一行超过了StreamReader的长度上限
+        finally:
+            del self.connections[reader]
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def serve_line(self, line, writer, inflight):
+        request_id = None
+        try:
+            try:
+                request = json.loads(line)
+                request_id = request.get('id')
+                response = await self.handle_request(request)
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                self.counters['errors'] += 1
+                response = {'error': 'bad request: {}'.format(e)}
+            response['id'] = request_id
+            writer.write((json.dumps(response) + '\n').encode())
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            inflight.release()
+
+    async def handle_request(self, request):
+        """
+        一个请求：先查缓存，再看有没有能合用的搜索，都没有时提交新的搜索，等到结果或者deadline
+        """
+        if request.get('op', 'search') == 'stats':
+            return self.stats()
+        if request.get('op', 'search') != 'search':
+            raise ValueError("unknown op: {}".format(request['op']))
+        loop = asyncio.get_running_loop()
+        self.counters['requests'] += 1
+        board_size = request.get('board_size', BOARD_LINE_NUMS)
+        moves = [(int(i), int(j)) for i, j in request['moves']]
+        time_budget = float(request.get('time_budget', SERVER_TIME_BUDGET))
+        depth = request.get('depth')
+        deadline = float(request.get('deadline', SERVER_DEADLINE))
+        if not 0 < time_budget <= SERVER_MAX_TIME_BUDGET:
+            raise ValueError("time_budget must be in (0, {}]".format(SERVER_MAX_TIME_BUDGET))
+        if depth is not None and (not isinstance(depth, int) or depth < 1):
+            raise ValueError("depth must be a positive integer")
+        if replay_result(board_size, moves) != RECORD_UNFINISHED:
+            return {'error': SERVER_ERROR_GAME_OVER}
+        key = (board_size, position_hash(board_size, moves))
+        cached = self.cache.get(key)
+        if cached is not None and covers(cached[0], cached[1], time_budget, depth):
+            self.cache.move_to_end(key)
+            self.counters['cache_hits'] += 1
+            return dict(cached[2], cached=True, coalesced=False)
+        expires = loop.time() + deadline
+        coalesced = False
+        while True:
+            search = self.searches.get(key)
+            if search is not None and covers(search[1], search[2], time_budget, depth):
+                coalesced = True
+                self.counters['coalesced'] += 1
+            else:
+                if self.closing:
+                    return {'error': SERVER_ERROR_SHUTDOWN}
+                if self.pending >= self.max_pending:
+                    self.counters['busy'] += 1
+                    return {'error': SERVER_ERROR_BUSY}
+                future = loop.run_in_executor(self.executor, search_position, (board_size, moves, time_budget, depth, time.time() + (expires - loop.time())))
+                search = self.searches[key] = (future, time_budget, depth)
+                self.pending += 1
+                self.counters['searches'] += 1
+                future.add_done_callback(lambda future, search=search: self.finish_search(key, search))
+            try:
+                # shield：这个请求超时不取消搜索，合用它的请求和缓存还要用
+                result = await asyncio.wait_for(asyncio.shield(search[0]), max(0.0, expires - loop.time()))
+            except asyncio.TimeoutError:
+                result = None
+            except asyncio.CancelledError:
+                if not search[0].cancelled():
+                    raise
+                return {'error': SERVER_ERROR_SHUTDOWN} # 服务关闭时排队的搜索被取消
+            except Exception as e: # 进程池坏了或者搜索出错，只有这个请求失败，服务继续
+                self.counters['errors'] += 1
+                return {'error': 'search failed: {}'.format(e)}
+            if result is not None:
+                return dict(result, cached=False, coalesced=coalesced)
+            if loop.time() >= expires:
+                self.counters['expired'] += 1
+                return {'error': SERVER_ERROR_DEADLINE}
+            # 合用的搜索因为提交它的请求过期被跳过了，这个请求还有时间，重新提交
+
+    def finish_search(self, key, search):
+        """
+        搜索结束(完成、出错或跳过)：从正在进行的搜索里去掉，有结果时放进缓存，缓存满了淘汰最久没用到的
+        """
+        future, time_budget, depth = search
+        self.pending -= 1
+        if self.searches.get(key) is search:
+            del self.searches[key]
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+        cached = self.cache.get(key)
+        if cached is None or covers(time_budget, depth, cached[0], cached[1]):
+            self.cache[key] = (time_budget, depth, future.result())
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_entries:
+            self.cache.popitem(last=False)
+
+async def serve(host, port, config, workers, cache_entries, max_pending, report=sys.stderr):
+    """
+    启动服务直到收到SIGINT或SIGTERM，退出前关掉监听和进程池，搜索进程不会留下来
+    """
+    server = AnalysisServer(config, workers, cache_entries, max_pending)
+    await server.start(host, port)
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop_event.set)
+        except NotImplementedError:
+            pass # Windows上没有，只能Ctrl+C
+    report.write('listening on {}:{} with {} workers\n'.format(host, port, workers))
+    report.flush()
+    try:
+        await stop_event.wait()
+    finally:
+        await server.close()
+        report.write('server stats: {}\n'.format(json.dumps(server.stats(), sort_keys=True)))
+
+# 程序入口
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='本机的五子棋分析服务：TCP上每行一个JSON请求，进程池搜索，同一局面的请求合并，结果LRU缓存')
+    parser.add_argument('--host', default=SERVER_HOST, help='监听地址')
+    parser.add_argument('--port', type=int, default=SERVER_PORT, help='监听端口')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help='搜索进程数')
+    parser.add_argument('--config', type=parse_config, default={}, help='引擎配置，格式同FiveChessArena的--config-a')
+    parser.add_argument('--cache-entries', type=int, default=SERVER_CACHE_ENTRIES, help='结果缓存的条目数')
+    parser.add_argument('--max-pending', type=int, help='最多排队几个搜索，默认进程数的{}倍'.format(SERVER_PENDING_PER_WORKER))
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.config, args.workers, args.cache_entries, args.max_pending))
+    except KeyboardInterrupt:
+        pass